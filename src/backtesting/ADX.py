@@ -12,41 +12,44 @@ class ADX(VectorizedBacktester):
         end: string,
         tc: float,
         granularity="1d",
-        window=14  
+        window=14,
+        **kwargs,
     ):
         self.window = window
-        super().__init__(symbol, start, end, tc, granularity=granularity)
+        super().__init__(symbol, start, end, tc, granularity=granularity, **kwargs)
 
     def test_strategy(self):
-        data = self._data.copy().dropna()
+        if self.compact:
+            return self.test_compact()
+        data = self._data.dropna()
 
-        data["log_returns"] = np.log(data.price / data.price.shift(1))
+        features = self.features(data)
 
-        data["high"] = data.price.rolling(self.window).max()
+        data["log_returns"] = features.get("returns")
 
-        data["low"] = data.price.rolling(self.window).min()
+        data["high"] = features.get("rolling_max", window=self.window)
 
-        data["pdm"] = data.high - data.high.shift(1)
+        data["low"] = features.get("rolling_min", window=self.window)
 
-        data["ndm"] = data.low.shift(1) - data.low
+        data["pdm"] = features.get("pdm", window=self.window)
 
-        data["tr"] = np.maximum(data.high - data.low, np.abs(data.high - data.price.shift(1)))
+        data["ndm"] = features.get("ndm", window=self.window)
 
-        data["tr"] = np.maximum(data.tr, np.abs(data.low - data.price.shift(1)))
+        data["tr"] = features.get("true_range", window=self.window)
 
-        data["s_tr"] = data.tr.rolling(self.window).mean()
+        data["s_tr"] = features.get("s_tr", window=self.window)
 
-        data["s_pdm"] = data.pdm.rolling(self.window).mean()
+        data["s_pdm"] = features.get("s_pdm", window=self.window)
 
-        data["s_ndm"] = data.ndm.rolling(self.window).mean()
+        data["s_ndm"] = features.get("s_ndm", window=self.window)
 
-        data["pdi"] = (data["s_pdm"] / data["s_tr"]) * 100
+        data["pdi"] = features.get("pdi", window=self.window)
 
-        data["ndi"] = (data["s_ndm"] / data["s_tr"]) * 100
+        data["ndi"] = features.get("ndi", window=self.window)
 
-        data["dx"] = np.abs((data.pdi - data.ndi) / (data.pdi + data.ndi))
+        data["dx"] = features.get("dx", window=self.window)
 
-        data["adx"] = data.dx.rolling(self.window).mean()
+        data["adx"] = features.get("adx", window=self.window)
 
         data["position"] = np.where((data.adx > 25) & (data.pdi > data.ndi), 1, np.nan)
         data["position"] = np.where((data.adx > 25) & (data.pdi < data.ndi), -1, data.position)
@@ -70,4 +73,17 @@ class ADX(VectorizedBacktester):
         perf = data["cstrategy"].iloc[-1]  # absolute performance of the strategy
         outperf = perf - data["creturns"].iloc[-1]  # out-/underperformance of strategy
 
-        return round(perf, 6), round(outperf, 6)
\ No newline at end of file
+        return round(perf, 6), round(outperf, 6)
+
+    def _grid_positions(self, data, params):
+        features = self.features(data)
+        windows, column = np.unique(params["window"], return_inverse=True)
+        adx, pdi, ndi = (
+            np.column_stack([features.get(name, window=w) for w in windows])[:, column] for name in ("adx", "pdi", "ndi")
+        )
+
+        position = np.where((adx > 25) & (pdi > ndi), 1.0, np.nan)
+        position = np.where((adx > 25) & (pdi < ndi), -1.0, position)
+
+        # test_strategy drops the bars without ADX, the indicator with the longest warm-up
+        return position, ~np.isnan(adx)
@@ -14,24 +14,30 @@ class Bollinger(VectorizedBacktester):
         dev:int = 1,
         granularity="1d",
         source_file=None,
-        trading_hour_range=(0, 23)
+        trading_hour_range=(0, 23),
+        **kwargs,
     ):
         self.window = window
         self.dev = dev
         self.trading_hour_range=trading_hour_range
-        super().__init__(symbol, start, end, tc, granularity=granularity, source_file=source_file)
+        super().__init__(symbol, start, end, tc, granularity=granularity, source_file=source_file, **kwargs)
 
     def test_strategy(self):
+        if self.compact:
+            return self.test_compact()
 
         (ts, te) = self.trading_hour_range
 
-        data = self._data.copy().dropna()
+        data = self._data.dropna()
 
-        data["log_returns"] = np.log(data.price / data.price.shift())
+        features = self.features(data)
 
-        data["sma"] = data.price.rolling(self.window).mean()
-        data["upper"] = data.sma + self.dev * data.price.rolling(self.window).std()
-        data["lower"] = data.sma - self.dev * data.price.rolling(self.window).std()
+        data["log_returns"] = features.get("returns")
+
+        data["sma"] = features.get("sma", window=self.window)
+        std = features.get("std", window=self.window)
+        data["upper"] = data.sma + self.dev * std
+        data["lower"] = data.sma - self.dev * std
 
         data["distance"] = data.price - data.sma
 
@@ -62,4 +68,23 @@ class Bollinger(VectorizedBacktester):
         perf = data["cstrategy"].iloc[-1]  # absolute performance of the strategy
         outperf = perf - data["creturns"].iloc[-1]  # out-/underperformance of strategy
 
-        return round(perf, 6), round(outperf, 6)
\ No newline at end of file
+        return round(perf, 6), round(outperf, 6)
+
+    def _grid_positions(self, data, params):
+        # work with the distance to the SMA in standard deviations, so that the bands for all
+        # devs of a window are a comparison against the same column
+        features = self.features(data)
+        windows, column = np.unique(params["window"], return_inverse=True)
+        distance = np.column_stack([data.price - features.get("sma", window=w) for w in windows])
+        std = np.column_stack([features.get("std", window=w) for w in windows])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            zscore = (distance / std)[:, column]
+
+        crossed = np.zeros(distance.shape, dtype=bool)
+        crossed[1:] = distance[1:] * distance[:-1] < 0
+
+        position = np.where(zscore > params["dev"], -1.0, np.nan)
+        position[zscore < -params["dev"]] = 1.0
+        position[crossed[:, column]] = 0.0
+
+        return position, ~np.isnan(std)[:, column]
@@ -20,7 +20,8 @@ class CustomMACD(VectorizedBacktester.VectorizedBacktester):
         short_thresh=30,
         granularity="1d",
         source_file=None,
-        trading_hour_range=(0, 23)
+        trading_hour_range=(0, 23),
+        **kwargs,
     ):
         self.ema_s = ema_s
         self.ema_l = ema_l
@@ -30,38 +31,43 @@ class CustomMACD(VectorizedBacktester.VectorizedBacktester):
         self.buy_thresh = buy_thresh
         self.short_thresh = short_thresh
         self.trading_hour_range=trading_hour_range
-        super().__init__(symbol, start, end, tc, granularity=granularity, source_file=source_file)
+        super().__init__(symbol, start, end, tc, granularity=granularity, source_file=source_file, **kwargs)
 
     def test_strategy(self):
+        if self.compact:
+            return self.test_compact()
 
         (ts, te) = self.trading_hour_range
 
-        data = self._data.copy().dropna()
+        data = self._data.dropna()
+
+        features = self.features(data)
+        macd = {"ema_s": self.ema_s, "ema_l": self.ema_l}
 
         # MACD CALCULATIONS
 
-        data["log_returns"] = np.log(data.price / data.price.shift(1))
+        data["log_returns"] = features.get("returns")
 
-        data["EMA_S"] = data.price.ewm(span=self.ema_s, adjust=False).mean()
-        data["EMA_L"] = data.price.ewm(span=self.ema_l, adjust=False).mean()
+        data["EMA_S"] = features.get("ema", span=self.ema_s)
+        data["EMA_L"] = features.get("ema", span=self.ema_l)
 
-        data["MACD"] = data.EMA_S - data.EMA_L
-        data["signal"] = data.MACD.ewm(span=self.signal_smooth, adjust=False).mean()
-        data["MACD_VOL"] = data.MACD - data.signal
+        data["MACD"] = features.get("macd", **macd)
+        data["signal"] = features.get("macd_signal", signal_smooth=self.signal_smooth, **macd)
+        data["MACD_VOL"] = features.get("macd_hist", signal_smooth=self.signal_smooth, **macd)
 
         # RSI CALCULATIONS
 
-        data["change"] = data.price.diff()
-        data["gain"] = data.change.mask(data.change < 0, 0.0)
-        data["loss"] = -data.change.mask(data.change > 0, -0.0)
+        data["change"] = features.get("change")
+        data["gain"] = features.get("gain")
+        data["loss"] = features.get("loss")
 
-        data["avg_gain"] = data.gain.rolling(self.RSI_window).mean()
-        data["avg_loss"] = data.loss.rolling(self.RSI_window).mean()
+        data["avg_gain"] = features.get("avg_gain", window=self.RSI_window)
+        data["avg_loss"] = features.get("avg_loss", window=self.RSI_window)
 
-        data["rsi"] = 100 - (100 / (1 + (data.avg_gain / data.avg_loss)))
+        data["rsi"] = features.get("rsi", window=self.RSI_window)
 
         # SMA CALCULATION
-        data["SMA_XL"] = data.price.rolling(self.sma_xl).mean()
+        data["SMA_XL"] = features.get("sma", window=self.sma_xl)
 
 
         # SET POSITION 
@@ -97,3 +103,28 @@ class CustomMACD(VectorizedBacktester.VectorizedBacktester):
         outperf = perf - data["creturns"].iloc[-1]  # out-/underperformance of strategy
 
         return round(perf, 6), round(outperf, 6)
+
+    def _grid_positions(self, data, params):
+        # each distinct (ema_s, ema_l, signal_smooth) and RSI window is only computed once
+        macd_params, macd_column = np.unique(
+            np.column_stack([params["ema_s"], params["ema_l"], params["signal_smooth"]]), axis=0, return_inverse=True
+        )
+        features = self.features(data)
+        macd_vol = np.column_stack(
+            [
+                features.get("macd_hist", ema_s=ema_s, ema_l=ema_l, signal_smooth=signal_smooth)
+                for ema_s, ema_l, signal_smooth in macd_params
+            ]
+        )[:, macd_column.ravel()]
+
+        windows, rsi_column = np.unique(params["RSI_window"], return_inverse=True)
+        rsi = np.column_stack([features.get("rsi", window=w) for w in windows])[:, rsi_column]
+
+        position = np.where((macd_vol > 0) & (rsi > params["buy_thresh"]), 1.0, np.nan)
+        position = np.where((macd_vol < 0) & (rsi < params["short_thresh"]), -1.0, position)
+
+        # test_strategy drops the bars where the RSI or SMA_XL are not available
+        bar = np.arange(len(data))[:, None]
+        valid = ~np.isnan(rsi) & (bar >= params["sma_xl"] - 1)
+
+        return position, valid
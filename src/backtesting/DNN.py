@@ -1,10 +1,13 @@
 import string
-import keras
 import pickle
 import numpy as np
 from util import Calculations as calc
+from util.NumpyModel import NumpyModel
+from util.FeatureMatrix import FeatureMatrix
 from backtesting.VectorizedBacktester import VectorizedBacktester
 
+FEATURES = ["returns", "dir", "sma", "mean_reversion", "min", "max", "mom", "vol", "macd", "rsi"]
+
 class DNN(VectorizedBacktester):
     def __init__(
         self,
@@ -17,58 +20,60 @@ class DNN(VectorizedBacktester):
         model: string = None,
         pkl: string = None,
         lags=5,
+        batch_size=4096,
+        **kwargs,
     ):
+        """model is a saved keras model, or a .npz written by NumpyModel.save (which needs no
+        TensorFlow). The bars are scored in batches of batch_size. If pkl holds the lags and
+        features the model was trained on (as written by training/pipeline.py), they replace
+        lags and the default FEATURES."""
         self.model = model
         self.pkl = pkl
         self.lags = lags
+        self.feature_names = FEATURES
+        self.batch_size = batch_size
         self.load_model(model, pkl)
-        super().__init__(symbol, start, end, tc, granularity=granularity, source_file=source_file)
+        super().__init__(symbol, start, end, tc, granularity=granularity, source_file=source_file, **kwargs)
 
     def load_model(self, model_path: string, pkl_path: string):
-        self.model = keras.models.load_model(model_path)
+        if model_path.endswith(".npz"):
+            self.model = NumpyModel.load(model_path)
+        else:
+            import keras
+
+            self.model = keras.models.load_model(model_path)
         params = pickle.load(open(pkl_path, "rb"))
         self.mean = params["mean"]
         self.std = params["std"]
-        
+        self.lags = params.get("lags", self.lags)
+        self.feature_names = list(params.get("features", self.feature_names))
+        unknown = [name for name in self.feature_names if name not in FEATURES]
+        if unknown:
+            raise ValueError("The backtest cannot build the features {} (available: {}).".format(unknown, FEATURES))
+
     def test_strategy(self):
-        df = self._data.copy().dropna()
+        df = self._data.dropna()
 
-        df["returns"] = calc.returns(df.price)
+        # the features of util.Calculations with their default windows, from the memoized pipeline
+        features = self.features(df)
+        df["returns"] = features.get("returns")
         df["dir"] = calc.dir(df.returns)
-        df["sma"] = calc.sma_crossover(df.price)
-        df["mean_reversion"] = calc.mean_reversion(df.price)
-        df["min"] = calc.min(df.price)
-        df["max"] = calc.min(df.price)
-        df["mom"] = calc.momentum(df.returns)
-        df["vol"] = calc.volume(df.returns)
-        df["macd"] = calc.macd(df.price)
-        df["rsi"] = calc.rsi(df.price)
+        df["sma"] = features.get("sma", window=50) - features.get("sma", window=200)
+        df["mean_reversion"] = features.get("zscore", window=50)
+        df["min"] = features.get("rolling_min", window=50) / df.price - 1
+        df["max"] = df["min"]  # calc.min, as in training
+        df["mom"] = features.get("sma", of="returns", window=3)
+        df["vol"] = features.get("std", of="returns", window=50)
+        df["macd"] = features.get("macd_hist", ema_s=12, ema_l=26, signal_smooth=9)
+        df["rsi"] = features.get("rsi", window=14)
         df.dropna(inplace=True)
 
-        cols = []
-        features = [
-            "returns",
-            "dir",
-            "sma",
-            "mean_reversion",
-            "min",
-            "max",
-            "mom",
-            "vol",
-            "macd",
-            "rsi"
-        ]
-
-        for f in features:
-            for lag in range(1, self.lags + 1):
-                col = "{}_lag_{}".format(f, lag)
-                df[col] = df[f].shift(lag)
-                cols.append(col)
-        df.dropna(inplace=True)
-
-        df_s = (df - self.mean) / self.std
-
-        df["prob"] = self.model.predict(df_s[cols])
+        # lags 1 to lags of every feature as a strided view, scored batch by batch
+        matrix = FeatureMatrix(df[self.feature_names].to_numpy(), self.lags, self.feature_names)
+        cols = matrix.columns
+        prob = matrix.predict(self.model, self.mean[cols], self.std[cols], self.batch_size)
+        df = df.iloc[self.lags :].copy()
+        df["prob"] = prob
 
         df["s_prob"] = df.prob.rolling(50).mean()
 
@@ -0,0 +1,111 @@
+import numpy as np
+
+_compiled = None  # numba version of _run_signals, False if numba is not installed
+
+
+def _run_signals(price, spread, signals, units, amount, initial_balance):
+    """Event loop of IterativeBacktester without pandas or printing.
+
+    Mirrors go_long / go_short (and going neutral by closing the open units) followed by
+    close_pos on the last bar. Prices are already rounded and spread is 0 when not used.
+
+    Returns the final balance, the number of trades, the trade log (bar, units, price) and the
+    net asset value after every bar.
+    """
+    n = len(price)
+    balance = initial_balance
+    held = 0
+    position = 0
+    trades = 0
+    log_bar = np.empty(2 * n + 1, dtype=np.int64)
+    log_units = np.empty(2 * n + 1, dtype=np.int64)
+    log_price = np.empty(2 * n + 1, dtype=np.float64)
+    nav = np.empty(n, dtype=np.float64)
+
+    for bar in range(n - 1):
+        signal = signals[bar]
+        ask = price[bar] + spread[bar] / 2
+        bid = price[bar] - spread[bar] / 2
+        if signal == 1 and position != 1:
+            if held < 0:  # if short position, go neutral first
+                balance -= -held * ask
+                log_bar[trades], log_units[trades], log_price[trades] = bar, -held, ask
+                trades += 1
+                held = 0
+            buy = units if units > 0 else int((amount if amount > 0 else balance) / ask)
+            balance -= buy * ask
+            held += buy
+            log_bar[trades], log_units[trades], log_price[trades] = bar, buy, ask
+            trades += 1
+            position = 1
+        elif signal == -1 and position != -1:
+            if held > 0:  # if long position, go neutral first
+                balance += held * bid
+                log_bar[trades], log_units[trades], log_price[trades] = bar, -held, bid
+                trades += 1
+                held = 0
+            sell = units if units > 0 else int((amount if amount > 0 else balance) / bid)
+            balance += sell * bid
+            held -= sell
+            log_bar[trades], log_units[trades], log_price[trades] = bar, -sell, bid
+            trades += 1
+            position = -1
+        elif signal == 0 and position != 0:
+            if held > 0:
+                balance += held * bid
+                log_bar[trades], log_units[trades], log_price[trades] = bar, -held, bid
+                trades += 1
+            elif held < 0:
+                balance -= -held * ask
+                log_bar[trades], log_units[trades], log_price[trades] = bar, -held, ask
+                trades += 1
+            held = 0
+            position = 0
+        nav[bar] = balance + held * price[bar]
+
+    # close the final position (close_pos)
+    bar = n - 1
+    balance += held * price[bar] - abs(held) * spread[bar] / 2
+    log_bar[trades], log_units[trades], log_price[trades] = bar, -held, price[bar]
+    trades += 1
+    nav[bar] = balance
+    return balance, trades, log_bar[:trades], log_units[:trades], log_price[:trades], nav
+
+
+def _compiled_kernel():
+    """Compiles the kernel with numba on first use (numba is optional and slow to import)."""
+    global _compiled
+    if _compiled is None:
+        try:
+            from numba import njit
+        except ImportError:
+            _compiled = False
+        else:
+            _compiled = njit(cache=True)(_run_signals)
+    return _compiled
+
+
+def run_signals(price, spread, signals, units=0, amount=0.0, initial_balance=0.0):
+    """Runs the order logic for an array of target positions (1 long, -1 short, 0 neutral,
+    anything else keeps the current position).
+
+    Parameters
+    ----------
+    price, spread: np.ndarray
+        rounded prices and spreads per bar (spread of zeros when not trading at bid/ask)
+    signals: np.ndarray
+        target position per bar
+    units: int
+        units per trade, 0 to size trades by amount
+    amount: float
+        amount per trade, 0 to use the whole current balance ("all")
+    initial_balance: float
+        starting cash balance
+    """
+    price = np.ascontiguousarray(price, dtype=np.float64)
+    spread = np.ascontiguousarray(spread, dtype=np.float64)
+    signals = np.ascontiguousarray(np.nan_to_num(signals, nan=2.0), dtype=np.float64)
+    kernel = _compiled_kernel()
+    if kernel:
+        return kernel(price, spread, signals, int(units), float(amount), float(initial_balance))
+    return _run_signals(price.tolist(), spread.tolist(), signals.tolist(), int(units), float(amount), float(initial_balance))
@@ -1,14 +1,14 @@
 import string
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 
 from util import Instrument
+from backtesting.ExecutionKernel import run_signals
+from util.EventLog import EventLog, TradeEvent, MessageEvent
+from util.Plotting import pyplot
 
 Instrument = Instrument.Instrument
 
-plt.style.use("seaborn-v0_8")
-
 
 class IterativeBacktester:
     """Base class for iterative (event-driven) backtesting of trading strategies."""
@@ -21,6 +21,8 @@ class IterativeBacktester:
         amount: int,
         use_spread=False,
         source_file=None,
+        granularity="1d",
+        event_log: EventLog = None,
     ):
         """
         Parameters
@@ -37,6 +39,10 @@ class IterativeBacktester:
             whether trading costs (bid-ask spread) are included
         source_file: string (default = None)
             source file to read from. necessary for use_spread to be enabled.
+        granularity: str (default = "1d")
+            bar length
+        event_log: EventLog (default = None)
+            where trades and results are logged (defaults to the shared EventLog)
         """
         self.symbol = symbol
         self.start = start
@@ -50,11 +56,13 @@ class IterativeBacktester:
             use_spread and source_file is not None
         )  # Can't use_spread if no source file bc yf no spread
         self.data = None
-        self._instrument = Instrument(symbol, start, end, source_file)
+        self.trade_log = None
+        self.events = EventLog.default() if event_log is None else event_log
+        self._instrument = Instrument(symbol, start, end, source_file, granularity=granularity)
         self.get_data()
 
     @classmethod
-    def from_instrument(cls, instrument: Instrument, amount, use_spread=True):
+    def from_instrument(cls, instrument: Instrument, amount, use_spread=True, event_log: EventLog = None):
         return cls(
             instrument.get_ticker(),
             instrument.get_start(),
@@ -62,6 +70,8 @@ class IterativeBacktester:
             amount,
             use_spread,
             source_file=instrument.source_file,
+            granularity=instrument.granularity,
+            event_log=event_log,
         )
 
     def get_data(self):
@@ -69,24 +79,28 @@ class IterativeBacktester:
         raw = self._instrument.get_data()
         raw["returns"] = np.log(raw.price / raw.price.shift(1))
         self.data = raw
+        # plain arrays for get_values and run_signals, avoiding pandas scalar access per bar
+        self._prices = raw.price.to_numpy().round(5)
+        self._spreads = raw.spread.to_numpy().round(5) if self.use_spread else np.zeros(len(raw))
 
     def plot_data(self, cols=None):
         """Plots the closing price for the symbol."""
         if cols is None:
             cols = "price"
+        pyplot()
         self.data[cols].plot(figsize=(12, 8), title=self.symbol)
 
     def get_values(self, bar):
         """Returns the date, the price and the spread for the given bar."""
         date = str(self.data.index[bar].date())
-        price = round(self.data.price.iloc[bar], 5)
-        spread = None if not self.use_spread else round(self.data.spread.iloc[bar], 5)
+        price = self._prices[bar]
+        spread = None if not self.use_spread else self._spreads[bar]
         return date, price, spread
 
     def print_current_balance(self, bar):
         """Prints out the current (cash) balance."""
         date, price, spread = self.get_values(bar)
-        print("{} | Current Balance: {}".format(date, round(self.current_balance, 2)))
+        self.events.log(MessageEvent(date, "Current Balance: {}".format(round(self.current_balance, 2))))
 
     def buy_instrument(self, bar, units=None, amount=None):
         """Places and executes a buy order (market order)."""
@@ -100,7 +114,7 @@ class IterativeBacktester:
         self.current_balance -= units * price  # reduce cash balance by "purchase price"
         self.units += units
         self.trades += 1
-        print("{} |  Buying {} for {}".format(date, units, round(price, 5)))
+        self.events.log(TradeEvent(date, self.symbol, "Buying", units, round(price, 5)))
 
     def sell_instrument(self, bar, units=None, amount=None):
         """Places and executes a sell order (market order)."""
@@ -116,7 +130,7 @@ class IterativeBacktester:
         )  # increases cash balance by "purchase price"
         self.units -= units
         self.trades += 1
-        print("{} |  Selling {} for {}".format(date, units, round(price, 5)))
+        self.events.log(TradeEvent(date, self.symbol, "Selling", units, round(price, 5)))
 
     def go_long(self, bar, units=None, amount=None):
         if self.position == -1:
@@ -146,37 +160,81 @@ class IterativeBacktester:
         """Prints out the current position value."""
         date, price, spread = self.get_values(bar)
         cpv = self.units * price
-        print("{} |  Current Position Value = {}".format(date, round(cpv, 2)))
+        self.events.log(MessageEvent(date, "Current Position Value = {}".format(round(cpv, 2))))
 
     def print_current_nav(self, bar):
         """Prints out the current net asset value (nav)."""
         date, price, spread = self.get_values(bar)
         nav = self.current_balance + self.units * price
-        print("{} |  Net Asset Value = {}".format(date, round(nav, 2)))
+        self.events.log(MessageEvent(date, "Net Asset Value = {}".format(round(nav, 2))))
 
     def test_strategy(self):
         pass
 
+    def run_signals(self, signals, units=None, amount="all"):
+        """Runs the long/short/neutral order logic for a whole series of target positions.
+
+        Equivalent to looping over the bars and calling go_long / go_short (or closing the
+        position for 0) whenever the target changes, followed by close_pos on the last bar, but
+        executed by the array kernel in backtesting.ExecutionKernel (compiled with numba when it
+        is installed) without logging every trade.
+
+        Parameters
+        ----------
+        signals: array-like
+            target position per bar: 1 long, -1 short, 0 neutral, NaN keeps the current position
+        units: int
+            units per trade (takes precedence over amount)
+        amount: float or "all"
+            amount per trade, "all" uses the current balance
+
+        Returns
+        -------
+        float
+            net performance in percent
+        """
+        if units is None and amount is None:
+            raise ValueError("Pass either units or amount.")
+        self.position = 0
+        self.units = 0
+        self.current_balance = self.initial_balance
+        balance, trades, bars, units_traded, prices, nav = run_signals(
+            self._prices,
+            self._spreads,
+            np.asarray(signals, dtype="float64"),
+            units=units or 0,
+            amount=0.0 if amount in (None, "all") else amount,
+            initial_balance=self.initial_balance,
+        )
+        self.current_balance = balance
+        self.trades = trades
+        self.trade_log = pd.DataFrame(
+            {"units": units_traded, "price": prices}, index=self.data.index[bars]
+        )
+        self.data["nav"] = nav
+        return (balance - self.initial_balance) / self.initial_balance * 100
+
     def close_pos(self, bar):
         """Closes out a long or short position (go neutral)."""
         date, price, spread = self.get_values(bar)
-        print(75 * "-")
-        print("{} | +++ CLOSING FINAL POSITION +++".format(date))
+        self.events.log(MessageEvent(None, 75 * "-"))
+        self.events.log(MessageEvent(date, "+++ CLOSING FINAL POSITION +++"))
         self.current_balance += self.units * price  # closing final position
         if self.use_spread:
             self.current_balance -= (
                 abs(self.units) * spread / 2
             )  # subtract half-spread costs
-        print("{} | closing position of {} for {}".format(date, self.units, price))
+        self.events.log(TradeEvent(date, self.symbol, "closing position of", self.units, price))
         self.units = 0  # setting position to neutral
         self.trades += 1
         perf = (
             (self.current_balance - self.initial_balance) / self.initial_balance * 100
         )
         self.print_current_balance(bar)
-        print("{} | net performance (%) = {}".format(date, round(perf, 2)))
-        print("{} | number of trades executed = {}".format(date, self.trades))
-        print(75 * "-")
+        self.events.log(MessageEvent(date, "net performance (%) = {}".format(round(perf, 2))))
+        self.events.log(MessageEvent(date, "number of trades executed = {}".format(self.trades)))
+        self.events.log(MessageEvent(None, 75 * "-"))
+        self.events.flush()  # the summary ends the backtest, show it right away
 
     def reset(self):
         self.position = 0  # initial neutral position
@@ -0,0 +1,200 @@
+import string
+import numpy as np
+import pandas as pd
+
+from util import Instrument
+from util.Plotting import pyplot
+from backtesting.VectorizedBacktester import ffill
+
+Instrument = Instrument.Instrument
+
+
+def sma_crossover(prices, window_s=50, window_l=200):
+    """Long when the short SMA is above the long SMA, short otherwise (per column)."""
+    prices = pd.DataFrame(prices)
+    sma_s = prices.rolling(window_s).mean().to_numpy()
+    sma_l = prices.rolling(window_l).mean().to_numpy()
+    position = np.where(sma_s > sma_l, 1.0, -1.0)
+    position[np.isnan(sma_l)] = np.nan
+    return position
+
+
+def bollinger(prices, window=20, dev=2):
+    """Mean reversion on Bollinger bands, the rules of backtesting.Bollinger (per column)."""
+    prices = pd.DataFrame(prices)
+    sma = prices.rolling(window).mean().to_numpy()
+    std = prices.rolling(window).std().to_numpy()
+    distance = prices.to_numpy() - sma
+    position = np.where(distance > dev * std, -1.0, np.nan)
+    position[distance < -dev * std] = 1.0
+    crossed = np.zeros(distance.shape, dtype=bool)
+    crossed[1:] = distance[1:] * distance[:-1] < 0
+    position[crossed] = 0.0
+    return position
+
+
+def momentum(prices, window=3):
+    """Follows the sign of the mean log return over the last window bars (per column)."""
+    returns = pd.DataFrame(np.log(prices[1:] / prices[:-1]))
+    mean = returns.rolling(window).mean().to_numpy()
+    position = np.full(prices.shape, np.nan)
+    position[1:] = np.sign(mean)
+    return position
+
+
+class PortfolioBacktester:
+    """Vectorized backtesting of a strategy on several instruments at once.
+
+    The prices of all instruments are aligned into one (bars x assets) array, and positions,
+    strategy returns, trades and costs are computed for all assets in the same NumPy pass.
+    Each asset is a fixed share (weights) of the initial capital; the portfolio equity is
+    the weighted sum of the assets' equity curves (no rebalancing).
+    """
+
+    def __init__(
+        self,
+        symbols: list,
+        start: string,
+        end: string,
+        tc=0.0,
+        weights=None,
+        granularity: string = "1d",
+        source_files: dict = None,
+        trading_hour_range=(0, 23),
+        storage="memory",
+    ):
+        """
+        Parameters
+        ----------
+        symbols: list
+            ticker symbols (instruments) to be backtested
+        start: str
+            start date for data import
+        end: str
+            end date for data import
+        tc: float, dict or array
+            proportional transaction/trading costs per trade, for all assets or per asset
+        weights: dict or array
+            share of the capital per asset (defaults to equal weights)
+        granularity: str
+            bar length (1d is default)
+        source_files: dict
+            csv file per symbol to use instead of yf
+        trading_hour_range: (int, int)
+            range of hours to include (in New York time) in trading.
+        storage: str
+            "memory" or "memmap" (see Instrument)
+        """
+        source_files = source_files or {}
+        instruments = [
+            Instrument(symbol, start, end, source_file=source_files.get(symbol), granularity=granularity, storage=storage)
+            for symbol in symbols
+        ]
+        self._setup(instruments, tc, weights, trading_hour_range)
+
+    @classmethod
+    def from_instruments(cls, instruments: list, tc=0.0, weights=None, trading_hour_range=(0, 23)):
+        instance = cls.__new__(cls)
+        instance._setup(instruments, tc, weights, trading_hour_range)
+        return instance
+
+    def _setup(self, instruments, tc, weights, trading_hour_range):
+        self._instruments = instruments
+        self.symbols = [instrument.get_ticker() for instrument in instruments]
+        self.trading_hour_range = trading_hour_range
+        self.tc = self._per_asset(tc)
+        weights = np.full(len(self.symbols), 1 / len(self.symbols)) if weights is None else weights
+        self.weights = self._per_asset(weights)
+        self.results = None
+        self.asset_results = None
+        self.positions = None
+        self.get_data()
+
+    def __repr__(self):
+        return "PortfolioBacktester(symbols={}, bars={})".format(self.symbols, len(self.prices))
+
+    def _per_asset(self, value):
+        if isinstance(value, dict):
+            value = [value[symbol] for symbol in self.symbols]
+        return np.broadcast_to(np.asarray(value, dtype="float64"), (len(self.symbols),)).copy()
+
+    def get_data(self):
+        """Aligns the prices of all instruments on the union of their bars. Prices are carried
+        forward over bars where an instrument has no quote (a return of 0 there)."""
+        prices = pd.concat(
+            [instrument.get_data().price.rename(symbol) for symbol, instrument in zip(self.symbols, self._instruments)],
+            axis=1,
+        ).sort_index()
+        self.prices = prices.ffill()
+        self._prices = self.prices.to_numpy(dtype="float64")
+
+    def signal(self, prices, **params):
+        """Returns the positions (1 long, -1 short, 0 neutral, NaN keep) per bar and asset.
+        Override it, or pass a signal function such as sma_crossover to test_strategy."""
+        return np.ones_like(prices)
+
+    def test_strategy(self, signal=None, **params):
+        """Backtests signal(prices, **params) on all assets in one pass.
+
+        Returns
+        -------
+        (float, float)
+            performance of the portfolio and its out-/underperformance of buy and hold
+        """
+        (ts, te) = self.trading_hour_range
+        signal = self.signal if signal is None else signal
+        prices = self._prices
+
+        position = np.asarray(signal(prices, **params), dtype="float64")
+        hours = self.prices.index.hour
+        position[~((hours >= ts) & (hours <= te))] = np.nan
+        position[0] = np.nan_to_num(position[0], nan=0.0)
+        position = ffill(position)
+        position[np.isnan(prices)] = 0.0  # no position before the first quote
+
+        log_returns = np.zeros_like(prices)
+        with np.errstate(invalid="ignore"):
+            log_returns[1:] = np.nan_to_num(np.log(prices[1:] / prices[:-1]))
+        trades = np.zeros_like(position)
+        trades[1:] = np.abs(np.diff(position, axis=0))
+
+        strategy = np.zeros_like(log_returns)
+        strategy[1:] = position[:-1] * log_returns[1:]
+        strategy -= trades * self.tc
+
+        creturns = np.exp(np.cumsum(log_returns, axis=0))
+        cstrategy = np.exp(np.cumsum(strategy, axis=0))
+        weights = self.weights / self.weights.sum()
+
+        index = self.prices.index
+        self.positions = pd.DataFrame(position, index=index, columns=self.symbols)
+        self.asset_results = pd.DataFrame(
+            {
+                "weight": weights,
+                "tc": self.tc,
+                "perf": cstrategy[-1].round(6),
+                "outperf": (cstrategy[-1] - creturns[-1]).round(6),
+                "trades": trades.sum(axis=0),
+            },
+            index=self.symbols,
+        )
+        results = pd.DataFrame(
+            {"creturns": creturns @ weights, "cstrategy": cstrategy @ weights, "trades": trades.sum(axis=1)},
+            index=index,
+        )
+        results.insert(0, "returns", np.log(results.creturns / results.creturns.shift(1)))
+        results.insert(1, "strategy", np.log(results.cstrategy / results.cstrategy.shift(1)))
+        self.results = results
+
+        perf = results["cstrategy"].iloc[-1]  # absolute performance of the portfolio
+        outperf = perf - results["creturns"].iloc[-1]  # out-/underperformance of the portfolio
+        return round(perf, 6), round(outperf, 6)
+
+    def plot_results(self):
+        """Plots the performance of the portfolio and compares to "buy and hold"."""
+        if self.results is None:
+            print("Run test_strategy() first.")
+        else:
+            pyplot()
+            title = "{} assets | TC = {}".format(len(self.symbols), self.tc.mean())
+            self.results[["creturns", "cstrategy"]].plot(title=title, figsize=(12, 8))
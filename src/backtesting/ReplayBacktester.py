@@ -0,0 +1,169 @@
+import time
+import string
+import numpy as np
+import pandas as pd
+
+from util.EventLog import EventLog
+from util.FakeBroker import FakeBroker
+from util.OrderDispatcher import OrderDispatcher
+from util.Metrics import Metrics
+
+
+class ReplayBacktester:
+    """Replays recorded bid/ask ticks through a live ForexTrader strategy.
+
+    The strategy runs its live code path (on_success -> bar building -> define_strategy ->
+    execute_trades) without an OANDA session: orders go through a synchronous OrderDispatcher
+    to a FakeBroker that fills them at the replayed bid/ask. The ticks are fed as fast as the
+    strategy processes them, so a replay measures the throughput of the live code (ticks per
+    second) and its decision latency (time spent on the ticks that complete a bar); the
+    latencies of the single stages are in replay.metrics.
+
+    Usage
+    -----
+    replay = ReplayBacktester(SMACrossover, "EUR_USD", "4h", 1000, SMA_S=20, SMA_L=50)
+    replay.run()
+    replay.trades
+    """
+
+    def __init__(
+        self,
+        strategy,
+        instrument: string,
+        bar_length: string,
+        units: int,
+        bid_file: string = "../data/bid.csv",
+        ask_file: string = "../data/ask.csv",
+        start: string = None,
+        end: string = None,
+        warmup: string = "30d",
+        event_log: EventLog = None,
+        reject_rate: float = 0.0,
+        seed=None,
+        **params,
+    ):
+        """
+        Parameters
+        ----------
+        strategy: type
+            ForexTrader subclass to replay
+        instrument: str
+            instrument traded by the strategy
+        bar_length: str
+            bar length of the strategy, e.g. "1h"
+        units: int
+            units per trade
+        bid_file, ask_file: str
+            csv files with the columns time and c (bid and ask quotes, UTC)
+        start, end: str
+            first and last tick to replay (defaults to the whole files after the warm-up)
+        warmup: str
+            length of the history before start handed to the strategy like fetch_history
+        event_log: EventLog
+            defaults to an in-memory log that only prints errors
+        reject_rate: float
+            share of the orders the broker rejects (see FakeBroker), to replay the error path:
+            the strategy retries on the next bar and never goes out of sync with the broker
+        seed: int
+            seed of the rejections
+        params:
+            parameters of the strategy
+        """
+        self.instrument = instrument
+        self.events = EventLog(console_level="ERROR") if event_log is None else event_log
+        self.metrics = Metrics()
+        self.broker = FakeBroker(reject_rate=reject_rate, seed=seed)
+        self.dispatcher = OrderDispatcher(self.broker, synchronous=True, metrics=self.metrics)
+        self.trader = strategy(
+            None,
+            instrument,
+            bar_length,
+            units,
+            duration=0,
+            event_log=self.events,
+            broker=self.broker,
+            dispatcher=self.dispatcher,
+            autostart=False,
+            metrics=self.metrics,
+            **params,
+        )
+        self.dispatcher.on_fill = self.trader.on_fill
+        self.dispatcher.on_error = self.trader.on_order_error
+
+        ticks = self.load_ticks(bid_file, ask_file)
+        start = ticks.index[0] + pd.to_timedelta(warmup) if start is None else pd.to_datetime(start)
+        end = ticks.index[-1] if end is None else pd.to_datetime(end)
+        self.history = ticks.loc[start - pd.to_timedelta(warmup) : start]
+        self.history = self.history.loc[self.history.index < start]
+        self.ticks = ticks.loc[(ticks.index >= start) & (ticks.index <= end)]
+        self.latencies = None
+        self.stats = None
+
+    def __repr__(self):
+        return "ReplayBacktester(strategy={}, instrument={}, ticks={})".format(
+            type(self.trader).__name__, self.instrument, len(self.ticks)
+        )
+
+    @staticmethod
+    def load_ticks(bid_file, ask_file):
+        """Merges the bid and ask files into one frame of ticks with the columns bid and ask."""
+        quotes = []
+        for file, name in ((bid_file, "bid"), (ask_file, "ask")):
+            quote = pd.read_csv(file, parse_dates=["time"], index_col="time").c.rename(name)
+            quotes.append(quote[~quote.index.duplicated(keep="last")])
+        return pd.concat(quotes, axis=1, join="inner").dropna().sort_index()
+
+    def run(self):
+        """Warms the strategy up on the history, replays the ticks and closes the position.
+
+        Returns
+        -------
+        dict
+            ticks, bars, trades, realized P&L, ticks per second and decision latencies (µs)
+        """
+        trader = self.trader
+        trader.start_time = self.ticks.index[0].to_pydatetime()  # signals before it are warm-up
+        trader.end_time = (self.ticks.index[-1] + pd.Timedelta(1, "s")).to_pydatetime()
+        mid = ((self.history.bid + self.history.ask) / 2).rename(self.instrument).to_frame()
+        trader.merge_history(mid, now=mid.index[-1])  # as if fetched at the last history tick
+
+        times = self.ticks.index
+        bids = self.ticks.bid.to_numpy()
+        asks = self.ticks.ask.to_numpy()
+        latencies = []
+        out_of_sync = 0  # bars after which the trader's position differs from the broker's
+        clock = time.perf_counter_ns
+        started = clock()
+        for i in range(len(times)):
+            t, bid, ask = times[i], bids[i], asks[i]
+            self.broker.set_price(bid, ask, t)
+            bars = trader.bar_count
+            before = clock()
+            trader.on_success(t, bid, ask)
+            if trader.bar_count != bars:  # the tick completed a bar and ran the strategy
+                latencies.append(clock() - before)
+                out_of_sync += trader.position != self.dispatcher.positions.get(self.instrument, 0)
+        elapsed = (clock() - started) / 1e9
+        trader.close_open_position()
+
+        self.latencies = np.array(latencies, dtype="float64") / 1e3
+        self.stats = {
+            "ticks": len(times),
+            "bars": len(self.latencies),
+            "trades": len(self.broker.orders),
+            "order_errors": self.metrics.counter("order_errors").count,
+            "out_of_sync": out_of_sync,
+            "pl": round(sum(trader.profits), 6),
+            "seconds": round(elapsed, 6),
+            "ticks_per_second": round(len(times) / elapsed, 1),
+            "latency_mean_us": round(self.latencies.mean(), 1) if len(self.latencies) else np.nan,
+            "latency_p50_us": round(np.percentile(self.latencies, 50), 1) if len(self.latencies) else np.nan,
+            "latency_p99_us": round(np.percentile(self.latencies, 99), 1) if len(self.latencies) else np.nan,
+            "latency_max_us": round(self.latencies.max(), 1) if len(self.latencies) else np.nan,
+        }
+        return self.stats
+
+    @property
+    def trades(self):
+        """The filled orders of the replay as a DataFrame."""
+        return pd.DataFrame(self.broker.orders)
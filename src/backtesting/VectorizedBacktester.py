@@ -1,18 +1,109 @@
+import os
 import string
+import itertools
 import numpy as np
-import matplotlib.pyplot as plt
+import pandas as pd
+from multiprocessing import Pool
 
 from util import Instrument
+from util.SharedData import SharedFrame
+from util.Features import FeaturePipeline
+from util import Analytics
+from util.Plotting import pyplot
 
 Instrument = Instrument.Instrument
 
-plt.style.use("seaborn-v0_8")
+METRICS = ("perf", "outperf")  # the metrics of test_strategy a sweep can rank by
+
+# columns kept by compact results: what plot_results, hit_ratio, analytics, round_trips and
+# walk_forward need
+RESULT_COLUMNS = ["log_returns", "returns", "position", "trades", "hits", "strategy", "creturns", "cstrategy"]
+# columns that stay float64 with dtype="float32": returns are summed over the whole history
+PRECISE_COLUMNS = ["log_returns", "returns", "strategy", "creturns", "cstrategy"]
+
+
+def expand_grid(param_grid):
+    """Returns the cartesian product of a {name: values} grid as a list of {name: value} dicts."""
+    names = list(param_grid)
+    return [dict(zip(names, values)) for values in itertools.product(*param_grid.values())]
+
+
+def ffill(a):
+    """Forward fills NaNs down the rows of a 2-D array."""
+    index = np.where(np.isnan(a), 0, np.arange(len(a))[:, None])
+    np.maximum.accumulate(index, axis=0, out=index)
+    return a[index, np.arange(a.shape[1])]
+
+
+class _GridParams(dict):
+    """Parameter arrays of a chunk of test_strategy_grid. Parameters that are not part of the
+    grid take the backtester's current value."""
+
+    def __init__(self, backtester, size, arrays):
+        super().__init__(arrays)
+        self.backtester = backtester
+        self.size = size
+
+    def __missing__(self, name):
+        return np.full(self.size, getattr(self.backtester, name))
+
+
+# state of an optimization worker process, set once by _init_worker
+_worker = {}
+
+
+def _init_worker(meta, cls, state, metric, param_grid=None):
+    shm, data = SharedFrame.attach(meta)
+    backtester = cls.__new__(cls)
+    backtester.__dict__.update(state)
+    backtester._data = data
+    _worker.update(shm=shm, backtester=backtester, metric=metric, data=data, param_grid=param_grid)
+
+
+def _release_worker():
+    """Drops the state set by _init_worker in this process (processes=1) and detaches its
+    shared memory."""
+    shm = _worker.pop("shm", None)
+    _worker.clear()
+    if shm is not None:
+        shm.close()
+
+
+def _run_combination(params):
+    return _worker["backtester"]._evaluate(params, _worker["metric"])
+
+
+def _run_fold(bounds):
+    """Optimizes on the train window of a walk-forward fold and backtests the best parameters
+    on the test window that follows it."""
+    backtester, data, metric = _worker["backtester"], _worker["data"], _worker["metric"]
+    train_start, test_start, test_end = bounds
+    try:
+        backtester._data = data.iloc[train_start:test_start]
+        ranking = backtester._rank(_worker["param_grid"], metric)
+        best = {name: ranking.at[0, name] for name in _worker["param_grid"]}
+        score = ranking.at[0, metric.__name__ if callable(metric) else metric]
+
+        # run over train + test so the indicators are warmed up, then keep the test bars
+        backtester._data = data.iloc[train_start:test_end]
+        backtester.__dict__.update(best)
+        backtester.test_strategy()
+        results = backtester.results
+        test = results.loc[results.index >= data.index[test_start], ["log_returns", "position", "strategy", "trades"]]
+    finally:
+        backtester._data = data
+    return best, score, test
 
 
 class VectorizedBacktester:
     """Class for the vectorized backtesting of trading strategies."""
 
-    def __init__(self, symbol: string, start: string, end: string, tc: float, granularity: string="1d", source_file=None, trading_hour_range=(0, 23)):
+    # storage policy, also settable per subclass or instance (e.g. Bollinger.compact = True)
+    dtype = "float64"
+    compact = False
+    _results = None
+
+    def __init__(self, symbol: string, start: string, end: string, tc: float, granularity: string="1d", source_file=None, trading_hour_range=(0, 23), storage="memory", dtype=None, compact=None):
         """
         Parameters
         ----------
@@ -30,12 +121,29 @@ class VectorizedBacktester:
             path to csv file to use instead of yf
         trading_hour_range: (int, int)
             range of hours to include (in New York time) in trading. 
+        storage: str
+            "memory" or "memmap" (read-only memory-mapped price data, see Instrument)
+        dtype: str
+            "float32" stores the price data other than prices (see Instrument) and the columns
+            of results other than returns and equity in single precision. Strategies are still
+            computed in float64.
+        compact: bool
+            keep only positions, trades, returns and equity in results (see RESULT_COLUMNS)
+            instead of every intermediate indicator column. Strategies with _grid_positions
+            then never build the indicator columns at all (see test_compact), which also
+            lowers the peak memory of a backtest.
         """
+        if dtype is not None:
+            self.dtype = dtype
+        if compact is not None:
+            self.compact = compact
         self.trading_hour_range = trading_hour_range
         self.results_overview = None
         self.tc = tc
         self.results = None
-        self._instrument = Instrument(symbol, start, end, source_file=source_file, granularity=granularity)
+        self._instrument = Instrument(
+            symbol, start, end, source_file=source_file, granularity=granularity, storage=storage, dtype=self.dtype
+        )
         self._data = self._instrument.get_data()
 
     @classmethod
@@ -54,12 +162,83 @@ class VectorizedBacktester:
             self._instrument.get_end(),
         )
 
+    @property
+    def results(self):
+        """Frame of the last backtest, stored according to dtype and compact."""
+        return self._results
+
+    @results.setter
+    def results(self, data):
+        self._results = None if data is None else self.retain(data)
+
+    def retain(self, data):
+        """Returns the columns of a results frame to keep (all, or RESULT_COLUMNS if compact),
+        downcast to dtype except PRECISE_COLUMNS."""
+        if self.compact:
+            data = data[[col for col in RESULT_COLUMNS if col in data.columns]]
+        if self.dtype == "float32":
+            columns = [c for c in data.columns if c not in PRECISE_COLUMNS and data[c].dtype == "float64"]
+            if columns:
+                data = data.astype({c: self.dtype for c in columns})
+        return data
+
+    def test_compact(self):
+        """test_strategy for compact results: the positions come from _grid_positions (as a
+        single combination of the current parameters), so no indicator column is added to a
+        frame, and only RESULT_COLUMNS are built. Same perf and results as test_strategy."""
+        (ts, te) = self.trading_hour_range
+        data = self._data.dropna()
+        position, valid = self._grid_positions(data, _GridParams(self, 1, {}))
+        position, valid = position[:, 0], valid[:, 0].copy()
+
+        position = np.where((data.index.hour >= ts) & (data.index.hour <= te), position, np.nan)
+        position[0] = np.nan_to_num(position[0], nan=0.0)  # flat until the first signal
+        position = ffill(position[:, None])[:, 0]
+
+        price = data.price.to_numpy(dtype="float64")
+        log_returns = np.full_like(price, np.nan)
+        log_returns[1:] = np.log(price[1:] / price[:-1])
+        trades = np.zeros_like(position)
+        trades[1:] = np.abs(np.diff(position))
+        strategy = np.full_like(price, np.nan)
+        strategy[1:] = position[:-1] * log_returns[1:] - trades[1:] * self.tc
+        valid[0] = False  # no return for the first bar
+
+        # the kept bars of every column, written straight into their stored dtype
+        dtype = self.dtype if self.dtype == "float32" else "float64"
+        kept = int(valid.sum())
+        column = lambda values, dtype="float64": np.compress(valid, values, out=np.empty(kept, dtype))  # noqa: E731
+        with np.errstate(invalid="ignore"):  # the NaNs of the dropped bars
+            log_returns, position, trades = column(log_returns), column(position, dtype), column(trades, dtype)
+        results = pd.DataFrame(
+            {
+                "log_returns": log_returns,
+                "position": position,
+                "trades": trades,
+                "hits": np.sign(log_returns).astype(dtype) * np.sign(position),
+                "strategy": column(strategy),
+            },
+            index=data.index[valid],
+            copy=False,
+        )
+        results["creturns"] = results["log_returns"].cumsum().apply(np.exp)
+        results["cstrategy"] = results["strategy"].cumsum().apply(np.exp)
+        self.results = results
+
+        perf = results["cstrategy"].iloc[-1]  # absolute performance of the strategy
+        outperf = perf - results["creturns"].iloc[-1]  # out-/underperformance of strategy
+        return round(perf, 6), round(outperf, 6)
+
+    def features(self, data):
+        """Returns the indicator columns of data, memoized per process (see util.Features)."""
+        return FeaturePipeline.default().dataset(data)
+
     def test_strategy(self):
         """Backtests the simple Contrarian trading strategy. This should be overridden as it is strategy-specific."""
 
         (ts, te) = self.trading_hour_range
 
-        data = self._data.copy().dropna()
+        data = self._data.dropna()
         data["log_returns"] = np.log(data.price / data.price.shift(1))
         data["position"] = 1
         data["position"] = np.where((data.index.hour >= ts) & (data.index.hour <= te), data.position, 0)
@@ -82,35 +261,296 @@ class VectorizedBacktester:
 
         return round(perf, 6), round(outperf, 6)
 
+    def optimize_parameters(self, param_grid: dict, metric="perf", processes: int = None, chunksize: int = None):
+        """Backtests every combination of parameters in param_grid and ranks them by metric.
+
+        The price data is loaded once and placed in shared memory; a pool of worker processes
+        attaches to it and runs test_strategy for its share of the grid. After the sweep the
+        best combination is set on this instance and backtested again so that results holds
+        its performance.
+
+        Parameters
+        ----------
+        param_grid: dict
+            maps strategy attributes to the values to try, e.g. {"window": range(5, 100), "dev": [1, 2]}
+        metric: str or callable
+            "perf", "outperf" or a picklable function taking the results frame and returning a number
+        processes: int
+            number of worker processes (defaults to the number of CPUs, 1 runs in this process)
+        chunksize: int
+            number of combinations sent to a worker at a time
+
+        Returns
+        -------
+        pd.DataFrame
+            one row per combination with its parameters and metrics, best first
+        """
+        self._check_sweep(param_grid, metric)
+        combinations = expand_grid(param_grid)
+        processes = processes or os.cpu_count()
+        state = {
+            k: v for k, v in self.__dict__.items() if k not in ("_instrument", "_data", "_results", "results_overview")
+        }
+
+        with SharedFrame(self._data) as shared:
+            if processes == 1:
+                try:
+                    _init_worker(shared.meta, type(self), state, metric)
+                    rows = [_run_combination(params) for params in combinations]
+                finally:
+                    _release_worker()
+            else:
+                if chunksize is None:
+                    chunksize = max(1, len(combinations) // (processes * 4))
+                with Pool(processes, initializer=_init_worker, initargs=(shared.meta, type(self), state, metric)) as pool:
+                    rows = pool.map(_run_combination, combinations, chunksize=chunksize)
+
+        sort_by = metric.__name__ if callable(metric) else metric
+        results = pd.DataFrame(rows).sort_values(sort_by, ascending=False, ignore_index=True)
+        self.results_overview = results
+
+        for name in param_grid:
+            setattr(self, name, results.at[0, name])
+        self.test_strategy()
+        return results
+
+    def walk_forward(self, param_grid: dict, train_size, test_size, metric="perf", anchored=False, processes: int = None):
+        """Walk-forward backtest: optimizes the parameters on every train window and trades the
+        best ones on the test window that follows it, then stitches the test windows together.
+
+        Every fold (optimization of its train window plus its out-of-sample backtest) runs in a
+        worker process attached to the price data in shared memory. The inner sweep uses
+        test_strategy_grid when the strategy supports it and metric is "perf" or "outperf".
+        The test windows are backtested together with their train window, so indicators are
+        warmed up and the position held at the end of the train window carries over.
+
+        Parameters
+        ----------
+        param_grid: dict
+            maps strategy attributes to the values to try
+        train_size, test_size: int or str
+            window lengths in bars, or as timedelta strings such as "365D"
+        metric: str or callable
+            "perf", "outperf" or a picklable function taking the results frame
+        anchored: bool
+            every train window starts at the first bar (expanding instead of rolling windows)
+        processes: int
+            number of worker processes (defaults to the number of CPUs, 1 runs in this process)
+
+        Returns
+        -------
+        pd.DataFrame
+            one row per fold with its windows, best parameters, in-sample metric and
+            out-of-sample performance. The stitched out-of-sample results (log_returns,
+            position, strategy, trades, creturns, cstrategy) are stored in results.
+        """
+        self._check_sweep(param_grid, metric)
+        index = self._data.index
+        train_size, test_size = self._bars(train_size), self._bars(test_size)
+        bounds = []
+        for test_start in range(train_size, len(index), test_size):
+            bounds.append((0 if anchored else test_start - train_size, test_start, min(test_start + test_size, len(index))))
+        if not bounds:
+            raise ValueError("train_size leaves no data to test on")
+        processes = min(processes or os.cpu_count(), len(bounds))
+        state = {
+            k: v for k, v in self.__dict__.items() if k not in ("_instrument", "_data", "_results", "results_overview")
+        }
+
+        with SharedFrame(self._data) as shared:
+            if processes == 1:
+                try:
+                    _init_worker(shared.meta, type(self), state, metric, param_grid)
+                    folds = [_run_fold(b) for b in bounds]
+                finally:
+                    _release_worker()
+            else:
+                initargs = (shared.meta, type(self), state, metric, param_grid)
+                with Pool(processes, initializer=_init_worker, initargs=initargs) as pool:
+                    folds = pool.map(_run_fold, bounds, chunksize=1)
+
+        rows = []
+        for (train_start, test_start, test_end), (best, score, test) in zip(bounds, folds):
+            rows.append(
+                dict(
+                    train_start=index[train_start],
+                    test_start=index[test_start],
+                    test_end=index[test_end - 1],
+                    **best,
+                    train_metric=score,
+                    test_perf=round(np.exp(test.strategy.sum()), 6),
+                    test_outperf=round(np.exp(test.strategy.sum()) - np.exp(test.log_returns.sum()), 6),
+                    trades=test.trades.sum(),
+                )
+            )
+        results = pd.concat([test for best, score, test in folds])
+        results["creturns"] = results["log_returns"].cumsum().apply(np.exp)
+        results["cstrategy"] = results["strategy"].cumsum().apply(np.exp)
+        self.results = results
+        return pd.DataFrame(rows)
+
+    def _bars(self, size):
+        """Converts a window length (bars or a timedelta string) into a number of bars."""
+        if isinstance(size, str):
+            index = self._data.index
+            return int(index.searchsorted(index[0] + pd.Timedelta(size)))
+        return int(size)
+
+    def _check_sweep(self, param_grid, metric):
+        """Raises a ValueError before a sweep if param_grid or metric cannot be backtested."""
+        for name in param_grid:
+            if not hasattr(self, name):
+                raise ValueError("{} has no parameter {}".format(type(self).__name__, name))
+        if not callable(metric) and metric not in METRICS:
+            raise ValueError("metric must be one of {} or a callable, not {!r}".format(METRICS, metric))
+
+    def _evaluate(self, params, metric):
+        """Backtests one parameter combination and returns its parameters and metrics."""
+        self.__dict__.update(params)
+        perf, outperf = self.test_strategy()
+        row = dict(params, perf=perf, outperf=outperf)
+        if callable(metric):
+            row[metric.__name__] = metric(self.results)
+        return row
+
+    def _rank(self, param_grid, metric):
+        """Backtests every combination in param_grid on the current data, best first."""
+        if metric in METRICS and type(self)._grid_positions is not VectorizedBacktester._grid_positions:
+            results = self.test_strategy_grid(param_grid)
+        else:
+            rows = []
+            for params in expand_grid(param_grid):
+                try:
+                    rows.append(self._evaluate(params, metric))
+                except IndexError:  # no bars left after the warm-up of the indicators
+                    rows.append(dict(params, perf=np.nan, outperf=np.nan))
+            results = pd.DataFrame(rows)
+        sort_by = metric.__name__ if callable(metric) else metric
+        return results.sort_values(sort_by, ascending=False, ignore_index=True)
+
+    def test_strategy_grid(self, param_grid: dict, max_elements: int = 4_000_000, metrics: bool = False):
+        """Backtests every combination of parameters in param_grid in a single vectorized pass.
+
+        Indicators, positions, strategy returns and trades are computed as 2-D arrays
+        (bars x combinations) instead of one DataFrame per combination. Combinations are
+        processed in chunks so that no intermediate array has more than max_elements entries.
+        Only strategies that implement _grid_positions support this mode. With metrics=True,
+        the metrics of util.Analytics.performance (Sharpe, drawdown, ...) are added for every
+        combination, computed on the same 2-D arrays.
+
+        Returns
+        -------
+        pd.DataFrame
+            one row per combination with its parameters, perf, outperf and number of trades,
+            matching what test_strategy returns for the same parameters
+        """
+        (ts, te) = self.trading_hour_range
+
+        combinations = expand_grid(param_grid)
+        params = {name: np.array([c[name] for c in combinations]) for name in param_grid}
+
+        data = self._data.dropna()
+        price = data.price.to_numpy(dtype="float64")
+        log_returns = np.empty_like(price)
+        log_returns[0] = np.nan
+        log_returns[1:] = np.log(price[1:] / price[:-1])
+        in_hours = ((data.index.hour >= ts) & (data.index.hour <= te))[:, None]
+
+        chunk = max(1, max_elements // len(data))
+        perf, outperf, trades, analytics = [], [], [], []
+        for start in range(0, len(combinations), chunk):
+            size = min(chunk, len(combinations) - start)
+            chunk_params = _GridParams(self, size, {k: v[start : start + chunk] for k, v in params.items()})
+            position, valid = self._grid_positions(data, chunk_params)
+            position = np.where(in_hours, position, np.nan)
+            position[0] = np.nan_to_num(position[0], nan=0.0)  # flat until the first signal
+            position = ffill(position)
+
+            trade = np.zeros_like(position)
+            trade[1:] = np.abs(np.diff(position, axis=0))
+
+            valid[0] = False  # no return for the first bar
+            valid_returns = np.where(valid, log_returns[:, None], 0.0)
+            valid_trades = np.where(valid, trade, 0.0).sum(axis=0)
+            strategy = np.einsum("ij,ij->j", position[:-1], valid_returns[1:]) - valid_trades * self.tc
+
+            cperf = np.exp(strategy)
+            creturns = np.exp(valid_returns.sum(axis=0))
+            cperf[~valid.any(axis=0)] = np.nan
+
+            perf.append(cperf)
+            outperf.append(cperf - creturns)
+            trades.append(valid_trades)
+            if metrics:
+                bars = np.full_like(position, np.nan)
+                bars[1:] = position[:-1] * valid_returns[1:] - trade[1:] * self.tc
+                bars[~valid] = np.nan
+                periods = Analytics.periods_per_year(data.index, valid)  # as analytics() on results.index
+                analytics.append(Analytics.performance(bars, position, periods))
+
+        results = pd.DataFrame(params)
+        results["perf"] = np.concatenate(perf).round(6)
+        results["outperf"] = np.concatenate(outperf).round(6)
+        results["trades"] = np.concatenate(trades)
+        if metrics:
+            analytics = pd.concat(analytics, ignore_index=True).drop(columns="trades")
+            results = pd.concat([results, analytics], axis=1)
+        return results
+
+    def _grid_positions(self, data, params):
+        """Returns the positions before forward filling (NaN = keep previous position) and a mask
+        of the bars that test_strategy would keep, both as (bars x combinations) arrays."""
+        raise NotImplementedError("{} does not support test_strategy_grid".format(type(self).__name__))
+
     def plot_results(self):
         """Plots the performance of the trading strategy and compares to "buy and hold"."""
         if self.results is None:
             print("Run test_strategy() first.")
         else:
+            pyplot()
             title = "{} | TC = {}".format(self._instrument.get_ticker(), self.tc)
             self.results[["creturns", "cstrategy"]].plot(title=title, figsize=(12, 8))
 
     def hit_ratio(self):
-        """Returns proporition of trades that are profitable"""
-        if self.results is not None and self.results.hits is not None:
-            value_count = self.results.hits.value_counts()
-            return value_count[1] / (value_count[0] + value_count[-1] + value_count[1])
+        """Returns proporition of bars with a position in the direction of the market"""
+        if self.results is not None and "hits" in self.results:
+            hits = self.results.hits.dropna()
+            return (hits == 1).sum() / len(hits) if len(hits) else np.nan
         return "No hit ratio avaliable. Test strategy before calling this method."
-    
-    def detailed_metrics(self):
-        """Returns detailed performance metrics"""
+
+    def analytics(self, risk_free=0.0):
+        """Returns the performance metrics of the last test_strategy (see util.Analytics),
+        annualized with the number of bars per year of the data."""
+        if self.results is None:
+            return "No data avaliable. Test strategy before calling analytics()"
+        return Analytics.performance(
+            self.results.strategy.to_numpy(),
+            self.results.position.to_numpy(),
+            periods=Analytics.periods_per_year(self.results.index),
+            risk_free=risk_free,
+        )
+
+    def round_trips(self):
+        """Returns the trades of the last test_strategy: entry, exit, position, bars and P&L."""
+        if self.results is None:
+            return "No data avaliable. Test strategy before calling round_trips()"
+        trades = Analytics.round_trips(
+            self.results.position.to_numpy(), self.results.log_returns.to_numpy(), self.results.index, self.tc
+        )
+        return trades.drop(columns="strategy")
+
+    def detailed_metrics(self, risk_free=0.039):
+        """Prints and returns detailed performance metrics"""
         if self.results is not None:
-            #value_count = self.results.hits.value_counts()
-            #print("Hit Ratio: {}".format(value_count[1] / (value_count[0] + value_count[-1] + value_count[1])))
-            
-            mean_return = round(self.results.strategy.mean() * 252, 3)
-            risk = round(self.results.strategy.std() * np.sqrt(252), 3)
-            print("Annualized Return: {} | Annualized Risk: {}".format(mean_return, risk))
-
-            cagr = (self.results.cstrategy.iloc[-1] / self.results.cstrategy.iloc[0]) ** (365 / (self.results.index[-1] - self.results.index[0]).days) - 1
-            print("CAGR: {}".format(cagr))
-
-            sharpe = (cagr - 0.039) / risk
-            print("SHARPE: {}".format(sharpe))
+            metrics = self.analytics(risk_free)
+            print("Annualized Return: {} | Annualized Risk: {}".format(
+                round(metrics.annual_return, 3), round(metrics.annual_volatility, 3)
+            ))
+            print("CAGR: {}".format(metrics.cagr))
+            print("SHARPE: {} | SORTINO: {} | CALMAR: {}".format(metrics.sharpe, metrics.sortino, metrics.calmar))
+            print("Max Drawdown: {} over {} bars | Exposure: {}".format(
+                metrics.max_drawdown, int(metrics.max_drawdown_duration), metrics.exposure
+            ))
+            return metrics
         else:
-            return "No data avaliable. Test strategy before calling detailed_metrics()"
\ No newline at end of file
+            return "No data avaliable. Test strategy before calling detailed_metrics()"
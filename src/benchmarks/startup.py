@@ -0,0 +1,77 @@
+"""Measures the cold import time of the project's entry points.
+
+Every module is imported in a fresh interpreter (from src/) a few times; the median wall time
+and the heavy dependencies that ended up loaded are written as JSON, e.g.
+
+    python benchmarks/startup.py --repeat 5 --output startup.json
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_POINTS = [
+    "util.Instrument",
+    "backtesting.VectorizedBacktester",
+    "backtesting.IterativeBacktester",
+    "backtesting.CustomMACD",
+    "backtesting.DNN",
+    "strategies.ModdedMACD",
+    "strategies.PortfolioTrader",
+    "strategies.DNN",
+]
+
+HEAVY = ["matplotlib", "tensorflow", "keras", "yfinance", "numba"]
+
+PROBE = """
+import sys, json, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(module, repeat=5):
+    """Imports module in repeat fresh interpreters. Returns the median import time in seconds,
+    every run and the heavy dependencies it loaded (or the error if the import fails)."""
+    runs = []
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY)],
+            cwd=SRC,
+            capture_output=True,
+            text=True,
+        )
+        if proc.returncode != 0:
+            return {"error": proc.stderr.strip().splitlines()[-1]}
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        runs.append(result["seconds"])
+    return {"median_s": statistics.median(runs), "runs_s": runs, "heavy_loaded": result["loaded"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default=None, help="JSON file (default: print only)")
+    parser.add_argument("modules", nargs="*", default=ENTRY_POINTS)
+    args = parser.parse_args()
+
+    results = {"python": sys.version.split()[0], "repeat": args.repeat, "imports": {}}
+    for module in args.modules:
+        results["imports"][module] = result = measure(module, args.repeat)
+        if "error" in result:
+            print("{:40} failed: {}".format(module, result["error"]))
+        else:
+            print("{:40} {:8.3f} s  {}".format(module, result["median_s"], ", ".join(result["heavy_loaded"])))
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,471 @@
+"""Measures the throughput and peak memory of the backtesters, indicators and live bar pipeline.
+
+Every benchmark runs on the bundled data (data/eur_usd-hourly.csv) and on synthetic hourly
+random walks of the requested sizes. The median wall time, the throughput in bars per second
+and the peak traced memory are written as JSON; compare against an earlier run to catch
+regressions, e.g.
+
+    python benchmarks/suite.py --sizes data 1M --output bench.json
+    python benchmarks/suite.py --sizes data 1M --baseline bench.json --tolerance 0.25
+
+A benchmark that fails (e.g. backtesting.DNN without TensorFlow) records its error instead.
+"""
+import io
+import os
+import sys
+import json
+import time
+import inspect
+import contextlib
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA = os.path.join(os.path.dirname(SRC), "data")
+sys.path.insert(0, SRC)
+
+from util import Calculations as calc  # noqa: E402
+from util.Features import FeaturePipeline  # noqa: E402
+from util.Instrument import Instrument  # noqa: E402
+from util.PriceCache import PriceCache  # noqa: E402
+from util.EventLog import EventLog  # noqa: E402
+
+BENCHMARKS = []  # (group, name, setup, max_bars)
+SPREAD = 0.0001  # the bundled hourly data has no spread column
+LIVE_WARMUP = 1000  # bars of history merged before the live benchmarks stream bars
+LIVE_BARS = 1000  # bars streamed through resample_and_join/define_strategy
+
+
+def benchmark(group, name=None, max_bars=None):
+    """Registers setup(data, workdir) -> callable as a benchmark. The callable is what is
+    timed; it may return a dict of extra metrics. max_bars truncates the data."""
+
+    def register(setup):
+        BENCHMARKS.append((group, name or setup.__name__, setup, max_bars))
+        return setup
+
+    return register
+
+
+# data ------------------------------------------------------------------------------------------
+
+
+def bundled_data():
+    data = pd.read_csv(os.path.join(DATA, "eur_usd-hourly.csv"), parse_dates=["time"], index_col="time")
+    data = data[~data.index.duplicated(keep="last")]
+    data.index = data.index.tz_localize("UTC").tz_convert("America/New_York")
+    data["spread"] = SPREAD
+    return data
+
+
+def synthetic_data(bars, seed=100):
+    """Hourly random walk of bars bars with a random spread, indexed like Instrument data."""
+    rng = np.random.default_rng(seed)
+    index = pd.date_range("2000-01-03", periods=bars, freq="h", tz="UTC").tz_convert("America/New_York")
+    price = 1.1 * np.exp(np.cumsum(rng.normal(0, 0.001, bars)))
+    spread = SPREAD + np.abs(rng.normal(0, SPREAD / 2, bars))
+    data = pd.DataFrame({"price": price, "spread": spread}, index=index)
+    data.index.name = "time"
+    return data
+
+
+def parse_size(size):
+    """"data" or a number of bars such as 1M, 250k or 5000."""
+    if size == "data":
+        return size
+    multiplier = {"k": 1_000, "m": 1_000_000}.get(size[-1].lower(), 1)
+    return int(float(size.rstrip("kKmM")) * multiplier)
+
+
+# vectorized backtesters ------------------------------------------------------------------------
+
+
+def vectorized(cls, data, **params):
+    """Builds a backtester around data already in memory: the constructor parameters of cls
+    become attributes as its __init__ would set them, and the data replaces the Instrument."""
+    backtester = cls.__new__(cls)
+    for name, param in inspect.signature(cls.__init__).parameters.items():
+        if param.default is not inspect.Parameter.empty:
+            setattr(backtester, name, params.get(name, param.default))
+    backtester.trading_hour_range = params.get("trading_hour_range", (0, 23))
+    backtester.tc = params.get("tc", 0.00007)
+    backtester.results = None
+    backtester.results_overview = None
+    backtester._instrument = None
+    backtester._data = data[["price"]].copy()
+    return backtester
+
+
+def cold(test_strategy):
+    """Runs test_strategy without the features memoized by an earlier run."""
+
+    def run():
+        FeaturePipeline.default().clear()
+        test_strategy()
+
+    return run
+
+
+@benchmark("vectorized")
+def VectorizedBacktester(data, workdir):
+    from backtesting.VectorizedBacktester import VectorizedBacktester
+
+    return cold(vectorized(VectorizedBacktester, data).test_strategy)
+
+
+@benchmark("vectorized")
+def Bollinger(data, workdir):
+    from backtesting.Bollinger import Bollinger
+
+    return cold(vectorized(Bollinger, data, window=30, dev=2).test_strategy)
+
+
+@benchmark("vectorized")
+def CustomMACD(data, workdir):
+    from backtesting.CustomMACD import CustomMACD
+
+    return cold(vectorized(CustomMACD, data).test_strategy)
+
+
+@benchmark("vectorized")
+def ADX(data, workdir):
+    from backtesting.ADX import ADX
+
+    return cold(vectorized(ADX, data).test_strategy)
+
+
+@benchmark("vectorized")
+def DNN(data, workdir):
+    from backtesting.DNN import DNN
+
+    backtester = vectorized(DNN, data)
+    backtester.load_model(os.path.join(SRC, "DNN_model"), os.path.join(DATA, "params.pkl"))
+    return cold(backtester.test_strategy)
+
+
+@benchmark("vectorized")
+def grid_Bollinger(data, workdir):
+    """test_strategy_grid over 4 windows x 4 devs."""
+    from backtesting.Bollinger import Bollinger
+
+    backtester = vectorized(Bollinger, data)
+    grid = {"window": [10, 20, 30, 50], "dev": [1, 1.5, 2, 2.5]}
+    return cold(lambda: backtester.test_strategy_grid(grid))
+
+
+# iterative backtester --------------------------------------------------------------------------
+
+
+class _InMemory:
+    """Stands in for the Instrument of an IterativeBacktester."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def get_data(self):
+        return self.data.copy()
+
+
+def iterative(data):
+    from backtesting.IterativeBacktester import IterativeBacktester
+
+    backtester = IterativeBacktester.__new__(IterativeBacktester)
+    backtester.symbol = "SYNTH"
+    backtester.initial_balance = backtester.current_balance = 100_000
+    backtester.units = backtester.trades = backtester.position = 0
+    backtester.use_spread = True
+    backtester.data = backtester.trade_log = None
+    backtester.events = EventLog(level="ERROR", console_level=None)
+    backtester._instrument = _InMemory(data)
+    backtester.get_data()
+    return backtester
+
+
+def sma_signals(price, window_s=50, window_l=200):
+    return np.sign(calc.sma_crossover(price, window_s, window_l).to_numpy())
+
+
+@benchmark("iterative")
+def run_signals(data, workdir):
+    """The array kernel of run_signals (numba when installed)."""
+    backtester = iterative(data)
+    signals = sma_signals(data.price)
+    backtester.run_signals(signals, amount="all")  # compiles the kernel outside the timing
+    return lambda: backtester.run_signals(signals, amount="all")
+
+
+@benchmark("iterative", max_bars=1_000_000)
+def loop(data, workdir):
+    """The per-bar Python loop with go_long/go_short, as strategies written bar by bar run."""
+    backtester = iterative(data)
+    signals = sma_signals(data.price)
+
+    def run():
+        backtester.reset()
+        backtester.units = backtester.trades = 0
+        backtester.current_balance = backtester.initial_balance
+        for bar in range(len(signals) - 1):
+            signal = signals[bar]
+            if signal == 1 and backtester.position != 1:
+                backtester.go_long(bar, amount="all")
+                backtester.position = 1
+            elif signal == -1 and backtester.position != -1:
+                backtester.go_short(bar, amount="all")
+                backtester.position = -1
+        backtester.close_pos(len(signals) - 1)
+
+    return run
+
+
+# indicators ------------------------------------------------------------------------------------
+
+
+def indicator(function, column="price", **params):
+    def setup(data, workdir):
+        series = data.price if column == "price" else calc.returns(data.price)
+        return lambda: function(series, **params)
+
+    setup.__name__ = function.__name__
+    return setup
+
+
+for _function, _column in [
+    (calc.returns, "price"),
+    (calc.sma_crossover, "price"),
+    (calc.mean_reversion, "price"),
+    (calc.min, "price"),
+    (calc.max, "price"),
+    (calc.momentum, "returns"),
+    (calc.volume, "returns"),
+    (calc.macd, "price"),
+    (calc.rsi, "price"),
+]:
+    benchmark("indicators")(indicator(_function, _column))
+
+
+# Instrument ------------------------------------------------------------------------------------
+
+
+def csv_file(data, workdir):
+    """Writes data as a source_file csv once per dataset."""
+    path = os.path.join(workdir, "prices-{}.csv".format(len(data)))
+    if not os.path.exists(path):
+        data.tz_convert("UTC").tz_localize(None).to_csv(path)
+    return path
+
+
+@benchmark("instrument")
+def read_csv_resample(data, workdir):
+    """Instrument.get_data parsing the csv and resampling it to 4h bars (no cache)."""
+    path = csv_file(data, workdir)
+    return lambda: Instrument("SYNTH", None, None, source_file=path, granularity="4h", cache=False)
+
+
+@benchmark("instrument")
+def cached(data, workdir):
+    """Instrument.get_data from the .npy files of the PriceCache (in-process LRU disabled)."""
+    path = csv_file(data, workdir)
+    cache = PriceCache(os.path.join(workdir, "cache"), max_entries=0)
+    Instrument("SYNTH", None, None, source_file=path, granularity="4h", cache=cache)  # fills the cache
+    return lambda: Instrument("SYNTH", None, None, source_file=path, granularity="4h", cache=cache)
+
+
+# live bar pipeline -----------------------------------------------------------------------------
+
+
+def live(strategy, data, **params):
+    """Streams the bars after LIVE_WARMUP bars of merged history (one tick each) through
+    resample_and_join and define_strategy, as ForexTrader.on_tick does for every bar."""
+    from util.FakeBroker import FakeBroker
+    from util.OrderDispatcher import OrderDispatcher
+
+    prices = data.price.tz_convert("UTC").tz_localize(None)
+    history = prices.iloc[:LIVE_WARMUP].rename("SYNTH").to_frame()
+    stream = prices.iloc[LIVE_WARMUP:]
+    times = stream.index.asi8
+    values = stream.to_numpy()
+
+    def run():
+        broker = FakeBroker()
+        trader = strategy(
+            None,
+            "SYNTH",
+            "1h",
+            1000,
+            duration=0,
+            broker=broker,
+            dispatcher=OrderDispatcher(broker, synchronous=True),
+            autostart=False,
+            event_log=EventLog(level="ERROR", console_level=None),
+            **params,
+        )
+        with contextlib.redirect_stdout(io.StringIO()):  # merge_history reports to the console
+            trader.merge_history(history, now=history.index[-1])
+        latencies = np.empty(len(times))
+        clock = time.perf_counter_ns
+        for i in range(len(times)):
+            start = clock()
+            trader.bar_builder.update(times[i], values[i])
+            if trader.bar_builder.pending:
+                trader.resample_and_join()
+                trader.define_strategy()
+            latencies[i] = clock() - start
+        latencies /= 1e3
+        return {"bars": len(times), "bar_mean_us": latencies.mean(), "bar_p99_us": np.percentile(latencies, 99)}
+
+    return run
+
+
+@benchmark("live", "SMACrossover", max_bars=LIVE_WARMUP + LIVE_BARS)
+def live_SMACrossover(data, workdir):
+    from strategies.SMACrossover import SMACrossover
+
+    return live(SMACrossover, data)
+
+
+@benchmark("live", "ModdedMACD", max_bars=LIVE_WARMUP + LIVE_BARS)
+def live_ModdedMACD(data, workdir):
+    from strategies.ModdedMACD import ModdedMACD
+
+    return live(ModdedMACD, data)
+
+
+@benchmark("live", "Bollinger", max_bars=LIVE_WARMUP + LIVE_BARS)
+def live_Bollinger(data, workdir):
+    from strategies.Bollinger import Bollinger
+
+    return live(Bollinger, data)
+
+
+@benchmark("live", "DNN", max_bars=LIVE_WARMUP + LIVE_BARS)
+def live_DNN(data, workdir):
+    from strategies.DNN import DNN
+
+    return live(DNN, data, model=os.path.join(SRC, "DNN_model"), pkl=os.path.join(DATA, "params.pkl"))
+
+
+# runner ----------------------------------------------------------------------------------------
+
+
+def measure(run, bars, repeat=3):
+    """Times run repeat times, then traces the peak memory of one more run. run may return
+    a dict of extra metrics, including the number of bars it processed."""
+    runs = []
+    extra = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        extra = run()
+        runs.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    extra = dict(extra) if isinstance(extra, dict) else {}
+    bars = extra.pop("bars", bars)
+    median = statistics.median(runs)
+    result = {
+        "bars": bars,
+        "median_s": median,
+        "runs_s": runs,
+        "bars_per_s": bars / median if median else None,
+        "peak_mb": peak / 2**20,
+    }
+    result.update({key: float(value) for key, value in extra.items()})
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """Returns the benchmarks that are slower or use more memory than in baseline by more
+    than tolerance (a fraction)."""
+    regressions = []
+    for key, result in results.items():
+        before = baseline.get(key)
+        if before is None or "error" in result or "error" in before:
+            continue
+        for metric in ("median_s", "peak_mb"):
+            if before[metric] and result[metric] > before[metric] * (1 + tolerance):
+                regressions.append("{} {}: {:.4g} -> {:.4g}".format(key, metric, before[metric], result[metric]))
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SRC, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", default=["data", "1M"], help='"data" and/or bar counts (1M, 10M)')
+    parser.add_argument("--groups", nargs="+", default=None, help="vectorized iterative indicators instrument live")
+    parser.add_argument("--filter", default=None, help="only benchmarks whose name contains this")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=None, help="JSON file (default: print only)")
+    parser.add_argument("--baseline", default=None, help="JSON file of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    report = {
+        "meta": {
+            "time": datetime.utcnow().isoformat() + "Z",
+            "commit": git_commit(),
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "repeat": args.repeat,
+        },
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in map(parse_size, args.sizes):
+            data = bundled_data() if size == "data" else synthetic_data(size)
+            label = str(size)
+            for group, name, setup, max_bars in BENCHMARKS:
+                key = "{}.{}[{}]".format(group, name, label)
+                if args.groups is not None and group not in args.groups:
+                    continue
+                if args.filter is not None and args.filter not in key:
+                    continue
+                subset = data if max_bars is None else data.iloc[:max_bars]
+                try:
+                    result = measure(setup(subset, workdir), len(subset), args.repeat)
+                except Exception as e:
+                    result = {"error": "{}: {}".format(type(e).__name__, e)}
+                report["results"][key] = result
+                if "error" in result:
+                    print("{:45} failed: {}".format(key, result["error"]))
+                else:
+                    print(
+                        "{:45} {:10.4f} s {:14,.0f} bars/s {:10.1f} MB".format(
+                            key, result["median_s"], result["bars_per_s"], result["peak_mb"]
+                        )
+                    )
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            regressions = compare(report["results"], json.load(f)["results"], args.tolerance)
+        for regression in regressions:
+            print("REGRESSION {}".format(regression))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
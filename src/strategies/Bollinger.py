@@ -1,6 +1,7 @@
 import string
 import numpy as np
 from strategies import ForexTrader
+from util.Indicators import SMA, RollingStd
 
 
 class Bollinger(ForexTrader.ForexTrader):
@@ -13,24 +14,41 @@ class Bollinger(ForexTrader.ForexTrader):
         duration: int,
         window=5,
         dev=1,
+        **kwargs,
     ):
         self.window = window
         self.dev = dev
-        super().__init__(conf_file, instrument, bar_length, units, duration)
+        super().__init__(conf_file, instrument, bar_length, units, duration, **kwargs)
+
+    def init_strategy(self):
+        self.sma = SMA(self.window)
+        self.std = RollingStd(self.window)
+        self.last_distance = np.nan
+        self.last_position = 0
+        self.define_strategy()  # seed the indicators with the warm-up bars
 
     def define_strategy(self):
-        df = self.raw_data.copy()
+        self.stream_bars(self.on_bar)
 
-        df["SMA"] = df[self.instrument].rolling(self.window).mean()
-        df["Upper"] = df.SMA + self.dev * df[self.instrument].rolling(self.window).std()
-        df["Lower"] = df.SMA - self.dev * df[self.instrument].rolling(self.window).std()
-        df["distance"] = df[self.instrument] - df.SMA
+    def on_bar(self, price):
+        sma = self.sma.update(price)
+        std = self.std.update(price)
+        upper = sma + self.dev * std
+        lower = sma - self.dev * std
+        distance = price - sma
 
-        df["position"] = np.where(df[self.instrument] > df.Upper, -1, np.nan)
-        df["position"] = np.where(df[self.instrument] < df.Lower, 1, df["position"])
-        df["position"] = np.where(
-            df.distance * df.distance.shift(1) < 0, 0, df["position"]
-        )
-        df.position = df.position.ffill().fillna(0)
+        if distance * self.last_distance < 0:  # price crossed the SMA
+            self.last_position = 0
+        elif price > upper:
+            self.last_position = -1
+        elif price < lower:
+            self.last_position = 1
+        self.last_distance = distance
 
-        self.data = df.copy()
+        return {
+            "SMA": sma,
+            "Upper": upper,
+            "Lower": lower,
+            "distance": distance,
+            "position": self.last_position,
+        }
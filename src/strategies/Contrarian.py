@@ -1,6 +1,7 @@
 import string
 import numpy as np
 from strategies import ForexTrader
+from util.Indicators import SMA
 
 
 class Contrarian(ForexTrader.ForexTrader):
@@ -12,14 +13,22 @@ class Contrarian(ForexTrader.ForexTrader):
         units: int,
         duration: int,
         window=1,
+        **kwargs,
     ):
         self.window = window
-        super().__init__(conf_file, instrument, bar_length, units, duration)
+        super().__init__(conf_file, instrument, bar_length, units, duration, **kwargs)
 
-    def define_strategy(self):
-        df = self.raw_data.copy()
+    def init_strategy(self):
+        self.mean_return = SMA(self.window)
+        self.last_price = np.nan
+        self.define_strategy()  # seed the indicators with the warm-up bars
 
-        df["log_ret"] = np.log(df[self.instrument].div(df[self.instrument].shift(1)))
-        df["position"] = -np.sign(df.log_ret.rolling(self.window).mean())
+    def define_strategy(self):
+        self.stream_bars(self.on_bar)
 
-        self.data = df.copy()
+    def on_bar(self, price):
+        log_ret = np.log(price / self.last_price)
+        self.last_price = price
+        if not np.isnan(log_ret):
+            self.mean_return.update(log_ret)
+        return {"log_ret": log_ret, "position": -np.sign(self.mean_return.value)}
@@ -1,11 +1,81 @@
 import string
-import keras
 import pickle
 import numpy as np
 import pandas as pd
-from util import Calculations as calc
+from numpy.lib.stride_tricks import sliding_window_view
+from util.NumpyModel import NumpyModel
+from util.FeatureMatrix import FeatureMatrix
 from strategies.ForexTrader import ForexTrader
 
+FEATURES = [
+    "returns",
+    "dir",
+    "sma",
+    "mean_reversion",
+    "min",
+    "max",
+    "mom",
+    "vol",
+]
+FEATURE_WINDOW = 200  # longest rolling window of the features (sma_crossover)
+EMA_WARMUP = 500  # bars that seed the EMAs of macd; the weight of the seed is then below 1e-16
+LIVE_FEATURES = FEATURES + ["macd", "rsi"]  # the features lagged_features can build
+
+
+def lagged_features(price, rows, lags, features=FEATURES):
+    """NumPy version of the features of util.Calculations (with their default windows) for
+    only the last rows prices, as a FeatureMatrix of their lags 1 to lags (columns in the
+    order of "<feature>_lag_<lag>"); rows without enough history are NaN."""
+    check_features(features)
+    m = rows + lags
+    need = m + FEATURE_WINDOW + (EMA_WARMUP if "macd" in features else 0)
+    price = np.asarray(price, dtype="float64")[-need:]
+    if len(price) < need:
+        price = np.concatenate([np.full(need - len(price), np.nan), price])
+    end = price[-m:]
+    returns = np.log(price[1:] / price[:-1])
+    r = returns[-m:]
+    w50 = sliding_window_view(price, 50)[-m:]
+    sma50 = w50.mean(axis=1)
+    rw = lambda w: sliding_window_view(returns, w)[-m:]  # noqa: E731
+    columns = {
+        "returns": lambda: r,
+        "dir": lambda: np.where(r > 0, 1.0, 0.0),
+        "sma": lambda: sma50 - sliding_window_view(price, FEATURE_WINDOW)[-m:].mean(axis=1),
+        "mean_reversion": lambda: (end - sma50) / w50.std(axis=1, ddof=1),
+        "min": lambda: w50.min(axis=1) / end - 1,
+        "max": lambda: w50.min(axis=1) / end - 1,  # "max" is calc.min as well, as in training
+        "mom": lambda: rw(3).mean(axis=1),
+        "vol": lambda: rw(50).std(axis=1, ddof=1),
+        "macd": lambda: _macd(price)[-m:],
+        "rsi": lambda: _rsi(price)[-m:],
+    }
+    return FeatureMatrix(np.column_stack([columns[name]() for name in features]), lags, features)
+
+
+def check_features(features):
+    """Raises a ValueError if lagged_features cannot build some of features."""
+    unknown = [name for name in features if name not in LIVE_FEATURES]
+    if unknown:
+        raise ValueError("The live features cannot build {} (available: {}).".format(unknown, LIVE_FEATURES))
+
+
+def _macd(price, ema_s=12, ema_l=26, signal_smooth=9):
+    """calc.macd (the MACD histogram) of the prices."""
+    price = pd.Series(price)
+    macd = price.ewm(span=ema_s, adjust=False).mean() - price.ewm(span=ema_l, adjust=False).mean()
+    return (macd - macd.ewm(span=signal_smooth, adjust=False).mean()).to_numpy()
+
+
+def _rsi(price, window=14):
+    """calc.rsi of the prices."""
+    change = np.diff(price, prepend=np.nan)
+    gain = sliding_window_view(np.where(change < 0, 0.0, change), window).mean(axis=1)
+    loss = sliding_window_view(np.where(change > 0, 0.0, -change), window).mean(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsi = 100 - (100 / (1 + gain / loss))
+    return np.concatenate([np.full(window - 1, np.nan), rsi])
+
 
 class DNN(ForexTrader):
     def __init__(
@@ -18,60 +88,87 @@ class DNN(ForexTrader):
         model: string = None,
         pkl: string = None,
         lags=5,
+        runtime="numpy",
+        **kwargs,
     ):
+        """
+        model is a saved keras model, or a .npz written by NumpyModel.save (which needs no
+        TensorFlow). With runtime="numpy" a keras model is copied into a NumpyModel after
+        loading; runtime="keras" keeps predicting with keras. If pkl holds the lags and features
+        the model was trained on (as written by training/pipeline.py), they replace lags and
+        the default FEATURES.
+        """
         self.model = None
         self.mean = None
         self.std = None
         self.lags = lags
-        self.load_model(model, pkl)
-        super().__init__(conf_file, instrument, bar_length, units, duration)
+        self.feature_names = FEATURES
+        self.load_model(model, pkl, runtime)
+        super().__init__(conf_file, instrument, bar_length, units, duration, **kwargs)
+
+    def load_model(self, model_path: string, pkl_path: string, runtime="numpy"):
+        if model_path.endswith(".npz"):
+            self.model = NumpyModel.load(model_path)
+        else:
+            import keras
 
-    def load_model(self, model_path: string, pkl_path: string):
-        self.model = keras.models.load_model(model_path)
+            self.model = keras.models.load_model(model_path)
+            if runtime == "numpy":
+                self.model = NumpyModel.from_keras(self.model)
         params = pickle.load(open(pkl_path, "rb"))
         self.mean = params["mean"]
         self.std = params["std"]
+        self.lags = params.get("lags", self.lags)
+        self.feature_names = list(params.get("features", self.feature_names))
+        check_features(self.feature_names)
+        self.cols = ["{}_lag_{}".format(f, lag) for f in self.feature_names for lag in range(1, self.lags + 1)]
+        self._mean = np.asarray(self.mean[self.cols], dtype="float64")
+        self._std = np.asarray(self.std[self.cols], dtype="float64")
+
+    def init_strategy(self):
+        self.last_position = 0
+        self.define_strategy()  # score the warm-up bars once
 
     def define_strategy(self):
-        df = self.raw_data.copy()
-
-        df = pd.concat([df, pd.DataFrame(self.tick_data)])
-        df["returns"] = calc.returns(df[self.instrument])
-        df["dir"] = calc.dir(df.returns)
-        df["sma"] = calc.sma_crossover(df[self.instrument])
-        df["mean_reversion"] = calc.mean_reversion(df[self.instrument])
-        df["min"] = calc.min(df[self.instrument])
-        df["max"] = calc.min(df[self.instrument])
-        df["mom"] = calc.momentum(df.returns)
-        df["vol"] = calc.volume(df.returns)
-        df.dropna(inplace=True)
-
-        cols = []
-        features = [
-            "returns",
-            "dir",
-            "sma",
-            "mean_reversion",
-            "min",
-            "max",
-            "mom",
-            "vol",
-        ]
-
-        for f in features:
-            for lag in range(1, self.lags + 1):
-                col = "{}_lag_{}".format(f, lag)
-                df[col] = df[f].shift(lag)
-                cols.append(col)
-        df.dropna(inplace=True)
-
-        df_s = (df - self.mean) / self.std
-
-        df["prob"] = self.model.predict(df_s[cols])
-
-        df = df.loc[self.start_time :].copy()
-        df["position"] = np.where(df.prob < 0.47, -1, np.nan)
-        df["position"] = np.where(df.prob > 0.53, 1, df.position)
-        df["position"] = df.position.ffill().fillna(0)
-
-        self.data = df.copy()
+        """Scores the bars that have no probability yet, from features computed over just
+        enough preceding bars for the longest rolling window and the lags, and then the ticks
+        of the bar in progress (appended to the bars, as the position is taken on the last
+        tick). The position of the bars carries over to the next call, the one of the ticks
+        only decides the current trade."""
+        new = self.new_bars()
+        if new:
+            price = self._bars.column(self.instrument)
+            prob = lagged_features(price, new, self.lags, self.feature_names).predict(
+                self.model, self._mean, self._std
+            )
+            times = pd.DatetimeIndex(self._bars.times(new))
+            self.last_position, position = self._positions(prob, times, self.last_position)
+            self.data = pd.DataFrame(
+                {self.instrument: price[-new:], "prob": prob, "position": position}, index=times
+            )
+
+        tick_times, ticks = self.tick_data.since(self.last_bar.value)
+        if len(ticks) == 0 or self.data is None:
+            return
+        price = np.concatenate([self._bars.column(self.instrument), ticks])
+        prob = lagged_features(price, len(ticks), self.lags, self.feature_names).predict(
+            self.model, self._mean, self._std
+        )
+        times = pd.DatetimeIndex(tick_times)
+        _, position = self._positions(prob, times, self.last_position)
+        ticks = pd.DataFrame({self.instrument: ticks, "prob": prob, "position": position}, index=times)
+        self.data = pd.concat([self.data, ticks]) if new else ticks
+
+    def _positions(self, prob, times, last_position):
+        """Positions of the rows with the probabilities prob, starting from last_position.
+        Returns the last position and the positions."""
+        live = times >= self.start_time  # only trade on signals of this session
+        position = np.empty(len(prob))
+        for i in range(len(prob)):
+            if live[i]:
+                if prob[i] < 0.47:
+                    last_position = -1
+                elif prob[i] > 0.53:
+                    last_position = 1
+            position[i] = last_position
+        return last_position, position
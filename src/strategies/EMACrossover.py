@@ -1,6 +1,6 @@
 import string
-import numpy as np
 from strategies import ForexTrader
+from util.Indicators import EMA as StreamingEMA
 
 
 class EMA(ForexTrader.ForexTrader):
@@ -13,16 +13,21 @@ class EMA(ForexTrader.ForexTrader):
         duration: int,
         EMA_S=20,
         EMA_L=50,
+        **kwargs,
     ):
         self.EMA_S = EMA_S
         self.EMA_L = EMA_L
-        super().__init__(conf_file, instrument, bar_length, units, duration)
+        super().__init__(conf_file, instrument, bar_length, units, duration, **kwargs)
 
-    def define_strategy(self):
-        df = self.raw_data.copy()
+    def init_strategy(self):
+        self.ema_s = StreamingEMA(self.EMA_S)
+        self.ema_l = StreamingEMA(self.EMA_L)
+        self.define_strategy()  # seed the indicators with the warm-up bars
 
-        df["EMA_S"] = df[self.instrument].ewm(span=self.EMA_S, adjust=False).mean()
-        df["EMA_L"] = df[self.instrument].ewm(span=self.EMA_L, adjust=False).mean()
-        df["position"] = np.where(df["EMA_S"] > df["EMA_L"], 1, -1)
+    def define_strategy(self):
+        self.stream_bars(self.on_bar)
 
-        self.data = df.copy()
+    def on_bar(self, price):
+        ema_s = self.ema_s.update(price)
+        ema_l = self.ema_l.update(price)
+        return {"EMA_S": ema_s, "EMA_L": ema_l, "position": 1 if ema_s > ema_l else -1}
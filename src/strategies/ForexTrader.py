@@ -3,8 +3,21 @@ import string
 import numpy as np
 import pandas as pd
 from tpqoa import tpqoa
+from util.TickBuffer import TickBuffer
+from util.BarBuffer import BarBuffer
+from util.BarAggregator import MultiBarAggregator
+from util.EventLog import EventLog, TradeEvent, BarEvent, SignalEvent, ErrorEvent, MessageEvent
+from util.OrderDispatcher import OrderDispatcher
+from util.Metrics import Metrics
+from util.PriceCache import PriceCache
 from datetime import datetime, timedelta
 
+STAYING = {1: "Staying long...", -1: "Staying short...", 0: "Staying neutral..."}
+HISTORY_PAGE = "6h"  # 4320 S5 candles, below the 5000 candles OANDA returns per request
+HISTORY_WORKERS = 4
+# raw_data columns after the close (named after the instrument)
+BAR_COLUMNS = {"open": "float64", "high": "float64", "low": "float64", "ticks": "int64", "spread": "float64"}
+
 
 class ForexTrader(tpqoa):
     def __init__(
@@ -14,15 +27,62 @@ class ForexTrader(tpqoa):
         bar_length: string,
         units: int,
         duration: int,
-        trading_hours: int * int = (0, 23),
+        trading_hours: (int, int) = (0, 23),
+        event_log: EventLog = None,
+        broker=None,
+        dispatcher: OrderDispatcher = None,
+        autostart=True,
+        metrics: Metrics = None,
+        timeframes=(),
+        history_cache: PriceCache = None,
+        history_bars: int = 10_000,
     ):
-        super().__init__(conf_file)
+        """
+        conf_file may be None for traders that do not own an OANDA session, e.g. the
+        per-instrument traders of a PortfolioTrader, which receive ticks, history and the order
+        dispatcher from the portfolio. Then either a broker or a dispatcher must be passed.
+        autostart=False skips start_trading. The latencies of every stage of the tick to order
+        path are recorded in metrics (defaults to the shared Metrics).
+        timeframes are further bar lengths (multiples or divisors of bar_length) built from
+        the same ticks in the same pass; their bars are in self.bars[timeframe].
+        The warm-up history is kept in history_cache (defaults to the shared PriceCache, False
+        disables it), so restarts and reconnects only download the candles they missed.
+        raw_data and the bars of the other timeframes keep the last history_bars bars (at
+        least the longest window of a strategy that recomputes from raw_data, like DNN).
+        """
+        if conf_file is not None:
+            super().__init__(conf_file)
+        elif broker is None and dispatcher is None:
+            raise ValueError("Pass a conf_file, a broker or a dispatcher.")
+        self.events = EventLog.default() if event_log is None else event_log
+        self.metrics = Metrics.default() if metrics is None else metrics
+        self.history_cache = PriceCache.default() if history_cache is None else history_cache
+        self._stages = {
+            name: self.metrics.histogram(name)
+            for name in ("tick_ingest", "bar_resample", "define_strategy", "order_submit", "tick_to_order", "report_trade")
+        }
+        self._tick_counter = self.metrics.counter("ticks")
+        self._bar_counter = self.metrics.counter("bars")
+        self._tick_arrived = None
+        self.broker = self if broker is None else broker  # e.g. util.FakeBroker for tests
+        if dispatcher is None:
+            dispatcher = OrderDispatcher(
+                self.broker, on_fill=self.on_fill, on_error=self.on_order_error, metrics=self.metrics
+            )
+        self.dispatcher = dispatcher
+        self.ticks = 0
         self.instrument = instrument
         self.bar_length = pd.to_timedelta(bar_length)
-        self.tick_data = pd.DataFrame()
-        self.raw_data = None
-        self.data = None
+        self.tick_data = TickBuffer()
+        self.timeframes = list(timeframes)
+        self.bar_builder = MultiBarAggregator([bar_length] + self.timeframes)
+        self.bars = {timeframe: None for timeframe in self.timeframes}
+        self.history_bars = history_bars
+        self._bars = BarBuffer({instrument: "float64", **BAR_COLUMNS}, history_bars)
+        self._data = None
+        self._signals = None
         self.last_bar = None
+        self.bars_processed = 0
         self.units = units
         self.position = 0
         self.profits = []
@@ -31,7 +91,8 @@ class ForexTrader(tpqoa):
 
         self.trading_hours = trading_hours
 
-        self.start_trading()
+        if autostart:
+            self.start_trading()
 
     def start_trading(
         self, days=5, max_attempts=None, wait=15, wait_increase=0
@@ -43,150 +104,248 @@ class ForexTrader(tpqoa):
                 self.get_most_recent(days)
                 self.stream_data(self.instrument)
             except Exception as e:
-                print(e, end=" | ")
+                self.events.log(ErrorEvent(datetime.utcnow(), repr(e)), level="ERROR")
             else:
                 success = True
                 break
             finally:
                 attempt += 1
-                print("Attempt: {}".format(attempt), end="\n")
+                self.events.log(MessageEvent(None, "Attempt: {}".format(attempt)))
                 if not success:
                     if max_attempts is not None and attempt >= max_attempts:
-                        print("Max Attempts Reached!")
+                        self.events.log(MessageEvent(None, "Max Attempts Reached!"), level="ERROR")
                         try:  # try to terminate session
                             time.sleep(wait)
                             self.terminate_session(
                                 cause="Unexpected Session Stop (too many errors)."
                             )
                         except Exception as e:
-                            print(e, end=" | ")
-                            print("Could not terminate session properly!")
+                            self.events.log(
+                                ErrorEvent(datetime.utcnow(), "Could not terminate session properly! {!r}".format(e)),
+                                level="ERROR",
+                            )
                         finally:
                             break
                     else:  # try again
                         time.sleep(wait)
                         wait += wait_increase
-                        self.tick_data = pd.DataFrame()
+                        self.tick_data.clear()
+                        self.bar_builder.reset()
 
-    def set_trading_hours(self, trading_hours: int * int):
+    def set_trading_hours(self, trading_hours: (int, int)):
         self.trading_hours = trading_hours
 
     def terminate_session(self, cause: string):
         self.stop_stream = True
-        if self.position != 0:
-            close_order = self.create_order(
-                self.instrument,
-                units=-self.position * self.units,
-                suppress=True,
-                ret=True,
-            )
-            self.report_trade(close_order, "GOING NEUTRAL")
-            self.position = 0
-        print(cause, end=" | ")
+        self.dispatcher.submit(self.instrument, 0, self.units)
+        self.dispatcher.wait()
+        self.position = 0
+        self.events.log(MessageEvent(None, cause))
+        self.events.flush()
 
     def close_open_position(self):
-        if self.position == -1:
-            order = self.create_order(
-                self.instrument, self.units, suppress=True, ret=True
-            )
-            self.report_trade(order, "GOING NEUTRAL")
-        elif self.position == 1:
-            order = self.create_order(
-                self.instrument, -self.units, suppress=True, ret=True
-            )
-            self.report_trade(order, "GOING NEUTRAL")
-        print("\nSession Over.")
+        self.dispatcher.submit(self.instrument, 0, self.units)
+        self.dispatcher.wait()
+        self.events.log(MessageEvent(None, "Session Over."))
+        self.events.flush()
         self.position = 0
 
     def get_most_recent(self, days=5):
-        time.sleep(1)
         print("~" * 50)
         print("Trying to merge...")
         print("Need below {} seconds".format(self.bar_length.seconds))
-        now = datetime.utcnow()
-        now = now - timedelta(microseconds=now.microsecond)
-        past = now - timedelta(days=days)
-        df = (
-            self.get_history(
+        while True:
+            now = datetime.utcnow()
+            now = now - timedelta(microseconds=now.microsecond)
+            past = now - timedelta(days=days)
+            if self.merge_history(self.load_history(past, now)):
+                return
+            print("Ensure that this is running during trading hours...")
+            time.sleep(1)
+
+    def load_history(self, start, end, session=None):
+        """fetch_history through the candle store: only the candles since the last stored one
+        are downloaded, in pages of HISTORY_PAGE requested in parallel."""
+        if not self.history_cache:
+            return self.fetch_history(start, end, session)
+        return self.history_cache.load_recent(
+            (self.instrument, "S5", "oanda-mid"),
+            lambda s, e: self.fetch_history(s, e, session),
+            start,
+            end,
+            page=HISTORY_PAGE,
+            workers=HISTORY_WORKERS,
+        )
+
+    def fetch_history(self, start, end, session=None):
+        """Downloads the 5 second mid prices between start and end (with session, the tpqoa
+        session of a PortfolioTrader, or this trader's own)."""
+        session = self if session is None else session
+        try:
+            df = session.get_history(
                 instrument=self.instrument,
-                start=past,
-                end=now,
+                start=start,
+                end=end,
                 granularity="S5",
                 price="M",
                 localize=True,
             )
-            .c.dropna()
-            .to_frame()
-        )
+        except KeyError:  # tpqoa fails on ranges without candles, e.g. a page of a weekend
+            return pd.DataFrame({self.instrument: []}, index=pd.DatetimeIndex([], name="time"))
+        df = df.c.dropna().to_frame()
         df.rename(columns={"c": self.instrument}, inplace=True)
-        m_max = df.resample(self.bar_length, label="right").max().dropna()
-        m_min = df.resample(self.bar_length, label="right").min().dropna()
-        df = df.resample(self.bar_length, label="right").last().dropna().iloc[:-1]
-        df["high"] = m_max
-        df["low"] = m_min
-        self.raw_data = df.copy()
-        self.last_bar = self.raw_data.index[-1]
-        print(
-            "Seconds: {}".format(
-                (pd.to_datetime(datetime.utcnow()) - self.last_bar).seconds
-            )
-        )
-        if pd.to_datetime(datetime.utcnow()) - self.last_bar >= self.bar_length:
-            print("Ensure that this is running during trading hours...")
-            self.get_most_recent()
-        else:
-            print("Successfully Merged!")
-            print("~" * 50)
+        return df
+
+    def merge_history(self, df, now=None):
+        """Builds raw_data (and the bars of the other timeframes) from the history returned by
+        fetch_history in one pass and starts the strategy. Returns False if the last complete
+        bar is too old to trade on at now (the current UTC time unless given, e.g. by a replay),
+        or if there is no complete bar yet (e.g. an empty history on a cold start over a weekend).
+        In the history, ticks counts the 5 second candles and the spread is unknown (NaN)."""
+        if len(df) == 0:
+            return False
+        frames = self.bar_builder.aggregate(df.index.asi8, df[self.instrument].to_numpy())
+        bars = self._bar_columns(frames[self.bar_builder.bar_lengths[0]].iloc[:-1])
+        if len(bars) == 0:
+            return False
+        for timeframe in self.timeframes:
+            self.bars[timeframe] = frames[timeframe].iloc[:-1].iloc[-self.history_bars :]
+        self._bars.load(bars)
+        self.last_bar = bars.index[-1]
+        now = pd.to_datetime(datetime.utcnow() if now is None else now)
+        print("Seconds: {}".format((now - self.last_bar).seconds))
+        if now - self.last_bar >= self.bar_length:
+            return False
+        print("Successfully Merged!")
+        print("~" * 50)
+        self.bars_processed = 0
+        self.data = None
+        self.init_strategy()
+        return True
 
     def on_success(self, t_time, bid, ask):
+        arrived = time.perf_counter_ns()
         recent_tick = pd.to_datetime(t_time).replace(tzinfo=None)
 
-        print("Ticks: {}".format(self.ticks), end="\r", flush=True)
-
         if recent_tick >= self.end_time:
             self.terminate_session(cause="Scheduled Termination.")
             return
 
-        df = pd.DataFrame({self.instrument: (ask + bid) / 2}, index=[recent_tick])
-        self.tick_data = pd.concat([self.tick_data, df])
+        self.on_tick(recent_tick, bid, ask, arrived)
+
+    def on_tick(self, recent_tick, bid, ask, arrived=None):
+        """Adds a tick (naive UTC timestamp) and runs the strategy whenever a bar completes.
+        arrived is the perf_counter_ns() at which the tick was received."""
+        clock = time.perf_counter_ns
+        if arrived is None:
+            arrived = clock()
+        self._tick_arrived = arrived
+        self._tick_counter.inc()
+        mid = (ask + bid) / 2
+        self.tick_data.append(recent_tick.value, mid)
+        self.bar_builder.update(recent_tick.value, mid, ask - bid)
+        stages = self._stages
+        stages["tick_ingest"].record(clock() - arrived)
+
+        if not self.bar_builder.pending:
+            return
 
         (ts, te) = self.trading_hours
 
-        curHour = (
-            datetime.utcnow().tz_localize("UTC").tz_convert("America/New_York").hour
-        )
+        curHour = recent_tick.tz_localize("UTC").tz_convert("America/New_York").hour
 
-        if (
-            recent_tick - self.last_bar > self.bar_length
-            and curHour >= ts
-            and curHour <= te
-        ):
+        if curHour >= ts and curHour <= te:
+            start = clock()
             self.resample_and_join()
+            resampled = clock()
+            stages["bar_resample"].record(resampled - start)
             self.define_strategy()
+            stages["define_strategy"].record(clock() - resampled)
             self.execute_trades()
 
     def resample_and_join(self):
-        new_row = (
-            self.tick_data.resample(self.bar_length, label="right")
-            .last()
-            .ffill()
-            .iloc[:-1]
-        )
-        new_row["high"] = (
-            self.tick_data.resample(self.bar_length, label="right")
-            .max()
-            .ffill()
-            .iloc[:-1]
-        )
-        new_row["low"] = (
-            self.tick_data.resample(self.bar_length, label="right")
-            .min()
-            .ffill()
-            .iloc[:-1]
-        )
-        self.raw_data = pd.concat([self.raw_data, new_row])
-        self.tick_data = self.tick_data.iloc[-1:]
-        self.last_bar = self.raw_data.index[-1]
+        labels, bars = self.bar_builder.pop()
+        last = self.last_bar.value
+        rows = [(close, o, high, low, ticks, spread) for (o, high, low, close, ticks, spread) in bars]
+        new = [i for i, label in enumerate(labels) if label > last]
+        for i in new:
+            bar_time = pd.Timestamp(labels[i])
+            close, o, high, low, ticks, spread = rows[i]
+            self.events.log(BarEvent(bar_time, self.instrument, close, high, low, ticks, o, spread))
+            self._bars.append(labels[i], rows[i])
+            self.last_bar = bar_time
+        if new:
+            self._bar_counter.inc(len(new))
+        for timeframe in self.timeframes:
+            labels, bars = self.bar_builder.pop(timeframe)
+            history = self.bars[timeframe]
+            if len(history):
+                last = history.index[-1].value
+                bars = [bar for label, bar in zip(labels, bars) if label > last]
+                labels = [label for label in labels if label > last]
+            if labels:
+                bars = pd.DataFrame(bars, index=pd.to_datetime(labels), columns=self.bar_builder.main.columns)
+                self.bars[timeframe] = pd.concat([history, bars]).iloc[-self.history_bars :]
+
+    def _bar_columns(self, bars):
+        """raw_data layout: the close under the instrument's name, then open, high, low, ticks
+        and spread."""
+        bars = bars.rename(columns={"close": self.instrument})
+        return bars[[self.instrument, "open", "high", "low", "ticks", "spread"]]
+
+    def init_strategy(self):
+        """Called once the warm-up history is loaded. Strategies with streaming indicators
+        (see util.Indicators) create them here and seed them from raw_data."""
+        pass
+
+    @property
+    def raw_data(self):
+        """DataFrame of the last history_bars bars, built from the bar buffer when it is read."""
+        return self._bars.frame() if len(self._bars) else None
+
+    @property
+    def bar_count(self):
+        """Number of bars added to raw_data since the history was merged."""
+        return self._bars.count
+
+    @property
+    def data(self):
+        """Bars of the last define_strategy with the indicator values and the position. For
+        stream_bars it is only built from the signal rows when it is read."""
+        if self._data is None and self._signals is not None:
+            n, rows = self._signals
+            bars = self._bars.frame(n)
+            self._data = bars.assign(**{col: [row[col] for row in rows] for col in rows[0]})
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+        self._signals = None
+
+    def new_bars(self):
+        """Returns the number of bars of raw_data that have not been passed to the strategy yet
+        (the last ones) and marks them as passed."""
+        new = min(self._bars.count - self.bars_processed, len(self._bars))
+        self.bars_processed = self._bars.count
+        return new
+
+    def stream_bars(self, on_bar):
+        """Feeds the price of every new bar to on_bar, which updates the streaming indicators
+        and returns a dict of indicator values and the position. Only the signal rows of the
+        new bars are kept (see data), so the cost per bar does not grow with the length of the
+        session and no DataFrame is built on the tick path."""
+        new = self.new_bars()
+        if new:
+            rows = [on_bar(price) for price in self._bars.column(self.instrument, new).tolist()]
+            self.data = None
+            self._signals = (new, rows)
+
+    def target_position(self):
+        """Position of the last bar of data."""
+        if self._signals is not None:
+            return self._signals[1][-1]["position"]
+        return self.data["position"].iloc[-1]
 
     def define_strategy(self):  # "strategy-specific"
         # ONLY FOR BASE CLASS. DO NOT KEEP FOLLOWING LINES WHEN OVERRIDING
@@ -196,48 +355,32 @@ class ForexTrader(tpqoa):
         pass
 
     def execute_trades(self):
-        if self.data["position"].iloc[-1] == 1:
-            if self.position == 0:
-                order = self.create_order(
-                    self.instrument, self.units, suppress=True, ret=True
-                )
-                self.report_trade(order, "GOING LONG")
-            elif self.position == -1:
-                order = self.create_order(
-                    self.instrument, self.units * 2, suppress=True, ret=True
-                )
-                self.report_trade(order, "GOING LONG")
-            else:
-                print("\nStaying long...")
-            self.position = 1
-        elif self.data["position"].iloc[-1] == -1:
-            if self.position == 0:
-                order = self.create_order(
-                    self.instrument, -self.units, suppress=True, ret=True
-                )
-                self.report_trade(order, "GOING SHORT")
-            elif self.position == 1:
-                order = self.create_order(
-                    self.instrument, -self.units * 2, suppress=True, ret=True
-                )
-                self.report_trade(order, "GOING SHORT")
-            else:
-                print("\nStaying short...")
-            self.position = -1
-        elif self.data["position"].iloc[-1] == 0:
-            if self.position == -1:
-                order = self.create_order(
-                    self.instrument, self.units, suppress=True, ret=True
-                )
-                self.report_trade(order, "GOING NEUTRAL")
-            elif self.position == 1:
-                order = self.create_order(
-                    self.instrument, -self.units, suppress=True, ret=True
-                )
-                self.report_trade(order, "GOING NEUTRAL")
-            else:
-                print("\nStaying neutral...")
-            self.position = 0
+        """Hands the target position of the latest bar to the order dispatcher. The order is
+        sent from the dispatcher's thread, so the tick stream never waits for the broker."""
+        target = self.target_position()
+        if target not in (1, -1, 0):
+            return
+        target = int(target)
+        if target == self.position:
+            self.events.log(SignalEvent(self.last_bar, self.instrument, target, STAYING[target]))
+            return
+        # before submit: a failed order resets the position in on_order_error, which a
+        # synchronous dispatcher calls within submit
+        self.position = target
+        start = time.perf_counter_ns()
+        self.dispatcher.submit(self.instrument, target, self.units)
+        end = time.perf_counter_ns()
+        self._stages["order_submit"].record(end - start)
+        if self._tick_arrived is not None:
+            self._stages["tick_to_order"].record(end - self._tick_arrived)
+
+    def on_fill(self, instrument, order, going):
+        with self.metrics.timer("report_trade"):
+            self.report_trade(order, going)
+
+    def on_order_error(self, instrument, error, position):
+        self.events.log(ErrorEvent(datetime.utcnow(), "Order failed: {!r}".format(error)), level="ERROR")
+        self.position = position  # back to what the broker holds, the next bar retries
 
     def report_trade(self, order, going):
         time = order["time"]
@@ -246,11 +389,4 @@ class ForexTrader(tpqoa):
         pl = float(order["pl"])
         self.profits.append(pl)
         cumpl = sum(self.profits)
-        print("\n" + 50 * "~")
-        print("{} | {}".format(time, going))
-        print(
-            "{} | units = {} | price = {} | P&L = {} | Cum P&L = {}".format(
-                time, units, price, pl, cumpl
-            )
-        )
-        print(50 * "~")
+        self.events.log(TradeEvent(time, self.instrument, going, units, price, pl=pl, cum_pl=cumpl))
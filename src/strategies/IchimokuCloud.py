@@ -1,6 +1,6 @@
 import string
-import numpy as np
 from strategies import ForexTrader
+from util.Indicators import RollingMax, RollingMin
 
 
 class IchimokuCloud(ForexTrader.ForexTrader):
@@ -14,29 +14,38 @@ class IchimokuCloud(ForexTrader.ForexTrader):
         conversion=9,
         base=26,
         leading_l=52,
+        **kwargs,
     ):
         self.conversion = conversion
         self.base = base
         self.leading_l = leading_l
-        super().__init__(conf_file, instrument, bar_length, units, duration)
+        super().__init__(conf_file, instrument, bar_length, units, duration, **kwargs)
 
-    def define_strategy(self):
-        df = self.raw_data.copy()
-
-        df["conversion"] = (df[self.instrument].rolling(self.conversion).max() + df[self.instrument].rolling(self.conversion).min()) / 2
-
-        df["base"] = (df[self.instrument].rolling(self.base).max() + df[self.instrument].rolling(self.base).min()) / 2
+    def init_strategy(self):
+        self.channels = {
+            name: (RollingMax(window), RollingMin(window))
+            for name, window in [("conversion", self.conversion), ("base", self.base), ("leading_l", self.leading_l)]
+        }
+        self.last_position = 0
+        self.define_strategy()  # seed the indicators with the warm-up bars
 
-        df["leading_s"] = (df.conversion + df.base) / 2
+    def define_strategy(self):
+        self.stream_bars(self.on_bar)
 
-        df["leading_l"] = (df[self.instrument].rolling(self.leading_l).max() + df[self.instrument].rolling(self.leading_l).min()) / 2
+    def on_bar(self, price):
+        row = {
+            name: (high.update(price) + low.update(price)) / 2
+            for name, (high, low) in self.channels.items()
+        }
+        row["leading_s"] = (row["conversion"] + row["base"]) / 2
 
         # When price is above cloud and leading_s is above leading_l, go long
         # When price is below cloud and leading_s is below leading_l, go short
         # Otherwise, maintain current position
-        df["position"] = np.where((df[self.instrument] > df["leading_s"]) & (df["leading_s"] > df["leading_l"]), 1, np.nan)
-        df["position"] = np.where((df[self.instrument] < df["leading_s"]) & (df["leading_s"] < df["leading_l"]), -1, df.position)
-
-        df.position = df.position.ffill().fillna(0)
+        if price > row["leading_s"] and row["leading_s"] > row["leading_l"]:
+            self.last_position = 1
+        elif price < row["leading_s"] and row["leading_s"] < row["leading_l"]:
+            self.last_position = -1
 
-        self.data = df.copy()
+        row["position"] = self.last_position
+        return row
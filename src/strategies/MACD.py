@@ -1,6 +1,6 @@
 import string
-import numpy as np
 from strategies import ForexTrader
+from util.Indicators import MACD as StreamingMACD
 
 
 class MACD(ForexTrader.ForexTrader):
@@ -14,19 +14,26 @@ class MACD(ForexTrader.ForexTrader):
         EMA_S=12,
         EMA_L=26,
         signal_smooth=9,
+        **kwargs,
     ):
         self.EMA_S = EMA_S
         self.EMA_L = EMA_L
         self.signal_smooth = signal_smooth
-        super().__init__(conf_file, instrument, bar_length, units, duration)
+        super().__init__(conf_file, instrument, bar_length, units, duration, **kwargs)
 
-    def define_strategy(self):
-        df = self.raw_data.copy()
+    def init_strategy(self):
+        self.macd = StreamingMACD(self.EMA_S, self.EMA_L, self.signal_smooth)
+        self.define_strategy()  # seed the indicators with the warm-up bars
 
-        df["EMA_S"] = df[self.instrument].ewm(span=self.EMA_S, adjust=False).mean()
-        df["EMA_L"] = df[self.instrument].ewm(span=self.EMA_L, adjust=False).mean()
-        df["MACD"] = df.EMA_S - df.EMA_L
-        df["signal"] = df.MACD.ewm(span=self.signal_smooth, adjust=False).mean()
-        df["position"] = np.where(df["MACD"] > df["signal"], 1, -1)
+    def define_strategy(self):
+        self.stream_bars(self.on_bar)
 
-        self.data = df.copy()
+    def on_bar(self, price):
+        macd = self.macd.update(price)
+        return {
+            "EMA_S": self.macd.ema_s.value,
+            "EMA_L": self.macd.ema_l.value,
+            "MACD": macd,
+            "signal": self.macd.signal,
+            "position": 1 if macd > self.macd.signal else -1,
+        }
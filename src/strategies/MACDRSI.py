@@ -1,6 +1,6 @@
 import string
-import numpy as np
 from strategies import ForexTrader
+from util.Indicators import MACD, RSI
 
 
 class MACDRSI(ForexTrader.ForexTrader):
@@ -16,7 +16,8 @@ class MACDRSI(ForexTrader.ForexTrader):
         signal_smooth=9,
         RSI_window=14,
         buy_thresh=70,
-        short_thresh=30
+        short_thresh=30,
+        **kwargs,
     ):
         self.EMA_S = EMA_S
         self.EMA_L = EMA_L
@@ -24,35 +25,35 @@ class MACDRSI(ForexTrader.ForexTrader):
         self.RSI_window = RSI_window
         self.buy_thresh=buy_thresh
         self.short_thresh=short_thresh
-        super().__init__(conf_file, instrument, bar_length, units, duration)
+        super().__init__(conf_file, instrument, bar_length, units, duration, **kwargs)
 
-    def define_strategy(self):
-        df = self.raw_data.copy()
-
-        # RSI CALCULATIONS
-
-        df["change"] = df[self.instrument].diff()
-        df["gain"] = df.change.mask(df.change < 0, 0.0)
-        df["loss"] = -df.change.mask(df.change > 0, -0.0)
-
-        df["avg_gain"] = df.gain.rolling(self.window).mean()
-        df["avg_loss"] = df.loss.rolling(self.window).mean()
+    def init_strategy(self):
+        self.macd = MACD(self.EMA_S, self.EMA_L, self.signal_smooth)
+        self.rsi = RSI(self.RSI_window)
+        self.last_position = 0
+        self.define_strategy()  # seed the indicators with the warm-up bars
 
-        df["rsi"] = 100 - (100 / (1 + (df.avg_gain / df.avg_loss)))
-
-        # MACD CALCULATIONS
+    def define_strategy(self):
+        self.stream_bars(self.on_bar)
 
-        df["EMA_S"] = df[self.instrument].ewm(span=self.EMA_S, adjust=False).mean()
-        df["EMA_L"] = df[self.instrument].ewm(span=self.EMA_L, adjust=False).mean()
-        df["MACD"] = df.EMA_S - df.EMA_L
-        df["signal"] = df.MACD.ewm(span=self.signal_smooth, adjust=False).mean()
+    def on_bar(self, price):
+        rsi = self.rsi.update(price)
+        macd = self.macd.update(price)
 
         # GO LONG IF MACD > SIGNAL AND RSI > buy_thresh
-        # GO SHORT IF MACD < SIGNAL AND RSI < sell_thresh
+        # GO SHORT IF MACD < SIGNAL AND RSI < short_thresh
         # OTHERWISE MAINTAIN CURRENT POSITION
 
-        df["position"] = np.where((df.rsi > self.buy_thresh) & (df.MACD > df.signal), 1, np.nan)
-        df["position"] = np.where((df.rsi < self.sell_thresh) & (df.MACD < df.signal), -1, df.position)
-        df.position = df.position.ffill().fillna(0)
-
-        self.data = df.copy()
+        if rsi > self.buy_thresh and macd > self.macd.signal:
+            self.last_position = 1
+        elif rsi < self.short_thresh and macd < self.macd.signal:
+            self.last_position = -1
+
+        return {
+            "rsi": rsi,
+            "EMA_S": self.macd.ema_s.value,
+            "EMA_L": self.macd.ema_l.value,
+            "MACD": macd,
+            "signal": self.macd.signal,
+            "position": self.last_position,
+        }
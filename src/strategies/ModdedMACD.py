@@ -1,6 +1,7 @@
 import string
 import numpy as np
 from strategies import ForexTrader
+from util.Indicators import MACD, RSI, SMA
 
 
 class ModdedMACD(ForexTrader.ForexTrader):
@@ -16,40 +17,46 @@ class ModdedMACD(ForexTrader.ForexTrader):
         SMA_XL=200,
         signal_smooth=9,
         RSI_window=14,
+        **kwargs,
     ):
         self.EMA_S = EMA_S
         self.EMA_L = EMA_L
         self.SMA_XL = SMA_XL
         self.signal_smooth = signal_smooth
         self.RSI_window = RSI_window
-        super().__init__(conf_file, instrument, bar_length, units, duration)
+        super().__init__(conf_file, instrument, bar_length, units, duration, **kwargs)
 
-    def define_strategy(self):
-        df = self.raw_data.copy()
-
-        df["log_returns"] = np.log(df[self.instrument] / df[self.instrument].shift(1))
-
-        df["EMA_S"] = df[self.instrument].ewm(span=self.EMA_S, adjust=False).mean()
-        df["EMA_L"] = df[self.instrument].ewm(span=self.EMA_L, adjust=False).mean()
-        df["SMA_XL"] = df[self.instrument].rolling(self.SMA_XL).mean()
-
-        df["MACD"] = df.EMA_S - df.EMA_L
-        df["signal"] = df.MACD.ewm(span=self.signal_smooth, adjust=False).mean()
-
-        df["change"] = df[self.instrument].diff()
-        df["gain"] = df.change.mask(df.change < 0, 0.0)
-        df["loss"] = -df.change.mask(df.change > 0, -0.0)
-
-        df["avg_gain"] = df.gain.rolling(self.RSI_window).mean()
-        df["avg_loss"] = df.loss.rolling(self.RSI_window).mean()
+    def init_strategy(self):
+        self.macd = MACD(self.EMA_S, self.EMA_L, self.signal_smooth)
+        self.rsi = RSI(self.RSI_window)
+        self.sma_xl = SMA(self.SMA_XL)
+        self.last_price = np.nan
+        self.last_position = 0
+        self.define_strategy()  # seed the indicators with the warm-up bars
 
-        df["rsi"] = 100 - (100 / (1 + (df.avg_gain / df.avg_loss)))
-
-        df["SMA_XL"] = df[self.instrument].rolling(self.SMA_XL).mean()
-
-        df["position"] = np.where((df["MACD"] > df["signal"]) & (df[self.instrument] > df.SMA_XL) & (df["rsi"] > 70), 1, np.nan)
-        df["position"] = np.where((df["MACD"] < df["signal"]) & (df[self.instrument] < df.SMA_XL) & (df["rsi"] < 30), -1, df.position)
-
-        df.position = df.position.ffill().fillna(0)
-
-        self.data = df.copy()
+    def define_strategy(self):
+        self.stream_bars(self.on_bar)
+
+    def on_bar(self, price):
+        log_returns = np.log(price / self.last_price)
+        self.last_price = price
+
+        macd = self.macd.update(price)
+        rsi = self.rsi.update(price)
+        sma_xl = self.sma_xl.update(price)
+
+        if macd > self.macd.signal and price > sma_xl and rsi > 70:
+            self.last_position = 1
+        elif macd < self.macd.signal and price < sma_xl and rsi < 30:
+            self.last_position = -1
+
+        return {
+            "log_returns": log_returns,
+            "EMA_S": self.macd.ema_s.value,
+            "EMA_L": self.macd.ema_l.value,
+            "SMA_XL": sma_xl,
+            "MACD": macd,
+            "signal": self.macd.signal,
+            "rsi": rsi,
+            "position": self.last_position,
+        }
@@ -0,0 +1,175 @@
+import time
+import string
+import pandas as pd
+from tpqoa import tpqoa
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from util.EventLog import EventLog, ErrorEvent, MessageEvent
+from util.OrderDispatcher import OrderDispatcher
+from util.Metrics import Metrics
+
+
+class PortfolioTrader(tpqoa):
+    """Trades several instruments from one process, one OANDA session and one price stream.
+
+    Every instrument is handled by its own ForexTrader strategy instance (with its own bar
+    builder and indicators). Those instances do not open sessions or streams: the portfolio
+    downloads their warm-up history in parallel, routes the ticks of the shared stream to them
+    and sends their orders through one shared OrderDispatcher.
+
+    Usage
+    -----
+    trader = PortfolioTrader("oanda.cfg", duration=100)
+    trader.add(ModdedMACD, "EUR_USD", "1min", 1000)
+    trader.add(SMACrossover, "GBP_USD", "1min", 1000, SMA_S=20, SMA_L=100)
+    trader.start_trading()
+    """
+
+    def __init__(
+        self,
+        conf_file: string,
+        duration: int,
+        event_log: EventLog = None,
+        broker=None,
+        history_workers: int = 4,
+        metrics: Metrics = None,
+    ):
+        """
+        Parameters
+        ----------
+        conf_file: str
+            OANDA config file (None to run without a session, e.g. fed by a replay)
+        duration: int
+            minutes until the session is terminated
+        event_log: EventLog
+            shared by all instruments (defaults to the shared EventLog)
+        broker: object
+            receives the orders (defaults to this session)
+        history_workers: int
+            number of warm-up histories downloaded at the same time
+        metrics: Metrics
+            latency metrics shared by all instruments (defaults to the shared Metrics)
+        """
+        if conf_file is not None:
+            super().__init__(conf_file)
+        self.events = EventLog.default() if event_log is None else event_log
+        self.broker = self if broker is None else broker
+        self.metrics = Metrics.default() if metrics is None else metrics
+        self.dispatcher = OrderDispatcher(
+            self.broker, on_fill=self.on_fill, on_error=self.on_order_error, metrics=self.metrics
+        )
+        self.history_workers = history_workers
+        self.traders = {}
+        self.ticks = 0
+        self.stop_stream = False
+        self.start_time = datetime.utcnow()
+        self.end_time = self.start_time + timedelta(minutes=duration)
+
+    def __repr__(self):
+        return "PortfolioTrader(instruments={})".format(list(self.traders))
+
+    def add(self, strategy, instrument: string, bar_length: string, units: int, **params):
+        """Creates a strategy instance (a ForexTrader subclass) for instrument and returns it.
+        params are passed on to the strategy."""
+        trader = strategy(
+            None,
+            instrument,
+            bar_length,
+            units,
+            0,
+            event_log=self.events,
+            dispatcher=self.dispatcher,
+            autostart=False,
+            metrics=self.metrics,
+            **params,
+        )
+        trader.end_time = self.end_time
+        self.traders[instrument] = trader
+        return trader
+
+    def start_trading(self, days=5, max_attempts=None, wait=15, wait_increase=0):
+        attempt = 0
+        while True:
+            try:
+                self.get_most_recent(days)
+                self.stream_data()
+                break
+            except Exception as e:
+                self.events.log(ErrorEvent(datetime.utcnow(), repr(e)), level="ERROR")
+            attempt += 1
+            self.events.log(MessageEvent(None, "Attempt: {}".format(attempt)))
+            if max_attempts is not None and attempt >= max_attempts:
+                self.events.log(MessageEvent(None, "Max Attempts Reached!"), level="ERROR")
+                time.sleep(wait)
+                self.terminate_session(cause="Unexpected Session Stop (too many errors).")
+                break
+            time.sleep(wait)
+            wait += wait_increase
+            for trader in self.traders.values():
+                trader.tick_data.clear()
+                trader.bar_builder.reset()
+
+    def get_most_recent(self, days=5):
+        """Loads the warm-up history of all instruments in parallel over this session (only
+        the candles missing from their candle stores are downloaded) and starts their
+        strategies. Instruments whose last bar is too old are loaded again."""
+        pending = list(self.traders.values())
+        with ThreadPoolExecutor(max_workers=self.history_workers) as pool:
+            while pending:
+                now = datetime.utcnow()
+                now = now - timedelta(microseconds=now.microsecond)
+                past = now - timedelta(days=days)
+                histories = pool.map(lambda trader: trader.load_history(past, now, session=self), pending)
+                pending = [trader for trader, df in zip(pending, list(histories)) if not trader.merge_history(df)]
+                if pending:
+                    print("Ensure that this is running during trading hours...")
+                    time.sleep(1)
+
+    def stream_data(self, instrument=None, stop=None, ret=False):
+        """Streams the prices of all instruments over one connection."""
+        self.ticks = 0
+        self.stop_stream = False
+        response = self.ctx_stream.pricing.stream(
+            self.account_id, snapshot=True, instruments=",".join(self.traders)
+        )
+        for msg_type, msg in response.parts():
+            if msg_type == "pricing.ClientPrice":
+                self.ticks += 1
+                self.on_price(
+                    msg.instrument,
+                    msg.time,
+                    float(msg.bids[0].dict()["price"]),
+                    float(msg.asks[0].dict()["price"]),
+                )
+                if stop is not None and self.ticks >= stop:
+                    break
+            if self.stop_stream:
+                break
+
+    def on_price(self, instrument, t_time, bid, ask):
+        arrived = time.perf_counter_ns()
+        recent_tick = pd.to_datetime(t_time).replace(tzinfo=None)
+
+        if recent_tick >= self.end_time:
+            self.terminate_session(cause="Scheduled Termination.")
+            return
+
+        trader = self.traders.get(instrument)
+        if trader is not None:
+            trader.ticks += 1
+            trader.on_tick(recent_tick, bid, ask, arrived)
+
+    def on_fill(self, instrument, order, going):
+        self.traders[instrument].on_fill(instrument, order, going)
+
+    def on_order_error(self, instrument, error, position):
+        self.traders[instrument].on_order_error(instrument, error, position)
+
+    def terminate_session(self, cause: string):
+        self.stop_stream = True
+        for trader in self.traders.values():
+            self.dispatcher.submit(trader.instrument, 0, trader.units)
+            trader.position = 0
+        self.dispatcher.wait()
+        self.events.log(MessageEvent(None, cause))
+        self.events.flush()
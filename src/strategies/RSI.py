@@ -1,6 +1,6 @@
 import string
-import numpy as np
 from strategies import ForexTrader
+from util.Indicators import RSI as StreamingRSI
 
 
 class RSI(ForexTrader.ForexTrader):
@@ -13,27 +13,26 @@ class RSI(ForexTrader.ForexTrader):
         duration: int,
         window=14,
         buy_thresh=70,
-        short_thresh=30
+        short_thresh=30,
+        **kwargs,
     ):
         self.window = window
         self.buy_thresh=buy_thresh
         self.short_thresh=short_thresh
-        super().__init__(conf_file, instrument, bar_length, units, duration)
+        super().__init__(conf_file, instrument, bar_length, units, duration, **kwargs)
 
-    def define_strategy(self):
-        df = self.raw_data.copy()
-
-        df["change"] = df[self.instrument].diff()
-        df["gain"] = df.change.mask(df.change < 0, 0.0)
-        df["loss"] = -df.change.mask(df.change > 0, -0.0)
-
-        df["avg_gain"] = df.gain.rolling(self.window).mean()
-        df["avg_loss"] = df.loss.rolling(self.window).mean()
+    def init_strategy(self):
+        self.rsi = StreamingRSI(self.window)
+        self.last_position = 0
+        self.define_strategy()  # seed the indicators with the warm-up bars
 
-        df["rsi"] = 100 - (100 / (1 + (df.avg_gain / df.avg_loss)))
-
-        df["position"] = np.where(df.rsi > self.buy_thresh, 1, np.nan)
-        df["position"] = np.where(df.rsi < df.short_thresh, -1, df.position)
-        df.position = df.position.ffill().fillna(0)
-
-        self.data = df.copy()
+    def define_strategy(self):
+        self.stream_bars(self.on_bar)
+
+    def on_bar(self, price):
+        rsi = self.rsi.update(price)
+        if rsi > self.buy_thresh:
+            self.last_position = 1
+        elif rsi < self.short_thresh:
+            self.last_position = -1
+        return {"rsi": rsi, "position": self.last_position}
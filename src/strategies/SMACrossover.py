@@ -1,6 +1,6 @@
 import string
-import numpy as np
 from strategies import ForexTrader
+from util.Indicators import SMA
 
 
 class SMACrossover(ForexTrader.ForexTrader):
@@ -13,16 +13,21 @@ class SMACrossover(ForexTrader.ForexTrader):
         duration: int,
         SMA_S=50,
         SMA_L=200,
+        **kwargs,
     ):
         self.SMA_S = SMA_S
         self.SMA_L = SMA_L
-        super().__init__(conf_file, instrument, bar_length, units, duration)
+        super().__init__(conf_file, instrument, bar_length, units, duration, **kwargs)
 
-    def define_strategy(self):
-        df = self.raw_data.copy()
+    def init_strategy(self):
+        self.sma_s = SMA(self.SMA_S)
+        self.sma_l = SMA(self.SMA_L)
+        self.define_strategy()  # seed the indicators with the warm-up bars
 
-        df["SMA_S"] = df[self.instrument].rolling(self.SMA_S).mean()
-        df["SMA_L"] = df[self.instrument].rolling(self.SMA_L).mean()
-        df["position"] = np.where(df["SMA_S"] > df["SMA_L"], 1, -1)
+    def define_strategy(self):
+        self.stream_bars(self.on_bar)
 
-        self.data = df.copy()
+    def on_bar(self, price):
+        sma_s = self.sma_s.update(price)
+        sma_l = self.sma_l.update(price)
+        return {"SMA_S": sma_s, "SMA_L": sma_l, "position": 1 if sma_s > sma_l else -1}
@@ -0,0 +1,322 @@
+"""Trains the direction DNN with a hyperparameter search and writes versioned artifacts.
+
+Replaces the interactive training.ipynb with a bounded, reproducible batch job. The feature
+and lag matrix (a util.FeatureMatrix) is built once and written as memory-mapped .npy files that every worker
+streams to Keras in batches; the trials (samples of the hl/hu/dropout/rate/regularize grid)
+run in a pool of CPU worker processes with early stopping on the validation loss. The best
+model is written with its normalization parameters to models/dnn-v<N>, e.g.
+
+    python training/pipeline.py --lags 5 --trials 24 --workers 4
+    python training/pipeline.py --grid '{"hl": [2, 3], "hu": [50, 100]}' --epochs 300
+
+Use the artifacts with strategies.DNN(model="models/dnn-v1/model.npz",
+pkl="models/dnn-v1/params.pkl") or backtesting.DNN(model="models/dnn-v1/model", ...); both
+take the lags and features of the model from params.pkl.
+"""
+import os
+import sys
+import json
+import time
+import pickle
+import random
+import shutil
+import hashlib
+import argparse
+import tempfile
+import multiprocessing
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROOT = os.path.dirname(SRC)
+sys.path.insert(0, SRC)
+
+from util import Calculations as calc  # noqa: E402
+from util.DNN import cw, create_model, set_seeds  # noqa: E402
+from util.NumpyModel import NumpyModel  # noqa: E402
+from util.FeatureMatrix import FeatureMatrix  # noqa: E402
+from backtesting.VectorizedBacktester import expand_grid  # noqa: E402
+
+FEATURES = ["returns", "dir", "sma", "mean_reversion", "min", "max", "mom", "vol", "macd", "rsi"]
+PARAM_GRID = {
+    "hl": [1, 2, 3],
+    "hu": [25, 50, 100],
+    "dropout": [False, True],
+    "rate": [0.1, 0.3],
+    "regularize": [False, True],
+}
+
+# dataset and settings of a worker process, set once by _init_worker
+_worker = {}
+
+
+# data ------------------------------------------------------------------------------------------
+
+
+def build_features(data, lags, features=FEATURES):
+    """The features of training.ipynb (util.Calculations with their default windows). Returns
+    the frame of the bars that have all lags and the FeatureMatrix of their lags 1 to lags
+    (the model inputs, in the order of "<feature>_lag_<lag>")."""
+    df = data[["price"]].copy()
+    df["returns"] = calc.returns(df.price)
+    df["dir"] = calc.dir(df.returns)
+    df["sma"] = calc.sma_crossover(df.price)
+    df["mean_reversion"] = calc.mean_reversion(df.price)
+    df["min"] = calc.min(df.price)
+    df["max"] = calc.min(df.price)  # calc.min, as in training.ipynb and the strategies
+    df["mom"] = calc.momentum(df.returns)
+    df["vol"] = calc.volume(df.returns)
+    df["macd"] = calc.macd(df.price)
+    df["rsi"] = calc.rsi(df.price)
+    df.dropna(inplace=True)
+    matrix = FeatureMatrix(df[features].to_numpy(), lags, features)
+    return df.iloc[lags:], matrix
+
+
+def write_dataset(df, matrix, directory, test_size=0.2, validation_size=0.2, batch_size=4096):
+    """Standardizes the model inputs with the mean and std of the training rows and writes
+    inputs, labels and class weights as .npy files to be memory-mapped by the workers. The
+    inputs are written batch by batch, the full matrix is never held in memory.
+
+    The rows are split in time order: train, then validation (the last validation_size of
+    the training rows, as validation_split did) and test (the last test_size of all rows).
+    """
+    split = int(len(df) * (1 - test_size))
+    fit = int(split * (1 - validation_size))
+    mean, std = matrix.moments(0, split, batch_size)
+
+    os.makedirs(directory, exist_ok=True)
+    paths = {name: os.path.join(directory, "{}.npy".format(name)) for name in ("x", "y", "w")}
+    x = np.lib.format.open_memmap(paths["x"], mode="w+", dtype="float32", shape=matrix.shape)
+    for i, rows in zip(range(0, len(matrix), batch_size), matrix.batches(batch_size, mean, std)):
+        x[i : i + len(rows)] = rows
+    x.flush()
+    del x
+    y = df["dir"].to_numpy(dtype="float32")
+    weights = cw(df.iloc[:fit])
+    np.save(paths["y"], y)
+    np.save(paths["w"], np.where(y == 1, weights[1], weights[0]).astype("float32"))
+    return {
+        "paths": paths,
+        "splits": {"train": (0, fit), "validation": (fit, split), "test": (split, len(df))},
+        "mean": pd.Series(mean, index=matrix.columns),
+        "std": pd.Series(std, index=matrix.columns),
+        "input_dim": matrix.shape[1],
+    }
+
+
+def batches(arrays, start, end, batch_size):
+    """Endless generator of (x, y, sample weight) batches of the rows start to end of the
+    memory-mapped arrays, in time order, as model.fit expects with steps_per_epoch."""
+    x, y, w = arrays
+    while True:
+        for i in range(start, end, batch_size):
+            j = min(i + batch_size, end)
+            yield np.asarray(x[i:j]), np.asarray(y[i:j]), np.asarray(w[i:j])
+
+
+def steps(start, end, batch_size):
+    return -(-(end - start) // batch_size)
+
+
+# search ----------------------------------------------------------------------------------------
+
+
+def sample_grid(param_grid, trials, seed):
+    """Combinations of param_grid (rate only varies with dropout), trials of them drawn at
+    random with seed, or all of them if trials is None."""
+    combinations = []
+    for params in expand_grid(param_grid):
+        if not params.get("dropout", True) and "rate" in params:
+            params["rate"] = param_grid["rate"][0]
+        if params not in combinations:
+            combinations.append(params)
+    if trials is not None and trials < len(combinations):
+        combinations = random.Random(seed).sample(combinations, trials)
+    return combinations
+
+
+def _init_worker(dataset, settings):
+    import tensorflow as tf
+
+    tf.config.threading.set_intra_op_parallelism_threads(settings["threads"])
+    tf.config.threading.set_inter_op_parallelism_threads(settings["threads"])
+    tf.config.experimental.enable_op_determinism()
+    arrays = tuple(np.load(dataset["paths"][name], mmap_mode="r") for name in ("x", "y", "w"))
+    _worker.update(dataset=dataset, settings=settings, arrays=arrays)
+
+
+def _run_trial(trial):
+    number, params = trial
+    dataset, settings, arrays = _worker["dataset"], _worker["settings"], _worker["arrays"]
+    return train_trial(arrays, dataset, params, settings, os.path.join(settings["workdir"], "trial-{}".format(number)))
+
+
+def train_trial(arrays, dataset, params, settings, path):
+    """Trains one combination with early stopping on the validation loss, keeps the weights of
+    the best epoch, saves the model to path and returns its metrics."""
+    from keras.callbacks import EarlyStopping
+
+    started = time.perf_counter()
+    set_seeds(settings["seed"])
+    model = create_model(**params, input_dim=dataset["input_dim"])
+    batch_size = settings["batch_size"]
+    (train_start, train_end), (val_start, val_end), (test_start, test_end) = (
+        dataset["splits"][name] for name in ("train", "validation", "test")
+    )
+    stop = EarlyStopping(monitor="val_loss", patience=settings["patience"], restore_best_weights=True)
+    history = model.fit(
+        batches(arrays, train_start, train_end, batch_size),
+        steps_per_epoch=steps(train_start, train_end, batch_size),
+        validation_data=batches(arrays, val_start, val_end, batch_size),
+        validation_steps=steps(val_start, val_end, batch_size),
+        epochs=settings["epochs"],
+        callbacks=[stop],
+        verbose=0,
+    )
+    test_loss, test_accuracy = model.evaluate(
+        batches(arrays, test_start, test_end, batch_size), steps=steps(test_start, test_end, batch_size), verbose=0
+    )
+    model.save(path)
+    losses = history.history["val_loss"]
+    best = int(np.argmin(losses))
+    return dict(
+        params,
+        val_loss=float(losses[best]),
+        val_accuracy=float(history.history["val_accuracy"][best]),
+        test_loss=float(test_loss),
+        test_accuracy=float(test_accuracy),
+        epochs=len(losses),
+        best_epoch=best + 1,
+        seconds=round(time.perf_counter() - started, 1),
+        path=path,
+    )
+
+
+def search(dataset, combinations, settings, workers):
+    """Runs every combination in a pool of workers processes. Returns the trials, best first."""
+    trials = list(enumerate(combinations))
+    if workers == 1:
+        _init_worker(dataset, settings)
+        rows = [_run_trial(trial) for trial in trials]
+        _worker.clear()
+    else:
+        # TensorFlow is not fork-safe: the workers start fresh interpreters
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(workers, initializer=_init_worker, initargs=(dataset, settings), maxtasksperchild=1) as pool:
+            rows = pool.map(_run_trial, trials, chunksize=1)
+    return pd.DataFrame(rows).sort_values("val_loss", ignore_index=True)
+
+
+# artifacts -------------------------------------------------------------------------------------
+
+
+def next_version(output):
+    """Path of the next models/dnn-v<N> directory."""
+    versions = [0]
+    if os.path.isdir(output):
+        for name in os.listdir(output):
+            if name.startswith("dnn-v") and name[5:].isdigit():
+                versions.append(int(name[5:]))
+    return os.path.join(output, "dnn-v{}".format(max(versions) + 1))
+
+
+def publish(results, dataset, metadata, output):
+    """Writes the best trial as a new version: the keras model, its NumPy copy (model.npz, no
+    TensorFlow needed to trade with it), params.pkl, the search results and metadata.json.
+    LATEST in output names the newest version."""
+    import keras
+
+    best = results.iloc[0]
+    version = next_version(output)
+    tmp = tempfile.mkdtemp(dir=output)
+    shutil.copytree(best.path, os.path.join(tmp, "model"))
+    NumpyModel.from_keras(keras.models.load_model(best.path)).save(os.path.join(tmp, "model.npz"))
+    hyperparameters = {name: _plain(best[name]) for name in metadata["param_grid"]}
+    with open(os.path.join(tmp, "params.pkl"), "wb") as f:
+        pickle.dump(
+            {
+                "mean": dataset["mean"],
+                "std": dataset["std"],
+                "lags": metadata["lags"],
+                "features": metadata["features"],
+                "hyperparameters": hyperparameters,
+            },
+            f,
+        )
+    results.drop(columns="path").to_csv(os.path.join(tmp, "search.csv"), index=False)
+    metadata = dict(metadata, version=os.path.basename(version), hyperparameters=hyperparameters)
+    metadata["metrics"] = {k: _plain(best[k]) for k in ("val_loss", "val_accuracy", "test_loss", "test_accuracy", "epochs")}
+    with open(os.path.join(tmp, "metadata.json"), "w") as f:
+        json.dump(metadata, f, indent=2)
+    os.replace(tmp, version)
+    with open(os.path.join(output, "LATEST"), "w") as f:
+        f.write(os.path.basename(version) + "\n")
+    return version
+
+
+def _plain(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def file_digest(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", default=os.path.join(ROOT, "data", "eur_usd-hourly.csv"))
+    parser.add_argument("--lags", type=int, default=5)
+    parser.add_argument("--features", nargs="+", default=FEATURES)
+    parser.add_argument("--grid", default=None, help="JSON param grid (default: PARAM_GRID)")
+    parser.add_argument("--trials", type=int, default=None, help="combinations sampled from the grid (default: all)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--threads", type=int, default=1, help="TensorFlow threads per worker")
+    parser.add_argument("--epochs", type=int, default=150, help="upper bound per trial")
+    parser.add_argument("--patience", type=int, default=10, help="epochs without a better val_loss")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=100)
+    parser.add_argument("--output", default=os.path.join(ROOT, "models"))
+    args = parser.parse_args()
+
+    param_grid = PARAM_GRID if args.grid is None else json.loads(args.grid)
+    combinations = sample_grid(param_grid, args.trials, args.seed)
+    data = pd.read_csv(args.data, parse_dates=["time"], index_col="time")
+    df, matrix = build_features(data, args.lags, args.features)
+    os.makedirs(args.output, exist_ok=True)
+
+    with tempfile.TemporaryDirectory(dir=args.output) as workdir:
+        dataset = write_dataset(df, matrix, os.path.join(workdir, "dataset"))
+        settings = {
+            "seed": args.seed,
+            "epochs": args.epochs,
+            "patience": args.patience,
+            "batch_size": args.batch_size,
+            "threads": args.threads,
+            "workdir": workdir,
+        }
+        print("{} rows x {} inputs, {} trials on {} workers".format(*matrix.shape, len(combinations), args.workers))
+        results = search(dataset, combinations, settings, min(args.workers, len(combinations)))
+        print(results.drop(columns="path").to_string())
+        metadata = {
+            "time": datetime.utcnow().isoformat() + "Z",
+            "data": os.path.abspath(args.data),
+            "data_sha1": file_digest(args.data),
+            "rows": {name: end - start for name, (start, end) in dataset["splits"].items()},
+            "lags": args.lags,
+            "features": args.features,
+            "param_grid": param_grid,
+            "settings": {k: v for k, v in settings.items() if k != "workdir"},
+        }
+        version = publish(results, dataset, metadata, args.output)
+    print("Saved {}".format(version))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import numpy as np
+import pandas as pd
+
+YEAR = 365.25 * 24 * 3600  # seconds
+
+
+def periods_per_year(index, mask=None):
+    """Number of bars per year of a DatetimeIndex, measured from the index itself (about 252
+    for daily stock bars, 6200 for hourly forex bars), falls back to 252 for a single bar.
+    With a (bars x strategies) boolean mask, returns the bars per year of the bars each
+    strategy keeps, as results.index of its test_strategy would measure them."""
+    if mask is None:
+        if len(index) < 2:
+            return 252.0
+        span = (index[-1] - index[0]).total_seconds()
+        return (len(index) - 1) * YEAR / span if span > 0 else 252.0
+    mask = np.asarray(mask, dtype=bool)
+    times = np.asarray(index.asi8)
+    first = times[mask.argmax(axis=0)]
+    last = times[len(mask) - 1 - mask[::-1].argmax(axis=0)]
+    span = (last - first) / 1e9
+    bars = mask.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where((bars > 1) & (span > 0), (bars - 1) * YEAR / span, 252.0)
+
+
+def strategy_returns(position, returns, tc=0.0):
+    """Log returns of holding position (set at the close of a bar, earning the return of the
+    next bar) minus tc per unit traded, like VectorizedBacktester.test_strategy. Arrays of shape
+    (bars,) or (bars, strategies); NaN positions are flat."""
+    position = np.nan_to_num(np.asarray(position, dtype="float64"))
+    returns = np.nan_to_num(np.asarray(returns, dtype="float64"))
+    strategy = np.zeros(np.broadcast_shapes(position.shape, returns.shape))
+    strategy[1:] = position[:-1] * returns[1:]
+    strategy[1:] -= np.abs(np.diff(position, axis=0)) * tc
+    return strategy
+
+
+def performance(strategy, position=None, periods=252.0, risk_free=0.0):
+    """Computes the performance metrics of one or many strategies in one vectorized pass.
+
+    Parameters
+    ----------
+    strategy: array-like
+        log returns of the strategies per bar, (bars,) or (bars, strategies); NaN marks bars
+        outside of a strategy's backtest (e.g. the warm-up of its indicators)
+    position: array-like
+        positions of the same shape, for exposure and trades
+    periods: float
+        bars per year used to annualize (see periods_per_year)
+    risk_free: float
+        annual risk-free rate subtracted for Sharpe and Sortino
+
+    Returns
+    -------
+    pd.Series or pd.DataFrame
+        the metrics of a single strategy, or one row per strategy: total_return, cagr,
+        annual_return, annual_volatility, sharpe, sortino, max_drawdown (a negative fraction),
+        max_drawdown_duration (in bars), calmar, exposure and trades
+    """
+    strategy = np.asarray(strategy, dtype="float64")
+    single = strategy.ndim == 1
+    if single:
+        strategy = strategy[:, None]
+    valid = ~np.isnan(strategy)
+    bars = valid.sum(axis=0)
+    r = np.where(valid, strategy, 0.0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        total = r.sum(axis=0)
+        mean = total / bars
+        std = np.sqrt(np.where(valid, (r - mean) ** 2, 0.0).sum(axis=0) / (bars - 1))
+        excess = mean - risk_free / periods
+        downside = np.sqrt((np.minimum(r - risk_free / periods, 0.0) ** 2 * valid).sum(axis=0) / bars)
+
+        # drawdowns of the equity curve starting at 1 (log 0) before the first bar
+        equity = np.cumsum(r, axis=0)
+        peak = np.maximum.accumulate(np.maximum(equity, 0.0), axis=0)
+        max_drawdown = np.expm1((equity - peak).min(axis=0))
+        steps = np.arange(1, len(r) + 1)[:, None]
+        last_peak = np.maximum.accumulate(np.where(equity >= peak, steps, 0), axis=0)
+        duration = (np.where(valid, steps - last_peak, 0)).max(axis=0)
+
+        cagr = np.expm1(total * periods / bars)
+        metrics = {
+            "total_return": np.expm1(total),
+            "cagr": cagr,
+            "annual_return": mean * periods,
+            "annual_volatility": std * np.sqrt(periods),
+            "sharpe": excess / std * np.sqrt(periods),
+            "sortino": excess / downside * np.sqrt(periods),
+            "max_drawdown": max_drawdown,
+            "max_drawdown_duration": duration,
+            "calmar": cagr / -max_drawdown,
+        }
+        if position is not None:
+            position = np.asarray(position, dtype="float64").reshape(strategy.shape)
+            held = np.nan_to_num(position)
+            metrics["exposure"] = ((held != 0) & valid).sum(axis=0) / bars
+            trades = np.zeros_like(held)
+            trades[1:] = np.abs(np.diff(held, axis=0))
+            metrics["trades"] = (trades * valid).sum(axis=0)
+
+    if single:
+        return pd.Series({name: value[0] for name, value in metrics.items()})
+    return pd.DataFrame(metrics)
+
+
+def round_trips(position, returns, index=None, tc=0.0):
+    """Extracts the trades (runs of the same non-zero position) by run-length encoding the
+    positions, for one strategy (bars,) or many (bars, strategies) at once.
+
+    A position set at bar entry earns the returns of the bars after it up to exit, the bar at
+    which it is changed (or the last bar if it is still open). tc is charged per unit on entry
+    and on exit.
+
+    Returns
+    -------
+    pd.DataFrame
+        one row per trade: strategy (column of position), entry, exit, position, bars,
+        log_return (net of tc), pnl (simple return), closed
+    """
+    position = np.nan_to_num(np.asarray(position, dtype="float64"))
+    returns = np.nan_to_num(np.asarray(returns, dtype="float64"))
+    if position.ndim == 1:
+        position = position[:, None]
+    returns = np.broadcast_to(returns.reshape(len(returns), -1), position.shape)
+    n, k = position.shape
+
+    earned = np.zeros_like(position)  # return earned by the position held at the end of a bar
+    earned[:-1] = position[:-1] * returns[1:]
+    flat_position = position.T.ravel()
+    cumulative = np.concatenate([[0.0], np.cumsum(earned.T.ravel())])
+
+    change = np.ones(n * k, dtype=bool)
+    change[1:] = flat_position[1:] != flat_position[:-1]
+    change[::n] = True  # every strategy starts a new run
+    starts = np.flatnonzero(change)
+    ends = np.r_[starts[1:], n * k]  # exclusive
+    held = flat_position[starts] != 0
+    starts, ends = starts[held], ends[held]
+
+    side = np.abs(flat_position[starts])
+    closed = ends % n != 0
+    log_return = cumulative[ends] - cumulative[starts] - tc * side * (1 + closed)
+    column, entry = np.divmod(starts, n)
+    exit = np.where(closed, ends % n, n - 1)
+    bars = exit - entry
+    if index is not None:
+        index = pd.Index(index)
+        entry, exit = index[entry], index[exit]
+    return pd.DataFrame(
+        {
+            "strategy": column,
+            "entry": entry,
+            "exit": exit,
+            "position": flat_position[starts],
+            "bars": bars,
+            "log_return": log_return,
+            "pnl": np.expm1(log_return),
+            "closed": closed,
+        }
+    )
@@ -0,0 +1,226 @@
+import numpy as np
+import pandas as pd
+
+
+class BarAggregator:
+    """Single-pass aggregation of ticks into OHLC bars with tick count and average spread.
+
+    Bars are labelled by their right edge like resample(bar_length, label="right"). A bar is
+    emitted as soon as a tick arrives past its boundary; bars without any ticks are filled
+    with the previous close and spread (and 0 ticks).
+    """
+
+    columns = ["open", "high", "low", "close", "ticks", "spread"]
+
+    def __init__(self, bar_length):
+        """
+        Parameters
+        ----------
+        bar_length: str or timedelta
+            length of the bars, e.g. "1min"
+        """
+        self.bar_length = pd.to_timedelta(bar_length).value
+        self.listeners = []  # aggregators of longer bars fed with every emitted bar
+        self.reset()
+
+    def __repr__(self):
+        return "BarAggregator(bar_length={})".format(pd.to_timedelta(self.bar_length))
+
+    def reset(self):
+        self.label = None  # right edge of the bar currently being built (ns)
+        self.open = self.high = self.low = self.close = None
+        self.ticks = 0
+        self.spread_sum = 0.0
+        self.last_spread = np.nan
+        self._labels = []
+        self._bars = []
+
+    @property
+    def pending(self):
+        """Number of completed bars that have not been popped yet."""
+        return len(self._bars)
+
+    def update(self, time: int, price: float, spread: float = np.nan):
+        """Adds a tick (time in nanoseconds since epoch) and returns True if a bar was completed."""
+        label = (time // self.bar_length + 1) * self.bar_length
+        if self.label is None:
+            self._start(label, price, 1, spread)
+            return False
+        if label <= self.label:
+            if price > self.high:
+                self.high = price
+            elif price < self.low:
+                self.low = price
+            self.close = price
+            self.ticks += 1
+            self.spread_sum += spread
+            return False
+        self._emit(self.label, self.open, self.high, self.low, self.close, self.ticks, self.spread_sum)
+        for empty in range(self.label + self.bar_length, label, self.bar_length):
+            self._emit(empty, self.close, self.close, self.close, self.close, 0, 0.0)
+        self._start(label, price, 1, spread)
+        return True
+
+    def add_bar(self, label: int, o, h, l, c, ticks, spread_sum):
+        """Folds a completed shorter bar (labelled by its right edge, a length dividing this
+        bar length) into the current bar; emits the bar when the shorter one closes it."""
+        target = -(-label // self.bar_length) * self.bar_length
+        if self.open is not None and target != self.label:  # the stream skipped the boundary
+            self._emit(self.label, self.open, self.high, self.low, self.close, self.ticks, self.spread_sum)
+            self.open = None
+        if self.open is None:
+            self.label = target
+            self.open, self.high, self.low, self.close = o, h, l, c
+            self.ticks, self.spread_sum = ticks, spread_sum
+        elif ticks:  # bars without ticks only repeat the previous close
+            if self.ticks:
+                self.high = max(self.high, h)
+                self.low = min(self.low, l)
+            else:
+                self.open, self.high, self.low = o, h, l
+            self.close = c
+            self.ticks += ticks
+            self.spread_sum += spread_sum
+        if label == target:
+            self._emit(self.label, self.open, self.high, self.low, self.close, self.ticks, self.spread_sum)
+            self.open = None
+
+    def _start(self, label, price, ticks, spread):
+        self.label = label
+        self.open = self.high = self.low = self.close = price
+        self.ticks = ticks
+        self.spread_sum = spread
+
+    def _emit(self, label, o, h, l, c, ticks, spread_sum):
+        if ticks:
+            self.last_spread = spread_sum / ticks
+        self._labels.append(label)
+        self._bars.append((o, h, l, c, ticks, self.last_spread))
+        for listener in self.listeners:
+            listener.add_bar(label, o, h, l, c, ticks, spread_sum)
+
+    def pop(self):
+        """Returns and clears the completed bars as a list of labels (ns) and a list of
+        (open, high, low, close, ticks, spread) tuples."""
+        labels, bars = self._labels, self._bars
+        self._labels = []
+        self._bars = []
+        return labels, bars
+
+    def pop_bars(self):
+        """Returns the completed bars as a DataFrame indexed by bar label and clears them."""
+        labels, bars = self.pop()
+        return pd.DataFrame(bars, index=pd.to_datetime(labels), columns=self.columns)
+
+    def aggregate(self, times, prices, spreads=None):
+        """Aggregates a whole history of ticks (sorted, times in nanoseconds) at once. Unlike
+        update(), bars without ticks are left out, as with resample(...).dropna()."""
+        times = np.asarray(times, dtype="int64")
+        prices = np.asarray(prices, dtype="float64")
+        spreads = np.full(len(prices), np.nan) if spreads is None else np.asarray(spreads, dtype="float64")
+        labels = (times // self.bar_length + 1) * self.bar_length
+        return _reduce(labels, prices, prices, prices, prices, np.ones(len(prices), dtype="int64"), spreads)
+
+
+class MultiBarAggregator:
+    """Builds bars of several lengths from one tick stream in a single pass.
+
+    Only the shortest bars are built from ticks; every longer length is folded from the
+    completed shorter bars, so a tick costs the same whatever the number of timeframes. All
+    lengths must be multiples of the shortest one.
+
+    Usage
+    -----
+    bars = MultiBarAggregator(["1min", "5min", "1h"])
+    bars.update(time, mid, ask - bid)
+    bars.pop_bars("5min")
+    """
+
+    def __init__(self, bar_lengths):
+        """
+        Parameters
+        ----------
+        bar_lengths: list
+            bar lengths (str or timedelta); the first is the main one (see pending)
+        """
+        self.bar_lengths = list(bar_lengths)
+        lengths = [pd.to_timedelta(length).value for length in self.bar_lengths]
+        base = min(lengths)
+        if any(length % base for length in lengths):
+            raise ValueError("All bar lengths must be multiples of the shortest one.")
+        if len(set(lengths)) != len(lengths):
+            raise ValueError("Bar lengths must be distinct.")
+        self.aggregators = {key: BarAggregator(length) for key, length in zip(self.bar_lengths, lengths)}
+        self.base = self.aggregators[self.bar_lengths[lengths.index(base)]]
+        self.base.listeners = [agg for agg in self.aggregators.values() if agg is not self.base]
+        self.main = self.aggregators[self.bar_lengths[0]]
+
+    def __repr__(self):
+        return "MultiBarAggregator(bar_lengths={})".format(self.bar_lengths)
+
+    def reset(self):
+        for aggregator in self.aggregators.values():
+            aggregator.reset()
+
+    @property
+    def pending(self):
+        """Number of completed bars of the main (first) bar length not popped yet."""
+        return self.main.pending
+
+    def update(self, time: int, price: float, spread: float = np.nan):
+        """Adds a tick; returns True if a bar of the shortest length was completed."""
+        return self.base.update(time, price, spread)
+
+    def pop(self, bar_length=None):
+        """BarAggregator.pop of bar_length (default: the main one)."""
+        return self.aggregators[self.bar_lengths[0] if bar_length is None else bar_length].pop()
+
+    def pop_bars(self, bar_length=None):
+        """Returns and clears the completed bars of bar_length (default: the main one)."""
+        return self.aggregators[self.bar_lengths[0] if bar_length is None else bar_length].pop_bars()
+
+    def aggregate(self, times, prices, spreads=None):
+        """Aggregates a whole history at once. Returns {bar_length: DataFrame}; the longer
+        bars are reduced from the shortest ones."""
+        base = self.base.aggregate(times, prices, spreads)
+        labels = base.index.asi8
+        spread_sums = (base.spread * base.ticks).to_numpy()
+        frames = {}
+        for key, aggregator in self.aggregators.items():
+            if aggregator is self.base:
+                frames[key] = base
+                continue
+            length = aggregator.bar_length
+            frames[key] = _reduce(
+                -(-labels // length) * length,
+                base.open.to_numpy(),
+                base.high.to_numpy(),
+                base.low.to_numpy(),
+                base.close.to_numpy(),
+                base.ticks.to_numpy(),
+                spread_sums,
+            )
+        return frames
+
+
+def _reduce(labels, o, h, l, c, ticks, spread_sums):
+    """Reduces consecutive rows with the same label into one bar (spread_sums are the sums
+    of the spreads of each row's ticks)."""
+    if not len(labels):
+        return pd.DataFrame(columns=BarAggregator.columns, index=pd.DatetimeIndex([]))
+    starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]])
+    ends = np.r_[starts[1:], len(labels)]
+    count = np.add.reduceat(ticks, starts)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        spread = np.add.reduceat(spread_sums, starts) / count
+    return pd.DataFrame(
+        {
+            "open": o[starts],
+            "high": np.maximum.reduceat(h, starts),
+            "low": np.minimum.reduceat(l, starts),
+            "close": c[ends - 1],
+            "ticks": count,
+            "spread": spread,
+        },
+        index=pd.to_datetime(labels[starts]),
+    )
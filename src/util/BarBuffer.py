@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+
+
+class BarBuffer:
+    """Preallocated columnar store of the most recent bars of a live trader (its raw_data).
+
+    Appending a bar writes one row into fixed NumPy arrays of twice the window; when they are
+    full the last window rows are moved to the front, so the cost per bar is constant
+    (amortized) and the memory does not grow with the length of the session. The DataFrame of
+    the window is only built when it is asked for, and kept until the next bar.
+    """
+
+    def __init__(self, columns, window=10_000):
+        """
+        Parameters
+        ----------
+        columns: list or dict
+            names of the columns of a bar, or {name: dtype} (default float64)
+        window: int
+            number of most recent bars to keep
+        """
+        dtypes = columns if isinstance(columns, dict) else dict.fromkeys(columns, "float64")
+        self.columns = list(dtypes)
+        self.window = window
+        self.capacity = 2 * window
+        self._times = np.empty(self.capacity, dtype="int64")  # nanoseconds since epoch (UTC)
+        self._values = {name: np.empty(self.capacity, dtype=dtype) for name, dtype in dtypes.items()}
+        self._start = 0
+        self._stop = 0
+        self._frame = None
+        self.count = 0  # total number of bars stored since the last load
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __repr__(self):
+        return "BarBuffer(window={}, bars={}, count={})".format(self.window, len(self), self.count)
+
+    def load(self, frame: pd.DataFrame):
+        """Replaces the buffer with the last window bars of frame (the columns of the buffer,
+        indexed by naive UTC bar times)."""
+        frame = frame.iloc[-self.window :]
+        n = len(frame)
+        self._times[:n] = frame.index.asi8
+        for name in self.columns:
+            self._values[name][:n] = frame[name].to_numpy()
+        self._start, self._stop = 0, n
+        self._frame = None
+        self.count = n
+
+    def append(self, time: int, row):
+        """Appends a bar. time is the bar label in nanoseconds since epoch, row the values in
+        the order of columns."""
+        if self._stop == self.capacity:
+            keep = self.window - 1
+            self._times[:keep] = self._times[self._stop - keep : self._stop]
+            for values in self._values.values():
+                values[:keep] = values[self._stop - keep : self._stop]
+            self._start, self._stop = 0, keep
+        i = self._stop
+        self._times[i] = time
+        for values, value in zip(self._values.values(), row):
+            values[i] = value
+        self._stop += 1
+        self._start = max(self._start, self._stop - self.window)
+        self._frame = None
+        self.count += 1
+
+    def times(self, last=None):
+        """Returns a view of the bar times (nanoseconds) of the window, or of its last bars."""
+        start = self._start if last is None else max(self._start, self._stop - last)
+        return self._times[start : self._stop]
+
+    def column(self, name: str, last=None):
+        """Returns a view of a column over the window, or over its last bars."""
+        start = self._start if last is None else max(self._start, self._stop - last)
+        return self._values[name][start : self._stop]
+
+    def frame(self, last=None):
+        """Returns the window (or its last bars) as a DataFrame indexed by bar time."""
+        if last is None and self._frame is not None:
+            return self._frame
+        frame = pd.DataFrame(
+            {name: self.column(name, last).copy() for name in self.columns},
+            index=pd.DatetimeIndex(self.times(last).copy()),
+        )
+        if last is None:
+            self._frame = frame
+        return frame
@@ -1,12 +1,13 @@
 import random
 import numpy as np
-import tensorflow as tf
-from keras.layers import Dense, Dropout
-from keras.models import Sequential
-from keras.regularizers import l1, l2
-from keras.optimizers import Adam
+
+# TensorFlow and keras are imported inside the functions: importing them takes seconds and
+# only training needs them.
+
 
 def set_seeds(seed=100):
+    import tensorflow as tf
+
     random.seed(seed)
     np.random.seed(seed)
     tf.random.set_seed(seed)
@@ -17,11 +18,19 @@ def cw(df):
     w1 = (1 / c1) * len(df) / 2
     return {0:w0, 1:w1}
 
-optimizer = Adam(lr=0.0001)
+def create_model(hl=2, hu=100, dropout=False, rate=0.3, regularize=False, reg=None, optimizer=None, input_dim=None):
+    """reg defaults to l1(0.0005) and optimizer to Adam with a learning rate of 0.0001."""
+    from keras.layers import Dense, Dropout
+    from keras.models import Sequential
+    from keras.regularizers import l1
+    from keras.optimizers import Adam
 
-def create_model(hl=2, hu=100, dropout=False, rate=0.3, regularize=False, reg=l1(0.0005), optimizer=optimizer, input_dim=None):
     if not regularize:
         reg = None
+    elif reg is None:
+        reg = l1(0.0005)
+    if optimizer is None:
+        optimizer = Adam(learning_rate=0.0001)
     model = Sequential()
     model.add(Dense(hu, input_dim=input_dim, activity_regularizer=reg, activation="relu"))
     if dropout:
@@ -32,4 +41,4 @@ def create_model(hl=2, hu=100, dropout=False, rate=0.3, regularize=False, reg=l1
             model.add(Dropout(rate, seed=100))
     model.add(Dense(1, activation="sigmoid"))
     model.compile(loss="binary_crossentropy", optimizer=optimizer, metrics=["accuracy"])
-    return model
\ No newline at end of file
+    return model
@@ -0,0 +1,206 @@
+import json
+import atexit
+import threading
+from collections import deque
+from dataclasses import dataclass, asdict, fields
+
+import pandas as pd
+
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+LEVEL_NAMES = {number: name for name, number in LEVELS.items()}
+
+
+@dataclass
+class TradeEvent:
+    time: str
+    instrument: str
+    action: str
+    units: float
+    price: float
+    pl: float = None
+    cum_pl: float = None
+
+    kind = "trade"
+
+    def message(self):
+        line = "{} | {} {} for {}".format(self.time, self.action, self.units, self.price)
+        if self.pl is not None:
+            line += " | P&L = {} | Cum P&L = {}".format(self.pl, self.cum_pl)
+        return line
+
+
+@dataclass
+class BarEvent:
+    time: str
+    instrument: str
+    close: float
+    high: float
+    low: float
+    ticks: int = None
+    open: float = None
+    spread: float = None
+
+    kind = "bar"
+
+    def message(self):
+        line = "{} | {} bar close = {} | high = {} | low = {} | ticks = {}".format(
+            self.time, self.instrument, self.close, self.high, self.low, self.ticks
+        )
+        if self.spread is not None:
+            line += " | spread = {:.5f}".format(self.spread)
+        return line
+
+
+@dataclass
+class SignalEvent:
+    time: str
+    instrument: str
+    position: int
+    action: str
+
+    kind = "signal"
+
+    def message(self):
+        return "{} | {} | {}".format(self.time, self.instrument, self.action)
+
+
+@dataclass
+class ErrorEvent:
+    time: str
+    error: str
+
+    kind = "error"
+
+    def message(self):
+        return "{} | ERROR | {}".format(self.time, self.error)
+
+
+@dataclass
+class MessageEvent:
+    time: str
+    text: str
+
+    kind = "message"
+
+    def message(self):
+        return self.text if self.time is None else "{} | {}".format(self.time, self.text)
+
+
+class EventLog:
+    """Structured, buffered log of trading events.
+
+    log() only appends the record to an in-memory columnar buffer (one deque per field and event
+    kind, holding the last max_events events of that kind) and to a queue; a background thread
+    formats the queued records for the console and appends them as JSON lines to path. Hot paths
+    therefore never wait on terminal or disk I/O, and a long session or many backtests sharing
+    the default log keep a bounded number of events in memory.
+    """
+
+    _default = None
+
+    def __init__(
+        self,
+        path: str = None,
+        level="INFO",
+        console_level="INFO",
+        flush_interval: float = 0.5,
+        max_events: int = 100_000,
+    ):
+        """
+        Parameters
+        ----------
+        path: str
+            JSONL file the events are appended to (None to keep them in memory only)
+        level: str
+            minimum level of the events that are recorded at all
+        console_level: str
+            minimum level of the events that are printed (None to print nothing)
+        flush_interval: float
+            seconds between flushes of the background thread
+        max_events: int
+            number of the most recent events of every kind kept for frame (None for all). The
+            file at path still receives every event.
+        """
+        self.path = path
+        self.level = LEVELS[level]
+        self.console_level = None if console_level is None else LEVELS[console_level]
+        self.flush_interval = flush_interval
+        self.max_events = max_events
+        self._columns = {}
+        self._lock = threading.Lock()  # log is called from the tick and the dispatcher threads
+        self._queue = deque()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name="EventLog", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    @classmethod
+    def default(cls):
+        """Returns the event log shared by backtesters and traders that are not given one."""
+        if cls._default is None:
+            cls._default = cls()
+        return cls._default
+
+    def __repr__(self):
+        with self._lock:
+            events = {kind: len(columns["time"]) for kind, columns in self._columns.items()}
+        return "EventLog(path={}, events={})".format(self.path, events)
+
+    def log(self, event, level="INFO"):
+        """Records an event. Cheap enough to call on every tick."""
+        level = LEVELS[level]
+        if level < self.level:
+            return
+        with self._lock:
+            columns = self._columns.get(event.kind)
+            if columns is None:
+                columns = self._columns[event.kind] = {f.name: deque(maxlen=self.max_events) for f in fields(event)}
+            for name, values in columns.items():
+                values.append(getattr(event, name))
+        self._queue.append((level, event))
+
+    def frame(self, kind: str):
+        """Returns the recorded events of one kind ("trade", "bar", "signal", ...) as a DataFrame."""
+        with self._lock:
+            columns = {name: list(values) for name, values in self._columns.get(kind, {}).items()}
+        return pd.DataFrame(columns)
+
+    def clear(self):
+        with self._lock:
+            self._columns = {}
+
+    def flush(self):
+        """Writes out all queued events now (also called from the background thread)."""
+        with self._flush_lock:
+            events = []
+            while self._queue:
+                events.append(self._queue.popleft())
+            if not events:
+                return
+            if self.console_level is not None:
+                lines = [event.message() for level, event in events if level >= self.console_level]
+                if lines:
+                    print("\n".join(lines), flush=True)
+            if self.path is not None:
+                with open(self.path, "a") as f:
+                    for level, event in events:
+                        record = dict(asdict(event), kind=event.kind, level=LEVEL_NAMES[level])
+                        f.write(json.dumps(record, default=str) + "\n")
+
+    def close(self):
+        """Stops the background thread after writing out the remaining events."""
+        self._stop = True
+        self._wakeup.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()
+
+    def _run(self):
+        while not self._stop:
+            self._wakeup.wait(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:  # never let a bad record kill the writer
+                print("EventLog flush failed: {}".format(e))
@@ -0,0 +1,85 @@
+import time
+import random
+import threading
+from datetime import datetime
+
+
+class FakeBroker:
+    """Local stand-in for the OANDA session (tpqoa) used to exercise order handling.
+
+    Orders fill at the current ask (buys) or bid (sells) after a configurable latency, and the
+    returned order has the fields of a tpqoa order (time, units, price, pl). pl is the profit
+    realized by the order, as reported by OANDA. Set fail_next to an exception to make the
+    next order fail with it, or reject_rate to reject a random share of the orders.
+    """
+
+    def __init__(self, latency: float = 0.0, bid: float = 1.0, ask: float = 1.0, reject_rate: float = 0.0, seed=None):
+        """
+        Parameters
+        ----------
+        latency: float
+            seconds every create_order call blocks, emulating the REST round trip
+        bid, ask: float
+            initial prices (update them with set_price)
+        reject_rate: float
+            probability that an order is rejected (raises RuntimeError)
+        seed: int
+            seed of the rejections
+        """
+        self.latency = latency
+        self.bid = bid
+        self.ask = ask
+        self.positions = {}  # instrument -> (units, average price)
+        self.orders = []
+        self.fail_next = None
+        self.reject_rate = reject_rate
+        self._random = random.Random(seed)
+        self.time = None  # time stamped on the orders (None: the current time)
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "FakeBroker(latency={}, positions={}, orders={})".format(
+            self.latency, self.positions, len(self.orders)
+        )
+
+    def set_price(self, bid: float, ask: float, time=None):
+        """Sets the prices the next orders fill at; a replay also passes the tick time."""
+        self.bid = bid
+        self.ask = ask
+        self.time = time
+
+    def create_order(self, instrument, units, suppress=False, ret=False, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.fail_next is not None:
+            error, self.fail_next = self.fail_next, None
+            raise error
+        if self.reject_rate and self._random.random() < self.reject_rate:
+            raise RuntimeError("Order rejected: {} {}".format(units, instrument))
+        with self._lock:
+            price = self.ask if units > 0 else self.bid
+            held, avg = self.positions.get(instrument, (0, 0.0))
+            pl = 0.0
+            if held * units < 0:  # (partly) closes the open position
+                closed = min(abs(units), abs(held)) * (1 if held > 0 else -1)
+                pl = closed * (price - avg)
+            new = held + units
+            if new == 0:
+                avg = 0.0
+            elif held * new <= 0:  # opened or reversed
+                avg = price
+            elif abs(new) > abs(held):  # added to the position
+                avg = (held * avg + units * price) / new
+            self.positions[instrument] = (new, avg)
+            order = {
+                "time": (datetime.utcnow() if self.time is None else self.time).isoformat() + "Z",
+                "instrument": instrument,
+                "units": str(units),
+                "price": str(price),
+                "pl": str(round(pl, 4)),
+            }
+            self.orders.append(order)
+        if not suppress:
+            print("\n\n", order, "\n")
+        if ret:
+            return order
@@ -0,0 +1,102 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from util.NumpyModel import NumpyModel
+
+
+class FeatureMatrix:
+    """Lagged features of a model as a strided view, without building a lag column per feature.
+
+    The features are stored once as a contiguous (bars x features) float array; row i of the
+    matrix holds lags 1 to lags of every feature for bar i + lags, in the column order
+    "<feature>_lag_<lag>" (feature by feature, lag 1 first) used in training. Rows are only
+    copied (and standardized) a batch at a time, so the memory needed for scoring does not
+    depend on the length of the history.
+
+    Usage
+    -----
+    matrix = FeatureMatrix(df[FEATURES].to_numpy(), lags=5, names=FEATURES)
+    prob = matrix.predict(model, mean[matrix.columns], std[matrix.columns])
+    df["prob"] = np.r_[np.full(matrix.lags, np.nan), prob]
+    """
+
+    def __init__(self, features, lags: int, names=None):
+        """
+        Parameters
+        ----------
+        features: array-like
+            (bars x features) values of the features
+        lags: int
+            number of lags of every feature
+        names: list
+            names of the features, for columns
+        """
+        self.features = np.ascontiguousarray(features, dtype="float64")
+        if self.features.ndim == 1:
+            self.features = self.features[:, None]
+        self.lags = lags
+        self.names = list(names) if names is not None else [str(i) for i in range(self.features.shape[1])]
+        # window i covers bars i to i + lags - 1, reversed so that lag 1 comes first
+        self._windows = sliding_window_view(self.features, lags, axis=0)[:-1, :, ::-1]
+
+    def __repr__(self):
+        return "FeatureMatrix(rows={}, features={}, lags={})".format(len(self), len(self.names), self.lags)
+
+    def __len__(self):
+        return len(self._windows)
+
+    @property
+    def shape(self):
+        return len(self), len(self.names) * self.lags
+
+    @property
+    def columns(self):
+        return ["{}_lag_{}".format(name, lag) for name in self.names for lag in range(1, self.lags + 1)]
+
+    def rows(self, start=0, stop=None, mean=None, std=None):
+        """Returns a copy of the rows start to stop as a (rows x features * lags) array,
+        standardized with mean and std (in the order of columns) if they are given."""
+        windows = self._windows[start:stop]
+        x = np.empty((len(windows), self.shape[1]))
+        x.reshape(windows.shape)[...] = windows
+        if mean is not None:
+            x -= np.asarray(mean, dtype="float64")
+            x /= np.asarray(std, dtype="float64")
+        return x
+
+    def batches(self, batch_size=4096, mean=None, std=None, start=0, stop=None):
+        """Yields the rows start to stop in batches of batch_size rows (see rows)."""
+        stop = len(self) if stop is None else min(stop, len(self))
+        for i in range(start, stop, batch_size):
+            yield self.rows(i, min(i + batch_size, stop), mean, std)
+
+    def moments(self, start=0, stop=None, batch_size=4096):
+        """Mean and standard deviation (ddof=1) of every column over the rows start to stop,
+        computed batch by batch."""
+        stop = len(self) if stop is None else min(stop, len(self))
+        n = stop - start
+        total = np.zeros(self.shape[1])
+        for x in self.batches(batch_size, start=start, stop=stop):
+            total += x.sum(axis=0)
+        mean = total / n
+        squares = np.zeros(self.shape[1])
+        for x in self.batches(batch_size, start=start, stop=stop):
+            x -= mean
+            squares += np.einsum("ij,ij->j", x, x)
+        return mean, np.sqrt(squares / (n - 1))
+
+    def predict(self, model, mean=None, std=None, batch_size=4096):
+        """Scores every row with model (a NumpyModel or a keras model) in batches of batch_size
+        rows and returns the first output per row. Rows with NaN features are NaN."""
+        prob = np.full(len(self), np.nan)
+        for i, x in zip(range(0, len(self), batch_size), self.batches(batch_size, mean, std)):
+            valid = ~np.isnan(x).any(axis=1)
+            if valid.any():
+                prob[i : i + len(x)][valid] = _predict(model, x[valid])
+        return prob
+
+
+def _predict(model, x):
+    if isinstance(model, NumpyModel):
+        return model.predict(x)[:, 0]
+    return np.asarray(model.predict_on_batch(x))[:, 0]
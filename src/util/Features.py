@@ -0,0 +1,217 @@
+import hashlib
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+
+
+class Feature:
+    """A named indicator column: compute(*inputs, **params) where inputs(**params) lists the
+    (feature, params) pairs it is computed from. Columns of the dataset (price, high, ...) are
+    features without inputs."""
+
+    def __init__(self, name: str, compute, inputs=None, **defaults):
+        self.name = name
+        self.compute = compute
+        self.inputs = inputs if inputs is not None else lambda **params: []
+        self.defaults = defaults
+
+    def __repr__(self):
+        return "Feature(name={}, defaults={})".format(self.name, self.defaults)
+
+
+class FeaturePipeline:
+    """Registry of features declared as a DAG, with memoized results.
+
+    Every distinct (dataset, feature, params) is computed once: the inputs of a feature go
+    through the same cache, so e.g. a MACD signal line, the MACD histogram and a sweep over
+    signal_smooth all reuse the same two EMAs. Results are kept in an LRU of at most
+    max_entries columns and max_bytes of values, so on long histories (a float64 column of 10M
+    bars is 80 MB) the cache holds fewer columns instead of more memory. Cached columns are
+    shared, treat them as read-only.
+
+    Usage
+    -----
+    features = FeaturePipeline.default().dataset(data)
+    sma = features.get("sma", window=50)
+    rsi = features.get("rsi", window=14)
+    """
+
+    _default = None
+
+    def __init__(self, max_entries: int = 128, max_bytes: int = 256 * 2**20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.features = {}
+        self._cache = OrderedDict()
+        self.nbytes = 0  # bytes of the cached values
+        self.hits = 0
+        self.misses = 0
+        for feature in DEFAULT_FEATURES:
+            self.register(feature)
+
+    @classmethod
+    def default(cls):
+        """Returns the pipeline shared by the backtesters of this process."""
+        if cls._default is None:
+            cls._default = cls()
+        return cls._default
+
+    def __repr__(self):
+        return "FeaturePipeline(features={}, cached={}, nbytes={}, hits={}, misses={})".format(
+            len(self.features), len(self._cache), self.nbytes, self.hits, self.misses
+        )
+
+    def register(self, feature: Feature):
+        self.features[feature.name] = feature
+
+    def dataset(self, data: pd.DataFrame):
+        """Returns a view of the features of data. data is hashed once here, so keep the view
+        for all lookups on the same data."""
+        return FeatureSet(self, data)
+
+    def get(self, data: pd.DataFrame, name: str, **params):
+        return self.dataset(data).get(name, **params)
+
+    def clear(self):
+        self._cache.clear()
+        self.nbytes = 0
+
+    def _lookup(self, key):
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return self._cache[key]
+        self.misses += 1
+        return None
+
+    def _store(self, key, value):
+        self._cache[key] = value
+        self.nbytes += _nbytes(value)
+        while self._cache and (len(self._cache) > self.max_entries or self.nbytes > self.max_bytes):
+            self.nbytes -= _nbytes(self._cache.popitem(last=False)[1])
+
+
+def _nbytes(value):
+    """Bytes of the values of a cached column (the index is shared with the dataset)."""
+    return int(np.sum(value.memory_usage(index=False)))
+
+
+class FeatureSet:
+    """Features of one dataset (see FeaturePipeline.dataset)."""
+
+    def __init__(self, pipeline: FeaturePipeline, data: pd.DataFrame):
+        self.pipeline = pipeline
+        self.data = data
+        self.key = dataset_key(data)
+
+    def __repr__(self):
+        return "FeatureSet(rows={}, key={})".format(len(self.data), self.key[:12])
+
+    def get(self, name: str, **params):
+        """Returns the feature as a Series aligned with the dataset."""
+        if name in self.data.columns and name not in self.pipeline.features:
+            return self.data[name]
+        feature = self.pipeline.features[name]
+        params = dict(feature.defaults, **params)
+        key = (self.key, name, tuple(sorted(params.items())))
+        value = self.pipeline._lookup(key)
+        if value is None:
+            inputs = [self.get(input_name, **input_params) for input_name, input_params in feature.inputs(**params)]
+            value = feature.compute(*inputs, **params)
+            self.pipeline._store(key, value)
+        return value
+
+
+def dataset_key(data: pd.DataFrame):
+    """Content hash of the index and the numeric columns of data."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(np.ascontiguousarray(data.index.asi8 if isinstance(data.index, pd.DatetimeIndex) else data.index).view("uint8"))
+    for col in data.columns:
+        values = data[col].to_numpy()
+        if values.dtype.kind in "biuf":
+            h.update(str(col).encode())
+            h.update(np.ascontiguousarray(values).view("uint8"))
+    return h.hexdigest()
+
+
+def _of(of="price", **params):
+    return [(of, {})]
+
+
+def _macd(ema_s, ema_l, **params):
+    return [("ema", {"span": ema_s}), ("ema", {"span": ema_l})]
+
+
+def _adx(name):
+    return lambda window, **params: [(name, {"window": window})]
+
+
+def _true_range(price, high, low, window):
+    tr = np.maximum(high - low, np.abs(high - price.shift(1)))
+    return np.maximum(tr, np.abs(low - price.shift(1)))
+
+
+DEFAULT_FEATURES = [
+    # price based
+    Feature("returns", lambda price, of: np.log(price / price.shift(1)), _of, of="price"),
+    Feature("change", lambda price, of: price.diff(), _of, of="price"),
+    Feature("sma", lambda x, of, window: x.rolling(window).mean(), _of, of="price"),
+    Feature("std", lambda x, of, window: x.rolling(window).std(), _of, of="price"),
+    Feature("rolling_max", lambda x, of, window: x.rolling(window).max(), _of, of="price"),
+    Feature("rolling_min", lambda x, of, window: x.rolling(window).min(), _of, of="price"),
+    Feature("ema", lambda x, of, span: x.ewm(span=span, adjust=False).mean(), _of, of="price"),
+    Feature(
+        "zscore",
+        lambda x, sma, std, of, window: (x - sma) / std,
+        lambda window, of="price": [(of, {}), ("sma", {"of": of, "window": window}), ("std", {"of": of, "window": window})],
+        of="price",
+    ),
+    # MACD
+    Feature("macd", lambda fast, slow, ema_s, ema_l: fast - slow, _macd),
+    Feature(
+        "macd_signal",
+        lambda macd, ema_s, ema_l, signal_smooth: macd.ewm(span=signal_smooth, adjust=False).mean(),
+        lambda ema_s, ema_l, signal_smooth: [("macd", {"ema_s": ema_s, "ema_l": ema_l})],
+    ),
+    Feature(
+        "macd_hist",
+        lambda macd, signal, ema_s, ema_l, signal_smooth: macd - signal,
+        lambda ema_s, ema_l, signal_smooth: [
+            ("macd", {"ema_s": ema_s, "ema_l": ema_l}),
+            ("macd_signal", {"ema_s": ema_s, "ema_l": ema_l, "signal_smooth": signal_smooth}),
+        ],
+    ),
+    # RSI (simple moving averages of gains and losses, as util.Calculations.rsi)
+    Feature("gain", lambda change: change.mask(change < 0, 0.0), lambda: [("change", {})]),
+    Feature("loss", lambda change: -change.mask(change > 0, -0.0), lambda: [("change", {})]),
+    Feature("avg_gain", lambda x, window: x.rolling(window).mean(), lambda window: [("gain", {})]),
+    Feature("avg_loss", lambda x, window: x.rolling(window).mean(), lambda window: [("loss", {})]),
+    Feature(
+        "rsi",
+        lambda avg_gain, avg_loss, window: 100 - (100 / (1 + (avg_gain / avg_loss))),
+        lambda window: [("avg_gain", {"window": window}), ("avg_loss", {"window": window})],
+    ),
+    # ADX over the rolling high and low of the price
+    Feature(
+        "pdm", lambda high, window: high - high.shift(1), lambda window: [("rolling_max", {"window": window})]
+    ),
+    Feature(
+        "ndm", lambda low, window: low.shift(1) - low, lambda window: [("rolling_min", {"window": window})]
+    ),
+    Feature(
+        "true_range",
+        _true_range,
+        lambda window: [("price", {}), ("rolling_max", {"window": window}), ("rolling_min", {"window": window})],
+    ),
+    Feature("s_tr", lambda x, window: x.rolling(window).mean(), _adx("true_range")),
+    Feature("s_pdm", lambda x, window: x.rolling(window).mean(), _adx("pdm")),
+    Feature("s_ndm", lambda x, window: x.rolling(window).mean(), _adx("ndm")),
+    Feature("pdi", lambda s_pdm, s_tr, window: (s_pdm / s_tr) * 100, lambda window: [("s_pdm", {"window": window}), ("s_tr", {"window": window})]),
+    Feature("ndi", lambda s_ndm, s_tr, window: (s_ndm / s_tr) * 100, lambda window: [("s_ndm", {"window": window}), ("s_tr", {"window": window})]),
+    Feature(
+        "dx",
+        lambda pdi, ndi, window: np.abs((pdi - ndi) / (pdi + ndi)),
+        lambda window: [("pdi", {"window": window}), ("ndi", {"window": window})],
+    ),
+    Feature("adx", lambda dx, window: dx.rolling(window).mean(), _adx("dx")),
+]
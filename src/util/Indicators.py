@@ -0,0 +1,173 @@
+import math
+from collections import deque
+
+nan = float("nan")
+
+
+class Indicator:
+    """Base class for streaming indicators that update in constant time per bar.
+
+    Each indicator mirrors the pandas expression used by the vectorized strategies so that
+    feeding the same prices one by one produces the same values as recomputing the full column.
+    """
+
+    def __init__(self):
+        self.value = nan
+
+    def update(self, x):
+        """Feeds the next value and returns the updated indicator value."""
+        raise NotImplementedError
+
+    def seed(self, values):
+        """Feeds a history of values (e.g. the warm-up bars) and returns the last indicator value."""
+        for x in values:
+            self.update(x)
+        return self.value
+
+    @property
+    def ready(self):
+        return not math.isnan(self.value)
+
+
+class EMA(Indicator):
+    """Exponential moving average, equivalent to price.ewm(span=span, adjust=False).mean()"""
+
+    def __init__(self, span):
+        super().__init__()
+        self.alpha = 2 / (span + 1)
+
+    def update(self, x):
+        if math.isnan(self.value):
+            self.value = x
+        else:
+            self.value += self.alpha * (x - self.value)
+        return self.value
+
+
+class SMA(Indicator):
+    """Simple moving average, equivalent to price.rolling(window).mean()"""
+
+    def __init__(self, window):
+        super().__init__()
+        self.window = window
+        self._values = deque()
+        self._sum = 0.0
+        self._comp = 0.0  # kahan compensation so the running sum does not drift over long sessions
+
+    def _add(self, x):
+        y = x - self._comp
+        t = self._sum + y
+        self._comp = (t - self._sum) - y
+        self._sum = t
+
+    def update(self, x):
+        self._values.append(x)
+        self._add(x)
+        if len(self._values) > self.window:
+            self._add(-self._values.popleft())
+        if len(self._values) == self.window:
+            self.value = self._sum / self.window
+        return self.value
+
+
+class RollingStd(Indicator):
+    """Rolling sample standard deviation, equivalent to price.rolling(window).std()"""
+
+    def __init__(self, window):
+        super().__init__()
+        self.window = window
+        self._values = deque()
+        self._mean = 0.0
+        self._m2 = 0.0
+
+    def update(self, x):
+        # windowed welford: add the new value, then remove the one falling out of the window
+        self._values.append(x)
+        n = len(self._values)
+        delta = x - self._mean
+        self._mean += delta / n
+        self._m2 += delta * (x - self._mean)
+        if n > self.window:
+            old = self._values.popleft()
+            n -= 1
+            delta = old - self._mean
+            self._mean -= delta / n
+            self._m2 -= delta * (old - self._mean)
+        if n == self.window and n > 1:
+            self.value = math.sqrt(max(self._m2, 0.0) / (n - 1))
+        return self.value
+
+
+class RollingMax(Indicator):
+    """Rolling maximum using a monotonic deque, equivalent to price.rolling(window).max()"""
+
+    def __init__(self, window):
+        super().__init__()
+        self.window = window
+        self._deque = deque()  # (bar, value) with decreasing values
+        self._bar = 0
+
+    def _dominates(self, old, new):
+        return old <= new
+
+    def update(self, x):
+        while self._deque and self._dominates(self._deque[-1][1], x):
+            self._deque.pop()
+        self._deque.append((self._bar, x))
+        if self._deque[0][0] <= self._bar - self.window:
+            self._deque.popleft()
+        self._bar += 1
+        if self._bar >= self.window:
+            self.value = self._deque[0][1]
+        return self.value
+
+
+class RollingMin(RollingMax):
+    """Rolling minimum using a monotonic deque, equivalent to price.rolling(window).min()"""
+
+    def _dominates(self, old, new):
+        return old >= new
+
+
+class RSI(Indicator):
+    """Relative strength index over simple averages of gains and losses, as in util.Calculations.rsi"""
+
+    def __init__(self, window=14):
+        super().__init__()
+        self.avg_gain = SMA(window)
+        self.avg_loss = SMA(window)
+        self._last = None
+
+    def update(self, x):
+        if self._last is not None:
+            change = x - self._last
+            gain = self.avg_gain.update(change if change > 0 else 0.0)
+            loss = self.avg_loss.update(-change if change < 0 else 0.0)
+            if loss > 0:
+                self.value = 100 - (100 / (1 + gain / loss))
+            elif gain > 0:
+                self.value = 100.0
+            else:
+                self.value = nan
+        self._last = x
+        return self.value
+
+
+class MACD(Indicator):
+    """MACD line and signal line. value holds the MACD line and signal the smoothed signal line."""
+
+    def __init__(self, ema_s=12, ema_l=26, signal_smooth=9):
+        super().__init__()
+        self.ema_s = EMA(ema_s)
+        self.ema_l = EMA(ema_l)
+        self.signal_ema = EMA(signal_smooth)
+        self.signal = nan
+
+    def update(self, x):
+        self.value = self.ema_s.update(x) - self.ema_l.update(x)
+        self.signal = self.signal_ema.update(self.value)
+        return self.value
+
+    @property
+    def histogram(self):
+        return self.value - self.signal
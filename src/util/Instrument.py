@@ -1,11 +1,37 @@
+import os
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import yfinance as yf
+
+from util.PriceCache import PriceCache
+from util.Plotting import pyplot
+
+# columns that keep float64 whatever the dtype: prices rounded to float32 flip indicator
+# crossings, and log returns are summed over the whole history (as in VectorizedBacktester)
+PRECISE_COLUMNS = ["price", "log_returns"]
 
 
 class Instrument:
-    def __init__(self, ticker, start, end, source_file=None, start_time=None, end_time=None, granularity="1d"):
+    def __init__(self, ticker, start, end, source_file=None, start_time=None, end_time=None, granularity="1d", cache=None, storage="memory", dtype="float64"):
+        """
+        Parameters
+        ----------
+        cache: PriceCache or False
+            cache for downloaded and parsed data (defaults to the shared PriceCache, False disables it)
+        storage: str
+            "memory" keeps a DataFrame in RAM and get_data returns copies of it. "memmap" keeps the
+            columns memory-mapped from the cache files and get_data returns read-only views, so
+            histories larger than RAM can be backtested.
+        dtype: str
+            "float32" stores the auxiliary columns of the data (e.g. the spread of
+            detailed.csv) in single precision, halving their memory and cache files. Prices
+            and log returns stay float64, so data with only a price column is unchanged.
+        """
+        if storage not in ("memory", "memmap"):
+            raise ValueError("storage must be 'memory' or 'memmap'")
+        if storage == "memmap" and cache is False:
+            raise ValueError("memmap storage needs a cache to map the data from")
+        if dtype not in ("float64", "float32"):
+            raise ValueError("dtype must be 'float64' or 'float32'")
         self._ticker = ticker
         self._start = start
         self._end = end
@@ -14,6 +40,9 @@ class Instrument:
         self.start_time=start_time
         self.end_time=end_time
         self.granularity=granularity
+        self.cache = PriceCache.default() if cache is None else cache
+        self.storage = storage
+        self.dtype = dtype
         self.get_data()
         self.log_returns()
 
@@ -46,40 +75,87 @@ class Instrument:
 
     # PROPERTIES END
     def get_data(self):
+        mmap = self.storage == "memmap"
+        compact = () if self.dtype == "float64" else (self.dtype,)  # float64 keeps the old cache keys
         if self.source_file is None:
-            data = yf.download(self._ticker, self._start, self._end, interval=self.granularity).Close.to_frame()
-            data.rename(columns={"Close": "price"}, inplace=True)
-            self._data = data
+            if not self.cache or self._start is None or self._end is None:
+                self._data = self._download(self._start, self._end)
+            else:
+                key = (self._ticker, self.granularity, "yfinance") + compact
+                self._data = self.cache.load(key, self._download, self._start, self._end, mmap=mmap)
         else:
-            data = pd.read_csv(self.source_file, parse_dates=["time"], index_col="time")
-            if self.start_time is not None and self.end_time is not None:
-                data = data.loc[(data.index.hour > self.start_time) & (data.index.hour < self.end_time)]
-            if self.granularity is not None:
-                data = data.resample(self.granularity, label="right").last().dropna().iloc[:-1]
-            self._data = data
-            self._data.index = self._data.index.tz_localize("UTC").tz_convert("America/New_York")
-        return self._data.copy()
+            if not self.cache:
+                self._data = self._read_csv(self.source_file)
+            else:
+                granularity = self.granularity
+                if self.start_time is not None and self.end_time is not None:
+                    granularity = "{}@{}-{}".format(granularity, self.start_time, self.end_time)
+                key = (self._ticker, granularity, os.path.abspath(self.source_file)) + compact
+                self._data = self.cache.load_file(key, self.source_file, self._read_csv, mmap=mmap)
+        return self._data.copy(deep=not mmap)
+
+    def get_arrays(self):
+        """Returns the index (as int64 nanoseconds since epoch, UTC) and every column as NumPy
+        arrays. With memmap storage these are read-only views of the mapped files."""
+        arrays = {"time": self._data.index.asi8}
+        arrays.update({col: self._data[col].to_numpy() for col in self._data.columns})
+        return arrays
+
+    def _download(self, start, end):
+        import yfinance as yf  # only needed when nothing is cached
+
+        data = yf.download(self._ticker, start, end, interval=self.granularity).Close.to_frame()
+        data.rename(columns={"Close": "price"}, inplace=True)
+        return self._cast(data)
+
+    def _read_csv(self, source_file):
+        data = pd.read_csv(source_file, parse_dates=["time"], index_col="time")
+        if self.start_time is not None and self.end_time is not None:
+            data = data.loc[(data.index.hour > self.start_time) & (data.index.hour < self.end_time)]
+        if self.granularity is not None:
+            data = data.resample(self.granularity, label="right").last().dropna().iloc[:-1]
+        if data.index.tz is None:
+            data.index = data.index.tz_localize("UTC")
+        data.index = data.index.tz_convert("America/New_York")
+        return self._cast(data)
+
+    def _cast(self, data):
+        """Downcasts the float64 columns except the prices to dtype."""
+        columns = [c for c in data.columns if c not in PRECISE_COLUMNS and data[c].dtype == "float64"]
+        if self.dtype == "float64" or not columns:
+            return data
+        return data.astype({c: self.dtype for c in columns})
 
     def log_returns(self):
+        if self.storage == "memmap":
+            return  # keep _data a view of the mapped files, returns() computes them on demand
         self._data["log_returns"] = np.log(self._data.price / self._data.price.shift(1))
 
+    def returns(self):
+        """Returns the log returns of the price."""
+        if "log_returns" in self._data:
+            return self._data.log_returns
+        return np.log(self._data.price / self._data.price.shift(1))
+
     def plot_prices(self):
+        plt = pyplot()
         self._data.price.plot(figsize=(12, 8))
         plt.title("Price Chart: {}".format(self._ticker), fontsize=13)
 
     def plot_returns(self, kind="ts"):
+        plt = pyplot()
         if kind == "ts":
-            self._data.log_returns.plot(figsize=(12, 8))
+            self.returns().plot(figsize=(12, 8))
             plt.title("Returns: {}".format(self._ticker), fontsize=15)
         elif kind == "hist":
-            self._data.log_returns.hist(
+            self.returns().hist(
                 figsize=(12, 8), bins=int(np.sqrt(len(self._data)))
             )
             plt.title("Frequency of Returns: {}".format(self._ticker), fontsize=15)
 
     def mean_return(self, freq=None):
         if freq is None:
-            return self._data.log_returns.mean()
+            return self.returns().mean()
         else:
             resampled_price = self._data.price.resample(freq).last()
             resampled_returns = np.log(resampled_price / resampled_price.shift(1))
@@ -87,13 +163,13 @@ class Instrument:
 
     def std_returns(self, freq=None):
         if freq is None:
-            return self._data.log_returns.std()
+            return self.returns().std()
         else:
             resampled_price = self._data.price.resample(freq).last()
             resampled_returns = np.log(resampled_price / resampled_price.shift(1))
             return resampled_returns.std()
 
     def annualized_performance(self):
-        mean_return = round(self._data.log_returns.mean() * 252, 3)
-        risk = round(self._data.log_returns.std() * np.sqrt(252), 3)
+        mean_return = round(self.returns().mean() * 252, 3)
+        risk = round(self.returns().std() * np.sqrt(252), 3)
         print("Return: {} | Risk: {}".format(mean_return, risk))
\ No newline at end of file
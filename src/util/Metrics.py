@@ -0,0 +1,244 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SUB_BITS = 7  # 2**SUB_BITS linear sub-buckets per power of 2: values within 1/64 (1.6%)
+HALF = 1 << (SUB_BITS - 1)
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+class LatencyHistogram:
+    """HDR-style histogram of durations in nanoseconds.
+
+    Values below 2**SUB_BITS ns are counted exactly; above, every power of 2 is split into 64
+    linear buckets, so percentiles are accurate to 1.6% whatever the range, in a fixed few
+    KB. record() is a couple of integer operations and a list increment.
+    """
+
+    def __init__(self):
+        self.counts = [0] * ((64 - SUB_BITS + 2) * HALF)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def __repr__(self):
+        return "LatencyHistogram(count={}, mean_us={:.1f})".format(self.count, self.mean() / 1e3)
+
+    def record(self, ns: int):
+        ns = int(ns) if ns > 0 else 0
+        bits = ns.bit_length()
+        if bits <= SUB_BITS:
+            self.counts[ns] += 1
+        else:
+            shift = bits - SUB_BITS
+            self.counts[shift * HALF + (ns >> shift)] += 1
+        self.count += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+        if self.min is None or ns < self.min:
+            self.min = ns
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, q: float):
+        """Returns the upper bound (ns) of the bucket holding the q-th percentile."""
+        if not self.count:
+            return 0
+        rank = max(1, -(-self.count * q // 100))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(_upper(index), self.max)
+        return self.max
+
+    def merge(self, other):
+        for index, n in enumerate(other.counts):
+            if n:
+                self.counts[index] += n
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+
+    def reset(self):
+        self.__init__()
+
+    def snapshot(self):
+        """count, mean, min, max and percentiles, in microseconds."""
+        snapshot = {
+            "count": self.count,
+            "mean_us": self.mean() / 1e3,
+            "min_us": (self.min or 0) / 1e3,
+            "max_us": self.max / 1e3,
+        }
+        for q in PERCENTILES:
+            snapshot["p{}_us".format(q).replace(".", "_")] = self.percentile(q) / 1e3
+        return snapshot
+
+
+def _upper(index):
+    if index < 1 << SUB_BITS:
+        return index
+    shift = index // HALF - 1
+    return ((index - shift * HALF + 1) << shift) - 1
+
+
+class Counter:
+    """Monotonic count of events with its rate since the counter was created or reset."""
+
+    def __init__(self):
+        self.reset()
+
+    def __repr__(self):
+        return "Counter(count={})".format(self.count)
+
+    def inc(self, n: int = 1):
+        self.count += n
+
+    def reset(self):
+        self.count = 0
+        self.started = time.monotonic()
+
+    def snapshot(self):
+        elapsed = time.monotonic() - self.started
+        return {"count": self.count, "per_s": self.count / elapsed if elapsed > 0 else 0.0}
+
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.record(time.perf_counter_ns() - self.start)
+
+
+class Metrics:
+    """In-process registry of latency histograms and counters of the live trader.
+
+    The hot paths record into plain Python objects without locks or I/O (a record costs well
+    under a microsecond), so the metrics can stay on in production. They are read through
+    snapshot(), written to a JSON file with dump()/dump_every() or served as JSON over HTTP
+    with serve().
+
+    Usage
+    -----
+    metrics = Metrics.default()
+    with metrics.timer("define_strategy"):
+        ...
+    metrics.counter("ticks").inc()
+    metrics.snapshot()["histograms"]["define_strategy"]["p99_us"]
+    """
+
+    _default = None
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.started = datetime.utcnow()
+        self._lock = threading.Lock()  # only guards creating metrics
+        self._server = None
+        self._dumper = None
+
+    @classmethod
+    def default(cls):
+        """Returns the metrics shared by the traders and dispatchers of this process."""
+        if cls._default is None:
+            cls._default = cls()
+        return cls._default
+
+    def __repr__(self):
+        return "Metrics(histograms={}, counters={})".format(list(self.histograms), list(self.counters))
+
+    def histogram(self, name: str):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, LatencyHistogram())
+        return histogram
+
+    def counter(self, name: str):
+        counter = self.counters.get(name)
+        if counter is None:
+            with self._lock:
+                counter = self.counters.setdefault(name, Counter())
+        return counter
+
+    def timer(self, name: str):
+        """Context manager recording the duration of its block in the histogram name."""
+        return _Timer(self.histogram(name))
+
+    def reset(self):
+        for metric in list(self.histograms.values()) + list(self.counters.values()):
+            metric.reset()
+
+    def snapshot(self):
+        return {
+            "time": datetime.utcnow().isoformat() + "Z",
+            "started": self.started.isoformat() + "Z",
+            "counters": {name: counter.snapshot() for name, counter in list(self.counters.items())},
+            "histograms": {name: histogram.snapshot() for name, histogram in list(self.histograms.items())},
+        }
+
+    def dump(self, path: str):
+        """Writes the snapshot to path as JSON (replacing the file atomically)."""
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp, path)
+
+    def dump_every(self, path: str, interval: float = 10.0):
+        """Dumps the snapshot to path every interval seconds from a daemon thread."""
+
+        def run():
+            while not stop.wait(interval):
+                try:
+                    self.dump(path)
+                except OSError as e:
+                    print("Metrics dump failed: {}".format(e))
+
+        stop = threading.Event()
+        self._dumper = stop
+        threading.Thread(target=run, name="MetricsDump", daemon=True).start()
+
+    def serve(self, port: int = 9100, host: str = "127.0.0.1"):
+        """Serves the snapshot as JSON on http://host:port/ from a daemon thread. Returns the
+        server (its server_address has the port when port=0)."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = json.dumps(metrics.snapshot()).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="MetricsServer", daemon=True).start()
+        return self._server
+
+    def close(self):
+        """Stops the HTTP server and the periodic dump."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._dumper is not None:
+            self._dumper.set()
+            self._dumper = None
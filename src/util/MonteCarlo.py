@@ -0,0 +1,190 @@
+import os
+import numpy as np
+import pandas as pd
+from multiprocessing import Pool
+
+from util import Analytics
+
+QUANTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+
+# returns resampled by a worker process, set once by _init_worker
+_worker = {}
+
+
+def _init_worker(blocks):
+    _worker["blocks"] = blocks
+
+
+def _run_chunk(task):
+    return _simulate(_worker["blocks"], *task)
+
+
+def _summarize(returns, length):
+    """Sums, sums of squares, lowest and highest cumulative return and max drawdown (in log
+    returns, from the start of the block) of every block of length consecutive returns."""
+    windows = np.lib.stride_tricks.sliding_window_view(returns, length)
+    cumulative = np.cumsum(windows, axis=1)
+    peak = np.maximum(np.maximum.accumulate(cumulative, axis=1), 0.0)
+    return (
+        cumulative[:, -1],
+        np.einsum("ij,ij->i", windows, windows),
+        cumulative.min(axis=1),
+        cumulative.max(axis=1),
+        (peak - cumulative).max(axis=1),
+    )
+
+
+def _blocks(returns, block):
+    """Summaries of all blocks of the returns (see _summarize) and of all shorter blocks that
+    end a path whose length is not a multiple of block."""
+    count = -(-len(returns) // block)
+    tail = len(returns) - (count - 1) * block
+    return _summarize(returns, block), _summarize(returns, tail), count, len(returns)
+
+
+def _simulate(blocks, kind, size, seed):
+    """Draws size paths of blocks of the returns and returns their final performance, max
+    drawdown and Sharpe ratio (per bar, not annualized).
+
+    A path is never materialized bar by bar: its drawdown is combined from the summaries of
+    its blocks, so the cost is proportional to the number of blocks, not of bars.
+    """
+    rng = np.random.default_rng(seed)
+    full, tail, count, n = blocks
+    if kind == "shuffle":  # every block (return) once, in random order
+        index = rng.permuted(np.broadcast_to(np.arange(count), (size, count)), axis=1)
+        parts = [np.take(values, index) for values in full]
+    else:  # blocks starting at random bars, the last one cut to the length of the returns
+        index = rng.integers(0, len(full[0]), (size, count - 1))
+        last = rng.integers(0, len(tail[0]), (size, 1))
+        parts = [np.hstack([np.take(f, index), np.take(t, last)]) for f, t in zip(full, tail)]
+    total, squares, low, high, drawdown = parts
+
+    start = np.cumsum(total, axis=1) - total  # cumulative return before every block
+    peak = np.maximum.accumulate(start + high, axis=1)
+    peak[:, 1:] = peak[:, :-1]  # highest cumulative return before every block
+    peak[:, 0] = 0.0
+    np.maximum(peak, 0.0, out=peak)
+    max_drawdown = np.maximum(peak - start - low, drawdown).max(axis=1)
+
+    final = total.sum(axis=1)
+    mean = final / n
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sharpe = mean / np.sqrt((squares.sum(axis=1) - n * mean**2) / (n - 1))
+    return np.exp(final), np.expm1(-max_drawdown), sharpe
+
+
+class MonteCarlo:
+    """Monte Carlo robustness test of a finished backtest.
+
+    Resamples the bar returns of the strategy (block bootstrap) or the sequence of its trades
+    (shuffle or resample with replacement) into thousands of alternative paths and reports
+    the distribution of their final performance and max drawdown. The paths are drawn and
+    evaluated as 2-D arrays of blocks (see _simulate) in chunks of at most max_elements
+    blocks, optionally spread over a process pool; the result only depends on the seed, not
+    on the number of processes.
+
+    Usage
+    -----
+    backtester.test_strategy()
+    mc = MonteCarlo(backtester.results, tc=backtester.tc, seed=42)
+    mc.bootstrap(10000)
+    mc.summary()
+    """
+
+    def __init__(self, results: pd.DataFrame, tc: float = 0.0, seed=None, max_elements: int = 4_000_000):
+        """
+        Parameters
+        ----------
+        results: pd.DataFrame
+            results of a VectorizedBacktester (columns strategy, position and log_returns)
+        tc: float
+            transaction costs of the backtest, charged on the trades of trade simulations
+        seed: int
+            seed of the random paths
+        max_elements: int
+            maximum number of blocks of the paths drawn at once
+        """
+        self.results = results
+        self.tc = tc
+        self.seed = seed
+        self.max_elements = max_elements
+        self.returns = results.strategy.to_numpy(dtype="float64")
+        self.periods = Analytics.periods_per_year(results.index)
+        self.paths = None
+        self.actual = None
+
+    def __repr__(self):
+        return "MonteCarlo(bars={}, paths={})".format(
+            len(self.returns), None if self.paths is None else len(self.paths)
+        )
+
+    @property
+    def trades(self):
+        """Log returns of the round trips of the backtest (see util.Analytics.round_trips)."""
+        trades = Analytics.round_trips(
+            self.results.position.to_numpy(), self.results.log_returns.to_numpy(), tc=self.tc
+        )
+        return trades.log_return.to_numpy()
+
+    def bootstrap(self, paths: int = 10000, block: int = None, processes: int = 1):
+        """Block bootstrap of the bar returns. Blocks of consecutive bars (default: the cube
+        root of the number of bars) keep the autocorrelation of volatility and of the
+        positions within them."""
+        block = block or max(1, round(len(self.returns) ** (1 / 3)))
+        return self._run(self.returns, "bootstrap", paths, block, processes, annualize=True)
+
+    def shuffle_trades(self, paths: int = 10000, replace: bool = False, processes: int = 1):
+        """Reorders the trades (or draws them with replacement, which also varies the final
+        performance) to test how much the drawdown depends on their order."""
+        return self._run(self.trades, "resample" if replace else "shuffle", paths, 1, processes, annualize=False)
+
+    def _run(self, returns, kind, paths, block, processes, annualize):
+        if len(returns) < max(block, 2):
+            raise ValueError("Not enough returns to resample ({} < {}).".format(len(returns), max(block, 2)))
+        blocks = _blocks(returns, block)
+        chunk = max(1, self.max_elements // blocks[2])
+        sizes = [min(chunk, paths - start) for start in range(0, paths, chunk)]
+        seeds = np.random.SeedSequence(self.seed).spawn(len(sizes))
+        tasks = [(kind, size, seed) for size, seed in zip(sizes, seeds)]
+        processes = processes or os.cpu_count()
+        if processes == 1 or len(tasks) == 1:
+            chunks = [_simulate(blocks, *task) for task in tasks]
+        else:
+            with Pool(processes, initializer=_init_worker, initargs=(blocks,)) as pool:
+                chunks = pool.map(_run_chunk, tasks)
+
+        self.paths = self._frame(*(np.concatenate(values) for values in zip(*chunks)), annualize)
+        cumulative = np.cumsum(returns)
+        peak = np.maximum(np.maximum.accumulate(cumulative), 0.0)
+        self.actual = self._frame(
+            [np.exp(cumulative[-1])],
+            [np.expm1((cumulative - peak).min())],
+            [returns.mean() / returns.std(ddof=1)],
+            annualize,
+        ).iloc[0]
+        return self.paths
+
+    def _frame(self, perf, max_drawdown, sharpe, annualize):
+        frame = pd.DataFrame({"perf": perf, "max_drawdown": max_drawdown})
+        if annualize:
+            frame["sharpe"] = np.asarray(sharpe) * np.sqrt(self.periods)
+        return frame
+
+    def summary(self, quantiles=QUANTILES):
+        """Quantiles and mean of the metrics of the last simulation, next to the metrics of the
+        actual backtest (row actual) and the share of paths that do worse (row worse)."""
+        if self.paths is None:
+            return "Run bootstrap() or shuffle_trades() first."
+        summary = self.paths.quantile(list(quantiles))
+        summary.index = ["q{:g}".format(q * 100) for q in quantiles]
+        summary.loc["mean"] = self.paths.mean()
+        summary.loc["actual"] = self.actual
+        summary.loc["worse"] = (self.paths < self.actual).mean()
+        return summary
+
+    def probability_of_loss(self):
+        """Share of the simulated paths that end below the initial capital."""
+        if self.paths is None:
+            return "Run bootstrap() or shuffle_trades() first."
+        return (self.paths.perf < 1).mean()
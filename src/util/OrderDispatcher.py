@@ -0,0 +1,121 @@
+import time
+import threading
+from collections import OrderedDict
+from util.Metrics import Metrics
+
+GOING = {1: "GOING LONG", -1: "GOING SHORT", 0: "GOING NEUTRAL"}
+
+
+class OrderDispatcher:
+    """Sends orders to the broker from a worker thread.
+
+    Callers only submit the target position per instrument. The worker turns the difference
+    between the target and the position confirmed by the broker into a single market order
+    (so a reversal is one order for twice the units), tracks the fill and updates the
+    confirmed position. Targets submitted while an order is in flight are coalesced: only the
+    latest target per instrument is executed.
+
+    The time targets wait for the worker (order_queue) and the broker round trip of every
+    order (order_round_trip) are recorded in metrics, along with the orders and order_errors
+    counters.
+    """
+
+    def __init__(self, broker, on_fill=None, on_error=None, synchronous=False, metrics: Metrics = None):
+        """
+        Parameters
+        ----------
+        broker: object
+            anything with tpqoa's create_order(instrument, units, suppress=True, ret=True)
+        on_fill: callable
+            called as on_fill(instrument, order, going) after every filled order
+        on_error: callable
+            called as on_error(instrument, exception, confirmed_position) if an order fails
+        synchronous: bool
+            execute orders in the calling thread (replays and tests)
+        metrics: Metrics
+            defaults to the shared Metrics
+        """
+        self.broker = broker
+        self.on_fill = on_fill
+        self.on_error = on_error
+        self.synchronous = synchronous
+        self.metrics = Metrics.default() if metrics is None else metrics
+        self._queue_latency = self.metrics.histogram("order_queue")
+        self._round_trip = self.metrics.histogram("order_round_trip")
+        self._orders = self.metrics.counter("orders")
+        self._errors = self.metrics.counter("order_errors")
+        self.positions = {}  # position confirmed by the broker
+        self._pending = OrderedDict()  # instrument -> (target, units, submitted)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._busy = False
+        self._stop = False
+        self._thread = None
+        if not synchronous:
+            self._thread = threading.Thread(target=self._run, name="OrderDispatcher", daemon=True)
+            self._thread.start()
+
+    def __repr__(self):
+        return "OrderDispatcher(positions={}, pending={})".format(self.positions, dict(self._pending))
+
+    def submit(self, instrument: str, target: int, units: int):
+        """Requests a position of target * units in instrument. Returns immediately unless
+        the dispatcher is synchronous."""
+        if self.synchronous:
+            self._execute(instrument, target, units)
+            return
+        with self._wakeup:
+            self._pending.pop(instrument, None)
+            # replaces a target not sent yet
+            self._pending[instrument] = (target, units, time.perf_counter_ns())
+            self._wakeup.notify()
+
+    def wait(self, timeout: float = None):
+        """Blocks until every submitted target has been executed. Returns False on timeout."""
+        with self._wakeup:
+            return self._wakeup.wait_for(lambda: not self._pending and not self._busy, timeout)
+
+    def close(self):
+        """Executes the remaining targets and stops the worker."""
+        if self._thread is None:
+            return
+        self.wait()
+        with self._wakeup:
+            self._stop = True
+            self._wakeup.notify_all()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                self._wakeup.wait_for(lambda: self._pending or self._stop)
+                if self._stop and not self._pending:
+                    return
+                instrument, (target, units, submitted) = self._pending.popitem(last=False)
+                self._busy = True
+            self._queue_latency.record(time.perf_counter_ns() - submitted)
+            try:
+                self._execute(instrument, target, units)
+            finally:
+                with self._wakeup:
+                    self._busy = False
+                    self._wakeup.notify_all()
+
+    def _execute(self, instrument, target, units):
+        current = self.positions.get(instrument, 0)
+        if target == current:
+            return
+        start = time.perf_counter_ns()
+        try:
+            order = self.broker.create_order(instrument, (target - current) * units, suppress=True, ret=True)
+        except Exception as e:
+            self._errors.inc()
+            if self.on_error is not None:
+                self.on_error(instrument, e, current)
+            return
+        self._round_trip.record(time.perf_counter_ns() - start)
+        self._orders.inc()
+        self.positions[instrument] = target
+        if self.on_fill is not None:
+            self.on_fill(instrument, order, GOING[target])
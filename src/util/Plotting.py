@@ -0,0 +1,14 @@
+_pyplot = None
+
+
+def pyplot():
+    """Returns matplotlib.pyplot, importing it and applying the project's plot style on first
+    use. Modules that only plot on request call this instead of importing matplotlib at the
+    top, so traders and backtests that never plot do not pay for the import."""
+    global _pyplot
+    if _pyplot is None:
+        import matplotlib.pyplot as plt
+
+        plt.style.use("seaborn-v0_8")
+        _pyplot = plt
+    return _pyplot
@@ -0,0 +1,238 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class PriceCache:
+    """Persistent cache of price data keyed by (ticker, granularity, source).
+
+    Every entry is stored as one .npy file per column plus the int64 index, so loading it is a
+    handful of binary reads instead of a CSV parse or a download. Recently used entries are
+    also kept in an in-process LRU.
+    """
+
+    _default = None
+
+    def __init__(self, directory: str = None, max_entries: int = 16):
+        """
+        Parameters
+        ----------
+        directory: str
+            where entries are stored (defaults to $PRICE_CACHE_DIR or ~/.cache/automated-trading)
+        max_entries: int
+            number of entries kept in memory before the least recently used one is evicted
+        """
+        if directory is None:
+            directory = os.environ.get(
+                "PRICE_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "automated-trading")
+            )
+        self.directory = directory
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+
+    @classmethod
+    def default(cls):
+        """Returns the cache shared by all Instruments in this process."""
+        if cls._default is None:
+            cls._default = cls()
+        return cls._default
+
+    def __repr__(self):
+        return "PriceCache(directory={}, entries in memory={})".format(self.directory, len(self._memory))
+
+    # PUBLIC API
+
+    def load(self, key: tuple, fetch, start=None, end=None, mmap=False):
+        """Returns the data for key between start (inclusive) and end (exclusive).
+
+        Only the parts of [start, end) that are not cached yet are requested with
+        fetch(start, end), so extending the end date of a backtest only downloads the missing tail.
+        With mmap=True the result is a read-only view of memory-mapped columns instead of a copy.
+        """
+        start = None if start is None else pd.Timestamp(start)
+        end = None if end is None else pd.Timestamp(end)
+        entry = self._get(key, mmap)
+        if entry is None:
+            data = fetch(start, end)
+            meta = {"start": start, "end": end}
+        else:
+            data, meta = entry
+            pieces = [data]
+            if meta["start"] is not None and (start is None or start < meta["start"]):
+                pieces.insert(0, fetch(start, meta["start"]))
+                meta = dict(meta, start=start)
+            if meta["end"] is not None and (end is None or end > meta["end"]):
+                pieces.append(fetch(meta["end"], end))
+                meta = dict(meta, end=end)
+            if len(pieces) == 1:
+                return self._slice(data, start, end, copy=not mmap)
+            data = pd.concat([p for p in pieces if len(p)])
+            data = data[~data.index.duplicated(keep="last")].sort_index()
+        data = self._put(key, data, meta, mmap)
+        return self._slice(data, start, end, copy=not mmap)
+
+    def load_recent(self, key: tuple, fetch, start, end, page=None, workers: int = 1):
+        """Returns the data for key between start (inclusive) and end (exclusive) of a window
+        that moves forward, e.g. the warm-up history of a live trader.
+
+        Only the gap since the last stored row is requested with fetch(start, end) (the last
+        row is requested again, it may have been incomplete) and the rows before start are
+        dropped from the entry, so the stored window does not grow. With page, a longer gap is
+        requested in pages of that length, workers of them at a time.
+        """
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        entry = self._get(key)
+        data = None if entry is None else self._slice(entry[0], start, None, copy=False)
+        gap = start
+        if data is not None and len(data):
+            gap = data.index[-1]
+            if gap.tz is not None and start.tz is None:
+                gap = gap.tz_convert("UTC").tz_localize(None)
+        if gap >= end:
+            return self._slice(data, start, end)
+        bounds = [gap]
+        if page is not None:
+            page = pd.to_timedelta(page)
+            while bounds[-1] + page < end:
+                bounds.append(bounds[-1] + page)
+        bounds.append(end)
+        ranges = list(zip(bounds[:-1], bounds[1:]))
+        if workers > 1 and len(ranges) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                fetched = list(pool.map(lambda r: fetch(*r), ranges))
+        else:
+            fetched = [fetch(*r) for r in ranges]
+        pieces = [p for p in [data] + fetched if p is not None and len(p)]
+        if not pieces:  # nothing stored or traded in the window
+            return fetched[-1]
+        data = pd.concat(pieces)
+        data = data[~data.index.duplicated(keep="last")].sort_index()
+        data = self._put(key, data, {"start": start, "end": end})
+        return self._slice(data, start, end)
+
+    def load_file(self, key: tuple, path: str, parse, mmap=False):
+        """Returns parse(path), reusing the cached result for as long as the file is unchanged.
+        With mmap=True the result is a read-only view of memory-mapped columns instead of a copy."""
+        stat = os.stat(path)
+        version = [stat.st_mtime_ns, stat.st_size]
+        entry = self._get(key, mmap)
+        if entry is None or entry[1].get("version") != version:
+            entry = (self._put(key, parse(path), {"version": version}, mmap), None)
+        return entry[0] if mmap else entry[0].copy()
+
+    def clear(self, key: tuple = None):
+        """Removes one entry (or every entry) from memory and disk."""
+        if key is None:
+            self._memory.clear()
+            shutil.rmtree(self.directory, ignore_errors=True)
+        else:
+            self._memory.pop((key, False), None)
+            self._memory.pop((key, True), None)
+            shutil.rmtree(self._path(key), ignore_errors=True)
+
+    # STORAGE
+
+    def _path(self, key):
+        name = "-".join(str(k) for k in key[:2])
+        name = "".join(c if c.isalnum() or c in "-_." else "_" for c in name)
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()[:12]
+        return os.path.join(self.directory, "{}-{}".format(name, digest))
+
+    def _get(self, key, mmap=False):
+        if (key, mmap) in self._memory:
+            self._memory.move_to_end((key, mmap))
+            return self._memory[(key, mmap)]
+        path = self._path(key)
+        try:
+            with open(os.path.join(path, "meta.json")) as f:
+                meta = json.load(f)
+            data = self._read(path, meta, mmap_mode="r" if mmap else None)
+        except (OSError, ValueError, KeyError):
+            return None
+        entry = (data, self._decode(meta["user"]))
+        self._remember((key, mmap), entry)
+        return entry
+
+    def _put(self, key, data, meta, mmap=False):
+        """Stores data on disk and returns it, memory-mapped from the stored files if mmap is set."""
+        self._memory.pop((key, not mmap), None)  # the other representation is now stale
+        self._write(key, data, meta)
+        if mmap:
+            self._memory.pop((key, True), None)
+            return self._get(key, mmap=True)[0]
+        self._remember((key, False), (data, meta))
+        return data
+
+    def _write(self, key, data, meta):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=self.directory)
+        index = data.index
+        tz = str(index.tz) if getattr(index, "tz", None) is not None else None
+        if tz is not None:
+            index = index.tz_convert("UTC").tz_localize(None)
+        np.save(os.path.join(tmp, "index.npy"), np.asarray(index.asi8, dtype="int64"))
+        for i, col in enumerate(data.columns):
+            np.save(os.path.join(tmp, "{}.npy".format(i)), data[col].to_numpy())
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump(
+                {
+                    "columns": list(data.columns),
+                    "index_name": data.index.name,
+                    "tz": tz,
+                    "user": self._encode(meta),
+                },
+                f,
+            )
+        path = self._path(key)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _read(path, meta, mmap_mode=None):
+        index = pd.DatetimeIndex(np.load(os.path.join(path, "index.npy")).view("datetime64[ns]"))
+        if meta["tz"] is not None:
+            index = index.tz_localize("UTC").tz_convert(meta["tz"])
+        index.name = meta["index_name"]
+        columns = {
+            col: np.load(os.path.join(path, "{}.npy".format(i)), mmap_mode=mmap_mode)
+            for i, col in enumerate(meta["columns"])
+        }
+        return pd.DataFrame(columns, index=index, copy=False)
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    @staticmethod
+    def _encode(meta):
+        return {k: str(v) if isinstance(v, pd.Timestamp) else v for k, v in meta.items()}
+
+    @staticmethod
+    def _decode(meta):
+        return {k: pd.Timestamp(v) if k in ("start", "end") and v is not None else v for k, v in meta.items()}
+
+    @staticmethod
+    def _slice(data, start, end, copy=True):
+        index = data.index
+        i = 0 if start is None else index.searchsorted(PriceCache._like(start, index), side="left")
+        j = len(index) if end is None else index.searchsorted(PriceCache._like(end, index), side="left")
+        data = data.iloc[i:j]
+        return data.copy() if copy else data
+
+    @staticmethod
+    def _like(ts, index):
+        """Makes a timestamp comparable with the (possibly tz-aware) index."""
+        tz = getattr(index, "tz", None)
+        if tz is not None and ts.tz is None:
+            return ts.tz_localize(tz)
+        if tz is None and ts.tz is not None:
+            return ts.tz_convert("UTC").tz_localize(None)
+        return ts
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+from multiprocessing import shared_memory
+
+
+class SharedFrame:
+    """Numeric DataFrame stored in a shared memory block.
+
+    Worker processes attach to the block by name and get a DataFrame view of the same memory,
+    so the price data is loaded once and never pickled or copied per task.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        values = np.ascontiguousarray(df.to_numpy(dtype="float64"))
+        index = df.index
+        tz = None
+        if isinstance(index, pd.DatetimeIndex):
+            tz = None if index.tz is None else str(index.tz)
+            index = index.tz_convert("UTC").tz_localize(None) if tz is not None else index
+        index = np.asarray(index.asi8 if isinstance(index, pd.DatetimeIndex) else index, dtype="int64")
+
+        size = max(index.nbytes + values.nbytes, 1)
+        self._shm = shared_memory.SharedMemory(create=True, size=size)
+        self.meta = {
+            "name": self._shm.name,
+            "rows": len(df),
+            "columns": list(df.columns),
+            "datetime": isinstance(df.index, pd.DatetimeIndex),
+            "tz": tz,
+        }
+        shared_index, shared_values = self._views(self._shm.buf, self.meta)
+        shared_index[:] = index
+        shared_values[:] = values
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @staticmethod
+    def _views(buf, meta):
+        rows, cols = meta["rows"], len(meta["columns"])
+        index = np.ndarray((rows,), dtype="int64", buffer=buf)
+        values = np.ndarray((rows, cols), dtype="float64", buffer=buf, offset=index.nbytes)
+        return index, values
+
+    @staticmethod
+    def attach(meta):
+        """Attaches to the shared block described by meta (from the creating process).
+
+        Returns the SharedMemory handle, which must be kept alive while the frame is used, and a
+        DataFrame whose values are a view of the shared block.
+        """
+        shm = shared_memory.SharedMemory(name=meta["name"])
+        index, values = SharedFrame._views(shm.buf, meta)
+        if meta["datetime"]:
+            index = pd.to_datetime(index)
+            if meta["tz"] is not None:
+                index = index.tz_localize("UTC").tz_convert(meta["tz"])
+        df = pd.DataFrame(values, index=index, columns=meta["columns"], copy=False)
+        return shm, df
+
+    def close(self):
+        """Releases and removes the shared block. Call once all workers are done."""
+        self._shm.close()
+        self._shm.unlink()
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+
+
+class TickBuffer:
+    """Preallocated ring buffer of tick timestamps and mid prices.
+
+    Appending writes into fixed NumPy arrays, so the cost per tick is constant and no garbage is
+    produced. Once the buffer is full the oldest ticks are overwritten.
+    """
+
+    def __init__(self, capacity=100_000):
+        """
+        Parameters
+        ----------
+        capacity: int
+            number of most recent ticks to keep
+        """
+        self.capacity = capacity
+        self._times = np.empty(capacity, dtype="int64")  # nanoseconds since epoch (UTC)
+        self._prices = np.empty(capacity, dtype="float64")
+        self._count = 0  # total number of ticks appended since the last clear
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    def __repr__(self):
+        return "TickBuffer(capacity={}, ticks={})".format(self.capacity, len(self))
+
+    def append(self, time: int, price: float):
+        """Appends a tick. time is the tick timestamp in nanoseconds since epoch."""
+        i = self._count % self.capacity
+        self._times[i] = time
+        self._prices[i] = price
+        self._count += 1
+
+    def clear(self):
+        self._count = 0
+
+    def last(self):
+        """Returns the (time, price) of the most recent tick."""
+        if self._count == 0:
+            return None
+        i = (self._count - 1) % self.capacity
+        return self._times[i], self._prices[i]
+
+    def arrays(self):
+        """Returns copies of the times and prices in the buffer, oldest first."""
+        if self._count <= self.capacity:
+            return self._times[: self._count].copy(), self._prices[: self._count].copy()
+        i = self._count % self.capacity
+        return (
+            np.concatenate([self._times[i:], self._times[:i]]),
+            np.concatenate([self._prices[i:], self._prices[:i]]),
+        )
+
+    def since(self, start: int):
+        """Returns copies of the times and prices of the ticks after start (nanoseconds since
+        epoch), oldest first. Only the ticks after start are read, as the ticks arrive in time
+        order."""
+        n = len(self)
+        end = self._count % self.capacity if self._count > self.capacity else n
+        k = 0  # number of ticks after start, counted back from the most recent one
+        while k < n and self._times[(end - k - 1) % self.capacity] > start:
+            k += 1
+        index = np.arange(end - k, end) % self.capacity
+        return self._times[index], self._prices[index]
+
+    def to_frame(self, column: str, start=None):
+        """Returns the buffered ticks as a DataFrame with a single price column.
+
+        Parameters
+        ----------
+        column: str
+            name of the price column
+        start: datetime-like
+            if given, only ticks after start are returned
+        """
+        times, prices = self.arrays()
+        if start is not None:
+            mask = times > pd.Timestamp(start).value
+            times, prices = times[mask], prices[mask]
+        return pd.DataFrame({column: prices}, index=pd.to_datetime(times))